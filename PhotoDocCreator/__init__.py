@@ -0,0 +1,4 @@
+"""
+PhotoDoc Creator
+Программа для создания фототаблиц к протоколам осмотра
+"""
@@ -0,0 +1,195 @@
+"""
+Сборка фототаблицы из командной строки, без графического интерфейса:
+    
+    python -m PhotoDocCreator build --config job.json
+    python -m PhotoDocCreator batch --root дела/ --report report.json
+    python -m PhotoDocCreator serve --port 8765
+    python -m PhotoDocCreator submit --server http://сервер:8765 --config job.json
+
+job.json - файл в формате config.json. Ход сборки выводится в stdout
+построчно в формате JSON, при ошибке код возврата отличен от нуля.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+# Добавляем пути к модулям, как в main.py
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, current_dir)
+sys.path.insert(0, os.path.join(current_dir, 'core'))
+sys.path.insert(0, os.path.join(current_dir, 'utils'))
+
+logger = logging.getLogger(__name__)
+
+
+def emit(event, **fields):
+    """Выводит одно событие сборки строкой JSON"""
+    fields['event'] = event
+    print(json.dumps(fields, ensure_ascii=False), flush=True)
+
+
+def build(args):
+    """Собирает документ по заданию, возвращает код завершения"""
+    from core.job import load_job, run_job
+    
+    started = time.perf_counter()
+    
+    def log_callback(message):
+        emit('log', message=message, elapsed=round(time.perf_counter() - started, 3))
+    
+    def progress_callback(done, total, bytes_read):
+        emit('progress', done=done, total=total, bytes=bytes_read)
+    
+    try:
+        config = load_job(args.config)
+    except Exception as e:
+        emit('error', message=f"Не удалось загрузить задание {args.config}: {e}")
+        return 1
+    
+    if args.output:
+        config['word_file'] = args.output
+    if args.workers is not None:
+        config['preprocess_workers'] = args.workers
+    
+    emit('start', config=args.config, output=config.get('word_file', ''))
+    try:
+        success, result, count = run_job(config, log_callback, progress_callback=progress_callback)
+    except Exception as e:
+        logger.error(f"Ошибка сборки: {e}", exc_info=True)
+        success, result, count = False, str(e), 0
+    
+    seconds = round(time.perf_counter() - started, 3)
+    if success:
+        emit('done', success=True, output=result, photos=count, seconds=seconds)
+        return 0
+    
+    emit('done', success=False, error=result, photos=count, seconds=seconds)
+    return 1
+
+
+def batch(args):
+    """Собирает пакет документов, возвращает код завершения"""
+    from core.batch import load_batch_manifest, discover_case_jobs, run_batch, write_batch_report
+    
+    def log_callback(message):
+        emit('log', message=message)
+    
+    try:
+        if args.manifest:
+            jobs = load_batch_manifest(args.manifest)
+        else:
+            defaults = {}
+            if args.config:
+                with open(args.config, "r", encoding="utf-8") as f:
+                    defaults = json.load(f)
+            jobs = discover_case_jobs(args.root, args.output_dir, defaults)
+    except Exception as e:
+        emit('error', message=f"Не удалось составить список заданий: {e}")
+        return 1
+    
+    if not jobs:
+        emit('error', message="Нет заданий для сборки")
+        return 1
+    
+    report = run_batch(jobs, args.workers or 0, args.jobs or 0, log_callback)
+    if args.report:
+        write_batch_report(report, args.report)
+    
+    emit('done', success=not report['failed'], succeeded=report['succeeded'], failed=report['failed'],
+         photos=report['photos'], size=report['size'], seconds=report['seconds'], report=args.report)
+    return 1 if report['failed'] else 0
+
+
+def serve(args):
+    """Запускает сервер сборки"""
+    from core.job_server import serve as serve_jobs
+    
+    serve_jobs(args.host, args.port, args.output_dir, args.jobs, args.workers or 0,
+               lambda message: emit('log', message=message))
+    return 0
+
+
+def submit(args):
+    """Отправляет задание на сервер сборки и скачивает документ, возвращает код завершения"""
+    from core.job_client import JobClient, JobClientError
+    
+    client = JobClient(args.server)
+    try:
+        with open(args.config, "r", encoding="utf-8") as f:
+            job = json.load(f)
+        
+        job_id = client.submit(job)
+        emit('submitted', id=job_id, server=args.server)
+        
+        def on_progress(state):
+            emit('progress', id=job_id, status=state['status'], processed=state['processed'],
+                 total=state['total'], progress=state['progress'])
+        
+        state = client.wait(job_id, progress_callback=on_progress)
+        if state['status'] != 'done':
+            emit('done', success=False, id=job_id, error=state['error'])
+            return 1
+        
+        output = client.download(job_id, args.output or job.get('word_file') or state['filename'])
+        emit('done', success=True, id=job_id, output=output, photos=state['photos'], seconds=state['seconds'])
+        return 0
+    except (OSError, ValueError, JobClientError) as e:
+        emit('error', message=str(e))
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m PhotoDocCreator", description="Сборка фототаблицы без интерфейса")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    build_parser = commands.add_parser('build', help="собрать документ по заданию")
+    build_parser.add_argument('--config', required=True, help="файл задания в формате config.json")
+    build_parser.add_argument('--output', help="файл документа (вместо word_file из задания)")
+    build_parser.add_argument('--workers', type=int, help="число процессов предобработки")
+    
+    batch_parser = commands.add_parser('batch', help="собрать пакет документов")
+    source = batch_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--manifest', help="манифест пакета: JSON со списком заданий")
+    source.add_argument('--root', help="папка, в которой каждая подпапка - отдельное дело")
+    batch_parser.add_argument('--config', help="общие настройки для дел из --root (формат config.json)")
+    batch_parser.add_argument('--output-dir', help="папка для документов дел из --root")
+    batch_parser.add_argument('--workers', type=int, help="общий бюджет процессов (по умолчанию - число ядер)")
+    batch_parser.add_argument('--jobs', type=int, help="число одновременно собираемых документов")
+    batch_parser.add_argument('--report', help="файл отчета в формате JSON")
+    
+    serve_parser = commands.add_parser('serve', help="запустить сервер сборки")
+    serve_parser.add_argument('--host', default='127.0.0.1', help="адрес (0.0.0.0 - принимать задания из сети; авторизации нет, только для доверенной сети)")
+    serve_parser.add_argument('--port', type=int, default=8765, help="порт")
+    serve_parser.add_argument('--output-dir', default='jobs', help="папка для документов заданий")
+    serve_parser.add_argument('--jobs', type=int, default=2, help="число одновременно собираемых документов")
+    serve_parser.add_argument('--workers', type=int, help="общий бюджет процессов (по умолчанию - число ядер)")
+    
+    submit_parser = commands.add_parser('submit', help="отправить задание на сервер сборки")
+    submit_parser.add_argument('--server', default='http://127.0.0.1:8765', help="адрес сервера сборки")
+    submit_parser.add_argument('--config', required=True, help="файл задания в формате config.json")
+    submit_parser.add_argument('--output', help="куда сохранить документ (по умолчанию word_file из задания)")
+    
+    args = parser.parse_args(argv)
+    
+    # Журнал идет в stderr, чтобы stdout оставался машиночитаемым
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    
+    if args.command == 'build':
+        return build(args)
+    if args.command == 'batch':
+        return batch(args)
+    if args.command == 'serve':
+        return serve(args)
+    if args.command == 'submit':
+        return submit(args)
+    return 2
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+PhotoDoc Creator - Benchmarks
+Замеры скорости и памяти сборки на синтетических наборах фотографий
+"""
+import os
+import sys
+
+# Модули приложения импортируются так же, как в main.py
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
@@ -0,0 +1,172 @@
+"""
+Синтетические наборы фотографий для замеров.
+
+Набор воспроизводим (задается зерном): смесь JPEG/PNG/BMP в режимах
+RGB/RGBA/P/CMYK/L, размеры от скриншотов до 48 Мп и несколько
+обрезанных файлов. Снимки телефона, как настоящие, содержат миниатюру
+160×120 в EXIF. Содержимое каждого файла уникально, чтобы поиск
+копий не искажал результаты. Сгенерированный набор сохраняется и
+используется повторно, пока не изменились его параметры.
+"""
+import io
+import os
+import json
+import struct
+import random
+import shutil
+from PIL import Image, ImageDraw
+
+CORPUS_VERSION = 2
+CORPUS_MANIFEST = 'corpus.json'
+
+# (вид, доля, формат, режим, ширина, высота)
+PHOTO_KINDS = (
+    ('screenshot', 0.15, 'PNG', 'RGBA', 1920, 1080),
+    ('palette', 0.05, 'PNG', 'P', 1280, 720),
+    ('small', 0.12, 'JPEG', 'RGB', 800, 600),
+    ('phone', 0.45, 'JPEG', 'RGB', 4000, 3000),
+    ('gray', 0.04, 'JPEG', 'L', 3000, 2000),
+    ('cmyk', 0.05, 'JPEG', 'CMYK', 3000, 2000),
+    ('bitmap', 0.05, 'BMP', 'RGB', 1600, 1200),
+    ('huge', 0.02, 'JPEG', 'RGB', 8000, 6000),
+    ('truncated', 0.07, 'JPEG', 'RGB', 2000, 1500),
+)
+
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'BMP': '.bmp'}
+
+# Виды фото с миниатюрой в EXIF и ее размер
+EXIF_THUMBNAIL_KINDS = ('phone',)
+EXIF_THUMBNAIL_SIZE = (160, 120)
+
+
+def choose_kinds(count, seed):
+    """Выбирает вид каждого фото набора"""
+    rng = random.Random(seed)
+    weights = [kind[1] for kind in PHOTO_KINDS]
+    return [rng.choices(PHOTO_KINDS, weights)[0] for _ in range(count)]
+
+
+def render_photo(kind, index, scale, seed):
+    """Рисует уникальное изображение: градиент и случайные фигуры"""
+    name, mode, width, height = kind[0], kind[3], kind[4], kind[5]
+    width = max(16, int(width * scale))
+    height = max(16, int(height * scale))
+    rng = random.Random(seed * 1000003 + index)
+    
+    # Небольшой градиент растягивается до нужного размера - это быстро
+    base = Image.linear_gradient('L').resize((width, height))
+    img = Image.merge('RGB', (base, base.rotate(90).resize((width, height)), Image.new('L', (width, height), rng.randrange(256))))
+    
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = x0 + rng.randrange(1, width // 3 + 2), y0 + rng.randrange(1, height // 3 + 2)
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        if rng.random() < 0.5:
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        else:
+            draw.ellipse((x0, y0, x1, y1), outline=color, width=max(1, width // 200))
+    draw.text((10, 10), f"{name} #{index}", fill=(255, 255, 255))
+    
+    if mode == 'RGBA':
+        img = img.convert('RGBA')
+        img.putalpha(200)
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE, colors=64)
+    elif mode != 'RGB':
+        img = img.convert(mode)
+    return img
+
+
+def make_exif_with_thumbnail(img):
+    """
+    EXIF с одним тегом ориентации в IFD0 и миниатюрой JPEG в IFD1,
+    как у снимков с камеры
+    """
+    buffer = io.BytesIO()
+    img.convert('RGB').resize(EXIF_THUMBNAIL_SIZE).save(buffer, 'JPEG', quality=80)
+    thumbnail = buffer.getvalue()
+    
+    # Заголовок TIFF (8 байт), IFD0 с 1 тегом (18 байт), IFD1 с 2 тегами (30 байт), миниатюра
+    ifd0 = struct.pack('<H', 1) + struct.pack('<HHLHH', 0x0112, 3, 1, 1, 0) + struct.pack('<L', 26)
+    ifd1 = (struct.pack('<H', 2)
+            + struct.pack('<HHLL', 0x0201, 4, 1, 56)
+            + struct.pack('<HHLL', 0x0202, 4, 1, len(thumbnail))
+            + struct.pack('<L', 0))
+    return b'Exif\x00\x00' + b'II*\x00' + struct.pack('<L', 8) + ifd0 + ifd1 + thumbnail
+
+
+def write_photo(kind, index, path, scale, seed):
+    """Сохраняет фото набора, обрезанные файлы сохраняются наполовину"""
+    image_format = kind[2]
+    img = render_photo(kind, index, scale, seed)
+    if image_format == 'JPEG' and kind[0] in EXIF_THUMBNAIL_KINDS:
+        img.save(path, image_format, quality=90, exif=make_exif_with_thumbnail(img))
+    elif image_format == 'JPEG':
+        img.save(path, image_format, quality=90)
+    else:
+        img.save(path, image_format)
+    
+    if kind[0] == 'truncated':
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+    return os.path.getsize(path)
+
+
+def generate_corpus(corpus_dir, count, scale=1.0, seed=1, log_callback=None):
+    """
+    Создает (или берет готовый) набор из count фото в corpus_dir.
+    Возвращает описание набора: файлы, виды и общий размер.
+    """
+    settings = {'version': CORPUS_VERSION, 'count': count, 'scale': scale, 'seed': seed}
+    manifest_path = os.path.join(corpus_dir, CORPUS_MANIFEST)
+    
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            corpus = json.load(f)
+        if corpus.get('settings') == settings:
+            return corpus
+        shutil.rmtree(corpus_dir)
+    
+    os.makedirs(corpus_dir, exist_ok=True)
+    files = []
+    kinds = {}
+    total_bytes = 0
+    
+    for index, kind in enumerate(choose_kinds(count, seed), 1):
+        # Номера без ведущих нулей проверяют естественную сортировку
+        filename = f"IMG_{index}{EXTENSIONS[kind[2]]}"
+        total_bytes += write_photo(kind, index, os.path.join(corpus_dir, filename), scale, seed)
+        files.append(filename)
+        kinds[kind[0]] = kinds.get(kind[0], 0) + 1
+        
+        if log_callback and index % 100 == 0:
+            log_callback(f"🖼 Создано фото: {index} из {count}")
+    
+    corpus = {'settings': settings, 'files': files, 'kinds': kinds, 'bytes': total_bytes}
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f, ensure_ascii=False)
+    return corpus
+
+
+def make_subset(corpus, corpus_dir, subset_dir, count):
+    """
+    Папка с первыми count фото набора (жесткие ссылки, если возможно).
+    Возвращает описание подмножества.
+    """
+    files = corpus['files'][:count]
+    if os.path.exists(subset_dir):
+        shutil.rmtree(subset_dir)
+    os.makedirs(subset_dir)
+    
+    total_bytes = 0
+    for filename in files:
+        source = os.path.join(corpus_dir, filename)
+        target = os.path.join(subset_dir, filename)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        total_bytes += os.path.getsize(target)
+    
+    return {'files': files, 'bytes': total_bytes}
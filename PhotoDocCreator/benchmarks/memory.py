@@ -0,0 +1,314 @@
+"""
+Замер памяти сборки на синтетических наборах фотографий.
+
+    python -m PhotoDocCreator.benchmarks.memory --sizes 10 100 1000 --budget-kb 600
+
+Каждый размер набора собирается в отдельном процессе, чтобы пиковый
+RSS не зависел от предыдущих сборок. Для каждого этапа записываются
+пик tracemalloc, RSS после этапа и строки кода, выделившие больше всего
+памяти на пике этапа. По всем размерам считается наклон - сколько байт
+добавляет каждое фото. Если наклон пикового RSS больше бюджета на фото,
+код возврата 1.
+"""
+import os
+import gc
+import sys
+import json
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+from contextlib import contextmanager
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from .corpus import generate_corpus, make_subset
+from .throughput import THUMB_SIZE, get_environment
+
+from core.doc_creator import DocumentCreator
+from core.thumbnail_cache import make_thumbnail
+
+# Этапы замера: миниатюры сортировщика и этапы DocumentCreator.stage_times
+# (preprocess - чтение и преобразование фото, insert - сборка документа)
+MEMORY_STAGES = ('sorter', 'setup', 'preprocess', 'insert', 'footer', 'save')
+
+# Повторный снимок tracemalloc делается, когда память этапа выросла на эту долю
+SNAPSHOT_GROWTH = 0.1
+
+TOP_ALLOCATORS = 5
+
+
+def get_rss():
+    """Текущий RSS процесса в байтах (None, если не удалось определить)"""
+    if sys.platform == 'win32':
+        counters = _get_windows_memory_counters()
+        return counters.WorkingSetSize if counters else None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def get_peak_rss():
+    """Пиковый RSS процесса в байтах (None, если не удалось определить)"""
+    if sys.platform == 'win32':
+        counters = _get_windows_memory_counters()
+        return counters.PeakWorkingSetSize if counters else None
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # В Linux значение в килобайтах, в macOS - в байтах
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _get_windows_memory_counters():
+    """Счетчики памяти процесса Windows (GetProcessMemoryInfo)"""
+    import ctypes
+    from ctypes import wintypes
+    
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+    
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    kernel32 = ctypes.WinDLL('kernel32')
+    kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    try:
+        get_info = kernel32.K32GetProcessMemoryInfo
+    except AttributeError:
+        get_info = ctypes.WinDLL('psapi').GetProcessMemoryInfo
+    get_info.argtypes = [wintypes.HANDLE, ctypes.POINTER(PROCESS_MEMORY_COUNTERS), wintypes.DWORD]
+    if not get_info(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters
+
+
+class StageMemory:
+    """Память одного этапа: пик tracemalloc, RSS и главные места выделения"""
+    
+    def __init__(self):
+        self.traced_peak = 0
+        self.rss_after = 0
+        self.snapshot = None
+        self.snapshot_size = 0
+    
+    @contextmanager
+    def measure(self):
+        """Замеряет одно выполнение этапа (этап может выполняться много раз)"""
+        tracemalloc.reset_peak()
+        yield
+        current, peak = tracemalloc.get_traced_memory()
+        self.traced_peak = max(self.traced_peak, peak)
+        self.rss_after = max(self.rss_after, get_rss() or 0)
+        
+        # Снимок на максимуме этапа; повторяется только при заметном росте
+        if current > self.snapshot_size * (1 + SNAPSHOT_GROWTH):
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_size = current
+    
+    def get_top_allocators(self, limit=TOP_ALLOCATORS):
+        """Строки кода, которые держали больше всего памяти на пике этапа"""
+        if self.snapshot is None:
+            return []
+        snapshot = self.snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+        ))
+        return [{
+            'where': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            'bytes': stat.size,
+            'count': stat.count
+        } for stat in snapshot.statistics('lineno')[:limit]]
+    
+    def to_dict(self):
+        return {
+            'traced_peak': self.traced_peak,
+            'rss_after': self.rss_after,
+            'top_allocators': self.get_top_allocators()
+        }
+
+
+class MemoryProfiledCreator(DocumentCreator):
+    """DocumentCreator, который замеряет память каждого этапа сборки"""
+    
+    def __init__(self, config, stages):
+        super().__init__(config)
+        self.memory_stages = stages
+    
+    @contextmanager
+    def _stage(self, name):
+        with self.memory_stages[name].measure():
+            with super()._stage(name):
+                yield
+
+
+def load_sorter_thumbnails(folder, files):
+    """
+    Миниатюры с теми же данными, что хранит VisualImageSorter: сведения об
+    изображении и миниатюра (вместо ImageTk.PhotoImage - изображение Pillow)
+    """
+    thumbnails = []
+    for img_file in files:
+        try:
+            img_path = os.path.join(folder, img_file)
+            img, (image_size, image_mode, image_format) = make_thumbnail(img_path, THUMB_SIZE)
+            thumbnails.append({'filename': img_file, 'path': img_path, 'thumbnail': img,
+                               'image_size': image_size, 'image_mode': image_mode, 'image_format': image_format})
+        except Exception:
+            pass
+    return thumbnails
+
+
+def measure_build(folder, files, output_file, settings):
+    """
+    Собирает документ и возвращает замеры памяти.
+    Выполняется в отдельном процессе.
+    """
+    stages = {name: StageMemory() for name in MEMORY_STAGES}
+    
+    gc.collect()
+    baseline_rss = get_rss() or 0
+    tracemalloc.start()
+    
+    # Миниатюры держатся до конца этапа, как в окне сортировщика
+    with stages['sorter'].measure():
+        thumbnails = load_sorter_thumbnails(folder, files)
+    del thumbnails
+    gc.collect()
+    
+    image_data_list = [{
+        'path': os.path.join(folder, img_file),
+        'filename': img_file,
+        'global_number': i,
+        'folder_rules': [],
+        'folder_start_number': 1
+    } for i, img_file in enumerate(files, 1)]
+    
+    config = {'word_file': output_file}
+    config.update(settings)
+    creator = MemoryProfiledCreator(config, stages)
+    success, result, count = creator.create_document(image_data_list)
+    tracemalloc.stop()
+    
+    return {
+        'success': success,
+        'error': None if success else result,
+        'added': count,
+        'baseline_rss': baseline_rss,
+        'peak_rss': get_peak_rss(),
+        'stages': {name: stage.to_dict() for name, stage in stages.items()}
+    }
+
+
+def get_slope(points):
+    """Наклон прямой наименьших квадратов по точкам (x, y)"""
+    points = [(x, y) for x, y in points if y is not None]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def get_slopes(results):
+    """Байт на фото: пиковый RSS и пик tracemalloc каждого этапа"""
+    slopes = {'peak_rss': get_slope([(r['photos'], r['peak_rss']) for r in results])}
+    for name in MEMORY_STAGES:
+        slopes[name] = get_slope([(r['photos'], r['stages'][name]['traced_peak']) for r in results])
+    return slopes
+
+
+def run(sizes, work_dir, settings, scale=1.0, seed=1, log_callback=print):
+    """Замеряет память для всех размеров набора, каждый в новом процессе"""
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    corpus = generate_corpus(corpus_dir, max(sizes), scale, seed, log_callback)
+    context = multiprocessing.get_context('spawn')
+    
+    results = []
+    for size in sorted(sizes):
+        subset_dir = os.path.join(work_dir, f'photos_{size}')
+        subset = make_subset(corpus, corpus_dir, subset_dir, size)
+        output_file = os.path.join(work_dir, f'output_{size}.docx')
+        
+        with context.Pool(1) as pool:
+            result = pool.apply(measure_build, (subset_dir, subset['files'], output_file, settings))
+        result['photos'] = size
+        result['corpus_bytes'] = subset['bytes']
+        results.append(result)
+        
+        stages = ", ".join(f"{name} {result['stages'][name]['traced_peak'] / 1048576:.1f}" for name in MEMORY_STAGES)
+        peak_rss = result['peak_rss'] or 0
+        log_callback(f"🧠 {size} фото: пиковый RSS {peak_rss / 1048576:.1f} МБ; пик по этапам, МБ: {stages}")
+        if not result['success']:
+            log_callback(f"❌ Сборка не удалась: {result['error']}")
+    
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер памяти сборки на синтетических наборах фотографий")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000], help="размеры наборов")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'photodoc_bench'),
+                        help="папка для наборов и документов (набор создается один раз)")
+    parser.add_argument('--scale', type=float, default=1.0, help="масштаб размеров фото (для быстрых прогонов)")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора набора")
+    parser.add_argument('--dpi', type=int, default=220, help="target_dpi")
+    parser.add_argument('--writer', default='docx', choices=('docx', 'stream'), help="writer_backend")
+    parser.add_argument('--budget-kb', type=float, default=0,
+                        help="бюджет пикового RSS на одно фото, КБ (0 - не проверять)")
+    parser.add_argument('--output', default='memory_results.json', help="файл результатов JSON")
+    args = parser.parse_args(argv)
+    
+    # Предобработка в том же процессе, иначе память пула не попадет в замер
+    settings = {
+        'preprocess_workers': 1,
+        'target_dpi': args.dpi,
+        'writer_backend': args.writer,
+        'enable_footer': True
+    }
+    results = run(args.sizes, args.work_dir, settings, args.scale, args.seed)
+    slopes = get_slopes(results)
+    
+    report = {
+        'benchmark': 'memory',
+        'environment': get_environment(),
+        'settings': dict(settings, scale=args.scale, seed=args.seed, budget_kb=args.budget_kb),
+        'slopes': slopes,
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {args.output}")
+    
+    if slopes['peak_rss'] is None:
+        print("ℹ️ Наклон не посчитан: нужно хотя бы два размера набора")
+        return 0
+    
+    per_photo = ", ".join(f"{name} {slope / 1024:.1f}" for name, slope in slopes.items() if slope is not None)
+    print(f"📈 Байт на фото, КБ: {per_photo}")
+    
+    if args.budget_kb and slopes['peak_rss'] > args.budget_kb * 1024:
+        print(f"❌ Пиковый RSS растет на {slopes['peak_rss'] / 1024:.1f} КБ на фото, бюджет {args.budget_kb:g} КБ")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
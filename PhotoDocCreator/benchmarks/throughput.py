@@ -0,0 +1,240 @@
+"""
+Замер скорости сборки на синтетических наборах фотографий.
+
+    python -m PhotoDocCreator.benchmarks.throughput --sizes 10 100 1000 5000 --output results.json
+
+Для каждого размера набора измеряется:
+  - список файлов папки (get_image_files) и естественная сортировка;
+  - миниатюры: быстрый путь сортировщиков (EXIF, draft) и полное декодирование;
+  - кэш миниатюр: заполнение и повторное открытие папки;
+  - DocumentCreator.create_document целиком и по этапам (stage_times).
+
+Результаты сохраняются в JSON; с --compare выводится сравнение с
+предыдущим запуском.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import shutil
+import tempfile
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from .corpus import generate_corpus, make_subset
+
+import PIL
+import docx
+from PIL import Image
+from core.doc_creator import DocumentCreator
+from core.build_metrics import STAGES
+from core.thumbnail_cache import ThumbnailAtlas, load_thumbnail, make_thumbnail, ATLAS_FILE
+from utils.file_utils import natural_sort_key, get_image_files
+
+DEFAULT_SIZES = (10, 100, 1000, 5000)
+
+# Размер миниатюр сортировщика
+THUMB_SIZE = (120, 90)
+
+
+def get_environment():
+    """Описание машины и версий для сравнения запусков"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pillow': PIL.__version__,
+        'python_docx': getattr(docx, '__version__', None),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+    }
+
+
+def bench_listing(folder, repeat):
+    """Список файлов папки и естественная сортировка, медиана из repeat запусков"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        image_files = get_image_files(folder)
+        image_files.sort(key=natural_sort_key)
+        timings.append(time.perf_counter() - started)
+    return {'seconds': statistics.median(timings), 'files': len(image_files)}
+
+
+def open_full_thumbnail(path):
+    """Миниатюра без быстрого пути: полное декодирование и уменьшение"""
+    with Image.open(path) as img:
+        img.load()
+        img.thumbnail(THUMB_SIZE, Image.Resampling.LANCZOS)
+
+
+def bench_thumbnails(folder, files):
+    """
+    Миниатюры, как в окне сортировки (make_thumbnail, без кэша и без
+    ImageTk.PhotoImage), и для сравнения - с полным декодированием фото
+    """
+    report = {}
+    for name, open_thumbnail in (('full_decode', open_full_thumbnail),
+                                 ('fast', lambda path: make_thumbnail(path, THUMB_SIZE))):
+        errors = 0
+        started = time.perf_counter()
+        for img_file in files:
+            try:
+                open_thumbnail(os.path.join(folder, img_file))
+            except Exception:
+                errors += 1
+        seconds = time.perf_counter() - started
+        report[name] = {'seconds': seconds, 'per_photo_ms': seconds / max(1, len(files)) * 1000, 'errors': errors}
+    
+    fast = report.pop('fast')
+    report.update(fast)
+    report['speedup'] = report['full_decode']['seconds'] / fast['seconds'] if fast['seconds'] else 0
+    return report
+
+
+def bench_thumbnail_cache(folder, files, cache_dir):
+    """
+    Миниатюры через кэш: первое открытие (кэш пуст, миниатюры создаются и
+    сохраняются) и повторное (миниатюры читаются из атласа).
+    """
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    report = {}
+    for name in ('cold', 'warm'):
+        started = time.perf_counter()
+        atlas = ThumbnailAtlas(cache_dir)
+        for img_file in files:
+            try:
+                load_thumbnail(os.path.join(folder, img_file), atlas)
+            except Exception:
+                pass
+        atlas.close()
+        seconds = time.perf_counter() - started
+        report[name] = {'seconds': seconds, 'per_photo_ms': seconds / max(1, len(files)) * 1000}
+    report['atlas_bytes'] = os.path.getsize(os.path.join(cache_dir, ATLAS_FILE))
+    return report
+
+
+def bench_document(folder, files, output_file, settings):
+    """Полная сборка документа по этапам"""
+    image_data_list = [{
+        'path': os.path.join(folder, img_file),
+        'filename': img_file,
+        'global_number': i,
+        'folder_rules': [],
+        'folder_start_number': 1
+    } for i, img_file in enumerate(files, 1)]
+    
+    config = {'word_file': output_file}
+    config.update(settings)
+    
+    gc.collect()
+    creator = DocumentCreator(config)
+    started = time.perf_counter()
+    success, result, count = creator.create_document(image_data_list)
+    seconds = time.perf_counter() - started
+    
+    report = {
+        'success': success,
+        'seconds': seconds,
+        'photos_per_second': count / seconds if seconds else 0,
+        'added': count,
+        'output_bytes': os.path.getsize(output_file) if success else 0,
+        'stages': {stage: creator.stage_times[stage] for stage in STAGES}
+    }
+    if not success:
+        report['error'] = result
+    return report
+
+
+def run(sizes, work_dir, settings, scale=1.0, seed=1, repeat=3, log_callback=print):
+    """Выполняет замеры для всех размеров набора и возвращает результаты"""
+    corpus_dir = os.path.join(work_dir, 'corpus')
+    corpus = generate_corpus(corpus_dir, max(sizes), scale, seed, log_callback)
+    
+    results = []
+    for size in sorted(sizes):
+        subset_dir = os.path.join(work_dir, f'photos_{size}')
+        subset = make_subset(corpus, corpus_dir, subset_dir, size)
+        log_callback(f"⏱ Набор {size} фото ({subset['bytes'] / 1048576:.1f} МБ)")
+        
+        result = {
+            'photos': size,
+            'corpus_bytes': subset['bytes'],
+            'listing_sort': bench_listing(subset_dir, repeat),
+            'thumbnails': bench_thumbnails(subset_dir, subset['files']),
+            'thumbnail_cache': bench_thumbnail_cache(subset_dir, subset['files'], os.path.join(work_dir, f'cache_{size}')),
+            'document': bench_document(subset_dir, subset['files'], os.path.join(work_dir, f'output_{size}.docx'), settings)
+        }
+        results.append(result)
+        
+        document = result['document']
+        log_callback(f"   сортировка {result['listing_sort']['seconds'] * 1000:.1f} мс, "
+                     f"миниатюры {result['thumbnails']['seconds']:.2f} с "
+                     f"(×{result['thumbnails']['speedup']:.1f} к полному декодированию, из кэша {result['thumbnail_cache']['warm']['seconds']:.2f} с), "
+                     f"документ {document['seconds']:.2f} с ({document['photos_per_second']:.1f} фото/с)")
+    
+    return results
+
+
+def compare(current, previous_file, log_callback=print):
+    """Выводит отношение времени текущего запуска к предыдущему (<1 - быстрее)"""
+    with open(previous_file, 'r', encoding='utf-8') as f:
+        previous = {result['photos']: result for result in json.load(f)['results']}
+    
+    for result in current:
+        before = previous.get(result['photos'])
+        if not before:
+            continue
+        parts = []
+        for name, now, then in (
+            ('сортировка', result['listing_sort']['seconds'], before['listing_sort']['seconds']),
+            ('миниатюры', result['thumbnails']['seconds'], before['thumbnails']['seconds']),
+            ('документ', result['document']['seconds'], before['document']['seconds']),
+        ):
+            if then:
+                parts.append(f"{name} ×{now / then:.2f}")
+        log_callback(f"📊 {result['photos']} фото: " + ", ".join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер скорости сборки на синтетических наборах фотографий")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="размеры наборов")
+    parser.add_argument('--work-dir', default=os.path.join(tempfile.gettempdir(), 'photodoc_bench'),
+                        help="папка для наборов и документов (набор создается один раз)")
+    parser.add_argument('--scale', type=float, default=1.0, help="масштаб размеров фото (для быстрых прогонов)")
+    parser.add_argument('--seed', type=int, default=1, help="зерно генератора набора")
+    parser.add_argument('--repeat', type=int, default=3, help="повторы быстрых замеров")
+    parser.add_argument('--workers', type=int, default=0, help="preprocess_workers (0 - по числу ядер)")
+    parser.add_argument('--dpi', type=int, default=220, help="target_dpi")
+    parser.add_argument('--writer', default='docx', choices=('docx', 'stream'), help="writer_backend")
+    parser.add_argument('--output', default='benchmark_results.json', help="файл результатов JSON")
+    parser.add_argument('--compare', help="результаты предыдущего запуска для сравнения")
+    args = parser.parse_args(argv)
+    
+    settings = {
+        'preprocess_workers': args.workers,
+        'target_dpi': args.dpi,
+        'writer_backend': args.writer,
+        'enable_footer': True
+    }
+    results = run(args.sizes, args.work_dir, settings, args.scale, args.seed, args.repeat)
+    
+    report = {
+        'benchmark': 'throughput',
+        'environment': get_environment(),
+        'settings': dict(settings, scale=args.scale, seed=args.seed),
+        'results': results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты: {args.output}")
+    
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
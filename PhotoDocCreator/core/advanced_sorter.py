@@ -3,6 +3,15 @@ from tkinter import ttk
 from PIL import Image, ImageTk, ImageOps
 import os
 import tempfile
+from collections import OrderedDict
+
+from .thumbnail_grid import ThumbnailGrid
+from .sort_model import SortModel
+from .thumbnail_cache import get_thumbnail_atlas, load_thumbnail, make_thumbnail
+from .thumbnail_loader import ThumbnailLoader, get_priority_order
+
+# Сколько повернутых миниатюр держать в памяти
+ROTATED_CACHE_SIZE = 200
 
 class AdvancedImageSorter:
     def __init__(self, parent, folder_sequence):
@@ -12,6 +21,9 @@ class AdvancedImageSorter:
         self.thumbnails = []
         self.image_rotations = {}  # Храним повороты для каждого изображения
         self.current_order = []
+        self.selected_path = None  # Выбранное фото (позиция меняется при перетаскивании)
+        self.loader = None
+        self.rotated_thumbnails = OrderedDict()  # (путь, угол) -> PhotoImage, от давно использованных к недавним
         
     def sort_images(self):
         """Запускает расширенную визуальную сортировку"""
@@ -21,7 +33,7 @@ class AdvancedImageSorter:
         self.sort_window.geometry("1200x800")
         self.sort_window.state('zoomed')
         
-        # Загружаем все изображения из всех папок
+        # Список изображений всех папок (миниатюры загружаются в фоне после открытия окна)
         self.load_all_images()
         
         if not self.thumbnails:
@@ -31,14 +43,18 @@ class AdvancedImageSorter:
         
         # Создаем основной интерфейс
         self.setup_advanced_ui()
+        self.loader = ThumbnailLoader(self.sort_window, [img['path'] for img in self.thumbnails],
+                                      self.on_thumbnails_loaded)
+        self.loader.start()
         
         # Ждем закрытия окна
         self.parent.wait_window(self.sort_window)
+        self.loader.stop()
         
         return self.current_order
     
     def load_all_images(self):
-        """Загружает все изображения из всех папок"""
+        """Составляет список изображений всех папок (миниатюры пока не загружены)"""
         self.all_images = []
         global_counter = 1
         
@@ -51,29 +67,21 @@ class AdvancedImageSorter:
                           if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
             
             for img_file in image_files:
-                img_path = os.path.join(folder_path, img_file)
-                try:
-                    img = Image.open(img_path)
-                    # Создаем миниатюру
-                    thumb_size = (120, 90)
-                    img.thumbnail(thumb_size, Image.Resampling.LANCZOS)
-                    photo = ImageTk.PhotoImage(img)
-                    
-                    self.thumbnails.append({
-                        'global_number': global_counter,
-                        'filename': img_file,
-                        'path': img_path,
-                        'thumbnail': photo,
-                        'folder': os.path.basename(folder_path),
-                        'original_image': img,
-                        'rotation': 0  # начальный угол поворота
-                    })
-                    
-                    global_counter += 1
-                    
-                except Exception as e:
-                    print(f"Ошибка загрузки {img_file}: {e}")
-        
+                self.thumbnails.append({
+                    'global_number': global_counter,
+                    'filename': img_file,
+                    'path': os.path.join(folder_path, img_file),
+                    'thumbnail': None,
+                    'folder': os.path.basename(folder_path),
+                    'image_size': None,
+                    'image_mode': None,
+                    'image_format': None,
+                    'error': None,
+                    'rotation': 0  # начальный угол поворота
+                })
+                global_counter += 1
+        
+        self.thumbnails = SortModel(self.thumbnails)
         self.current_order = [img['filename'] for img in self.thumbnails]
     
     def setup_advanced_ui(self):
@@ -88,17 +96,12 @@ class AdvancedImageSorter:
         ttk.Label(left_frame, text="Перетащите миниатюры для изменения порядка\nКликните на изображение для управления", 
                  font=("Arial", 10, "bold"), justify=tk.CENTER).pack(pady=5)
         
-        # Canvas с прокруткой
-        self.canvas = tk.Canvas(left_frame, bg="white")
-        scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind("<Configure>", lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all")))
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Сетка миниатюр (рисуются только видимые строки)
+        self.grid = ThumbnailGrid(left_frame, self.get_cell, cell_size=(140, 140),
+                                  title_font=("Arial", 7, "bold"), name_font=("Arial", 7),
+                                  on_select=self.select_image, on_move=self.on_move,
+                                  on_render=self.on_visible_changed)
+        self.grid.pack(fill=tk.BOTH, expand=True)
         
         # Правая панель - управление
         right_frame = ttk.LabelFrame(main_frame, text="Управление изображением", width=300)
@@ -144,108 +147,81 @@ class AdvancedImageSorter:
         
         # Отображаем миниатюры
         self.display_thumbnails()
-        
-        # Обновляем scrollregion
-        self.scrollable_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
     
     def display_thumbnails(self):
-        """Отображает миниатюры с информацией о папке"""
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        self.thumbnail_frames = []
-        
-        for i, thumb_data in enumerate(self.thumbnails):
-            # Фрейм для миниатюры
-            thumb_frame = ttk.Frame(self.scrollable_frame, relief="solid", borderwidth=1)
-            thumb_frame.grid(row=i//4, column=i%4, padx=5, pady=5, sticky="w")
-            thumb_frame.config(width=140, height=140)
-            thumb_frame.pack_propagate(False)
-            
-            # Номер и папка
-            info_text = f"{thumb_data['global_number']} - {thumb_data['folder']}"
-            number_label = ttk.Label(thumb_frame, text=info_text, font=("Arial", 7, "bold"))
-            number_label.pack(anchor="nw", padx=2, pady=2)
-            
-            # Миниатюра (с учетом поворота)
-            rotated_thumb = self.get_rotated_thumbnail(thumb_data)
-            img_label = ttk.Label(thumb_frame, image=rotated_thumb)
-            img_label.image = rotated_thumb
-            img_label.pack(padx=5, pady=2)
-            
-            # Имя файла
-            short_name = thumb_data['filename'][:12] + "..." if len(thumb_data['filename']) > 15 else thumb_data['filename']
-            name_label = ttk.Label(thumb_frame, text=short_name, font=("Arial", 7), wraplength=130)
-            name_label.pack(padx=2, pady=2)
-            
-            # Привязываем события
-            self.bind_drag_events(thumb_frame, i)
-            img_label.bind("<Button-1>", lambda e, idx=i: self.select_image(idx))
-            name_label.bind("<Button-1>", lambda e, idx=i: self.select_image(idx))
-            
-            self.thumbnail_frames.append(thumb_frame)
-        
-        self.scrollable_frame.update_idletasks()
+        """Перерисовывает сетку миниатюр"""
+        self.grid.set_count(len(self.thumbnails))
+    
+    def get_cell(self, index):
+        """Данные ячейки сетки: номер и папка, миниатюра с учетом поворота, имя файла"""
+        thumb_data = self.thumbnails[index]
+        short_name = thumb_data['filename'][:12] + "..." if len(thumb_data['filename']) > 15 else thumb_data['filename']
+        if thumb_data['error']:
+            short_name = "⚠ " + short_name
+        return {
+            'title': f"{thumb_data['global_number']} - {thumb_data['folder']}",
+            'image': self.get_rotated_thumbnail(thumb_data),
+            'name': short_name
+        }
+    
+    def on_thumbnails_loaded(self, batch):
+        """Готовые миниатюры из фоновой загрузки - обновляем только их ячейки"""
+        changed = []
+        for path, photo, info, error in batch:
+            index = self.thumbnails.position_of(path)
+            thumb_data = self.thumbnails[index]
+            if error is not None:
+                print(f"Ошибка загрузки {thumb_data['filename']}: {error}")
+                thumb_data['error'] = str(error)
+            else:
+                thumb_data['thumbnail'] = photo
+                thumb_data['image_size'], thumb_data['image_mode'], thumb_data['image_format'] = info
+            changed.append(index)
+            if path == self.selected_path:
+                # Сведения о выбранном фото дополняются размером
+                self.select_image(index)
+        self.grid.refresh(changed)
+    
+    def on_visible_changed(self, first, last):
+        """Видимые миниатюры загружаются первыми"""
+        if self.loader is not None:
+            order = get_priority_order(first, last, len(self.thumbnails))
+            self.loader.prioritize([self.thumbnails[index]['path'] for index in order])
     
     def get_rotated_thumbnail(self, thumb_data):
-        """Возвращает миниатюру с учетом поворота"""
+        """Возвращает миниатюру с учетом поворота (None, пока миниатюра не загружена)"""
+        if thumb_data['rotation'] == 0 or thumb_data['thumbnail'] is None:
+            return thumb_data['thumbnail']
+        
+        key = (thumb_data['path'], thumb_data['rotation'])
+        photo = self.rotated_thumbnails.get(key)
+        if photo is not None:
+            self.rotated_thumbnails.move_to_end(key)
+            return photo
+        
         try:
-            if thumb_data['rotation'] == 0:
-                return thumb_data['thumbnail']
-            
-            # Создаем повернутую миниатюру
-            img = thumb_data['original_image'].copy()
+            # Миниатюра берется из кэша миниатюр; файл фото открывается, только если ее там нет
+            img, _ = load_thumbnail(thumb_data['path'], get_thumbnail_atlas())
             rotated_img = img.rotate(thumb_data['rotation'], expand=True)
             rotated_img.thumbnail((120, 90), Image.Resampling.LANCZOS)
-            return ImageTk.PhotoImage(rotated_img)
+            photo = ImageTk.PhotoImage(rotated_img)
         except Exception as e:
             print(f"Ошибка создания повернутой миниатюры: {e}")
             return thumb_data['thumbnail']
-    
-    def bind_drag_events(self, widget, index):
-        """Привязывает события перетаскивания"""
-        widget.bind("<ButtonPress-1>", lambda e: self.on_drag_start(e, index))
-        widget.bind("<B1-Motion>", self.on_drag_motion)
-        widget.bind("<ButtonRelease-1>", self.on_drag_release)
-        
-        for child in widget.winfo_children():
-            child.bind("<ButtonPress-1>", lambda e: self.on_drag_start(e, index))
-            child.bind("<B1-Motion>", self.on_drag_motion)
-            child.bind("<ButtonRelease-1>", self.on_drag_release)
-    
-    def on_drag_start(self, event, index):
-        self.drag_start_index = index
-        self.dragged_item = self.thumbnail_frames[index]
-        self.dragged_item.configure(relief="raised", borderwidth=2)
-    
-    def on_drag_motion(self, event):
-        if self.dragged_item is None:
-            return
-            
-        widget = event.widget.winfo_containing(event.x_root, event.y_root)
-        while widget and widget not in self.thumbnail_frames:
-            widget = widget.master
         
-        if widget and widget in self.thumbnail_frames:
-            current_index = self.thumbnail_frames.index(widget)
-            if current_index != self.drag_start_index:
-                # Перемещаем элемент
-                dragged_data = self.thumbnails.pop(self.drag_start_index)
-                self.thumbnails.insert(current_index, dragged_data)
-                self.display_thumbnails()
-                self.drag_start_index = current_index
+        self.rotated_thumbnails[key] = photo
+        if len(self.rotated_thumbnails) > ROTATED_CACHE_SIZE:
+            self.rotated_thumbnails.popitem(last=False)
+        return photo
     
-    def on_drag_release(self, event):
-        if self.dragged_item:
-            self.dragged_item.configure(relief="solid", borderwidth=1)
-            self.dragged_item = None
-            self.drag_start_index = None
+    def on_move(self, source, target):
+        """Перетаскивание: перемещаем фото и перерисовываем только сдвинутые ячейки"""
+        self.grid.refresh_range(*self.thumbnails.move(source, target))
     
     def select_image(self, index):
         """Выбирает изображение для управления"""
-        self.selected_index = index
         thumb_data = self.thumbnails[index]
+        self.selected_path = thumb_data['path']
         
         # Показываем превью
         self.show_preview(thumb_data)
@@ -253,19 +229,25 @@ class AdvancedImageSorter:
         # Обновляем информацию
         info_text = f"Файл: {thumb_data['filename']}\n"
         info_text += f"Папка: {thumb_data['folder']}\n"
-        info_text += f"Размер: {thumb_data['original_image'].size}\n"
+        if thumb_data['image_size']:
+            info_text += (f"Размер: {thumb_data['image_size'][0]}×{thumb_data['image_size'][1]} "
+                          f"({thumb_data['image_format']}, {thumb_data['image_mode']})\n")
+        elif thumb_data['error']:
+            info_text += "Размер: ошибка загрузки\n"
+        else:
+            info_text += "Размер: загружается...\n"
         info_text += f"Поворот: {thumb_data['rotation']}°"
         self.info_label.config(text=info_text)
     
     def show_preview(self, thumb_data):
         """Показывает превью изображения"""
         try:
-            img = Image.open(thumb_data['path'])
+            # Масштабируем для превью до поворота (при повороте на 90° стороны меняются местами)
+            preview_size = (280, 260) if thumb_data['rotation'] in (90, 270) else (260, 280)
+            img, _ = make_thumbnail(thumb_data['path'], preview_size)
             if thumb_data['rotation'] != 0:
                 img = img.rotate(thumb_data['rotation'], expand=True)
             
-            # Масштабируем для превью
-            img.thumbnail((260, 280), Image.Resampling.LANCZOS)
             photo = ImageTk.PhotoImage(img)
             
             self.preview_canvas.delete("all")
@@ -279,8 +261,9 @@ class AdvancedImageSorter:
     
     def rotate_image(self, degrees):
         """Поворачивает выбранное изображение"""
-        if hasattr(self, 'selected_index'):
-            thumb_data = self.thumbnails[self.selected_index]
+        if self.selected_path is not None:
+            index = self.thumbnails.position_of(self.selected_path)
+            thumb_data = self.thumbnails[index]
             
             if degrees == 0:
                 # Сброс поворота
@@ -290,12 +273,15 @@ class AdvancedImageSorter:
                 thumb_data['rotation'] = (thumb_data['rotation'] + degrees) % 360
             
             # Обновляем отображение
-            self.display_thumbnails()
-            self.select_image(self.selected_index)
+            self.grid.refresh([index])
+            self.select_image(index)
     
     def auto_sort(self):
         """Автоматическая сортировка по папкам и имени"""
         self.thumbnails.sort(key=lambda x: (x['folder'], x['filename']))
+        if self.selected_path is not None:
+            # Выделение остается на том же фото
+            self.grid.selected = self.thumbnails.position_of(self.selected_path)
         self.display_thumbnails()
         self.current_order = [img['filename'] for img in self.thumbnails]
     
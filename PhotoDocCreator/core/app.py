@@ -3,6 +3,7 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
 import sys
 import json
+import time
 import threading
 import logging
 from PIL import Image, ImageTk
@@ -11,12 +12,18 @@ from PIL import Image, ImageTk
 from .diagnostics import DependencyChecker
 from .image_sorter import VisualImageSorter
 from .advanced_sorter import AdvancedImageSorter
-from .doc_creator import DocumentCreator
+from .captions import CaptionIndex, RuleIndex
+from .log_sink import LogSink
+from .build_job import BuildJob
+from .job import (get_images_single_folder, get_sorted_images_multi_folder, get_images_multi_folder,
+                  get_images_from_advanced_sort)
 from utils.config_manager import ConfigManager
-from utils.file_utils import natural_sort_key, get_image_files
 
 logger = logging.getLogger(__name__)
 
+# Период обновления полосы хода сборки
+PROGRESS_INTERVAL_MS = 200
+
 class PhotoDocCreator:
     def __init__(self, root):
         self.root = root
@@ -31,6 +38,7 @@ class PhotoDocCreator:
         # Инициализация переменных
         self._setup_variables()
         self._setup_ui()
+        self.log_sink = LogSink(self.root, self.log_text)
         
         # Загрузка пресетов
         self.presets = {}
@@ -41,6 +49,9 @@ class PhotoDocCreator:
         self.advanced_sort_order = []
         self.rotation_info = {}
         
+        # Идущие сборки: снимок задания, поток, отмена и ход сборки
+        self.active_builds = []
+        
         logger.info("PhotoDoc Creator запущен")
     
     def _setup_variables(self):
@@ -51,6 +62,9 @@ class PhotoDocCreator:
         self.image_width = tk.DoubleVar(value=self.config.get('image_width', 6.0))
         self.image_height = tk.DoubleVar(value=self.config.get('image_height', 9.0))
         self.images_per_page = tk.IntVar(value=self.config.get('images_per_page', 2))
+        self.target_dpi = tk.IntVar(value=self.config.get('target_dpi', 0))
+        self.writer_backend = tk.StringVar(value=self.config.get('writer_backend', 'docx'))
+        self.incremental_build = tk.BooleanVar(value=self.config.get('incremental_build', False))
         
         # Данные сотрудника
         self.officer_name = tk.StringVar(value=self.config.get('officer_name', 'ФИО'))
@@ -169,15 +183,26 @@ class PhotoDocCreator:
         button_frame = ttk.Frame(parent)
         button_frame.grid(row=6, column=0, columnspan=3, pady=20)
         
-        ttk.Button(button_frame, text="Создать документ", command=self.start_creation_process).pack(side=tk.LEFT, padx=10)
+        self.create_button = ttk.Button(button_frame, text="Создать документ", command=self.start_creation_process)
+        self.create_button.pack(side=tk.LEFT, padx=10)
+        self.cancel_button = ttk.Button(button_frame, text="Отмена", command=self.cancel_creation, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=10)
         ttk.Button(button_frame, text="Диагностика системы", command=self.show_diagnostics).pack(side=tk.LEFT, padx=10)
         
+        # Ход сборки
+        progress_frame = ttk.Frame(parent)
+        progress_frame.grid(row=7, column=0, columnspan=3, sticky="we", padx=5)
+        self.progress_bar = ttk.Progressbar(progress_frame, mode='determinate', maximum=1.0)
+        self.progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.progress_label = ttk.Label(progress_frame, text="", width=50)
+        self.progress_label.pack(side=tk.LEFT, padx=5)
+        
         # Логи
         self.log_text = scrolledtext.ScrolledText(parent, height=15, width=90)
-        self.log_text.grid(row=7, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
+        self.log_text.grid(row=8, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
         
         # Настройка растягивания
-        parent.grid_rowconfigure(7, weight=1)
+        parent.grid_rowconfigure(8, weight=1)
         parent.grid_columnconfigure(1, weight=1)
     
     def setup_settings_tab(self, parent):
@@ -195,6 +220,19 @@ class PhotoDocCreator:
         ttk.Label(size_frame, text="Фото на страницу:").grid(row=0, column=4, padx=5, pady=5)
         ttk.Spinbox(size_frame, from_=1, to=4, width=8, textvariable=self.images_per_page).grid(row=0, column=5, padx=5, pady=5)
         
+        ttk.Label(size_frame, text="DPI печати (0 - без уменьшения):").grid(row=1, column=0, columnspan=2, sticky="w", padx=5, pady=5)
+        dpi_combo = ttk.Combobox(size_frame, textvariable=self.target_dpi, width=6, state="readonly")
+        dpi_combo['values'] = (0, 150, 220, 300)
+        dpi_combo.grid(row=1, column=2, sticky="w", padx=5, pady=5)
+        
+        ttk.Label(size_frame, text="Запись документа:").grid(row=1, column=3, sticky="w", padx=5, pady=5)
+        writer_combo = ttk.Combobox(size_frame, textvariable=self.writer_backend, width=8, state="readonly")
+        writer_combo['values'] = ('docx', 'stream')
+        writer_combo.grid(row=1, column=4, columnspan=2, sticky="w", padx=5, pady=5)
+        
+        ttk.Checkbutton(size_frame, text="Пересобирать только измененные страницы", 
+                       variable=self.incremental_build).grid(row=2, column=0, columnspan=6, sticky="w", padx=5, pady=5)
+        
         # Настройки шрифта
         font_frame = ttk.LabelFrame(parent, text="Настройки шрифта")
         font_frame.grid(row=1, column=0, columnspan=2, sticky="we", padx=5, pady=5)
@@ -270,10 +308,8 @@ class PhotoDocCreator:
         messagebox.showinfo("О программе", about_text)
     
     def log(self, message):
-        """Добавляет сообщение в лог"""
-        self.log_text.insert(tk.END, message + "\n")
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """Добавляет сообщение в лог (можно вызывать из потока сборки)"""
+        self.log_sink.write(message)
         logger.info(message)
     
     def save_config(self):
@@ -292,6 +328,9 @@ class PhotoDocCreator:
             'image_width': self.image_width.get(),
             'image_height': self.image_height.get(),
             'images_per_page': self.images_per_page.get(),
+            'target_dpi': self.target_dpi.get(),
+            'writer_backend': self.writer_backend.get(),
+            'incremental_build': self.incremental_build.get(),
             'officer_name': self.officer_name.get(),
             'officer_rank': self.officer_rank.get(),
             'officer_position': self.officer_position.get(),
@@ -326,110 +365,151 @@ class PhotoDocCreator:
             return
         
         self.save_config()
-        self.log_text.delete(1.0, tk.END)
+        
+        # Снимок задания: поток сборки не обращается к переменным окна
+        job = BuildJob(dict(self.config, advanced_sort_order=self.advanced_sort_order, rotation_info=self.rotation_info))
+        
+        output_file = os.path.abspath(job.output_file)
+        if any(os.path.abspath(build['job'].output_file) == output_file for build in self.active_builds):
+            messagebox.showerror("Ошибка", f"Документ {job.name} уже собирается")
+            return
+        
+        if not self.active_builds:
+            self.log_sink.clear()
+            self.progress_bar['value'] = 0
+            self.root.after(PROGRESS_INTERVAL_MS, self._poll_progress)
+        
+        build = {
+            'job': job,
+            'cancel_event': threading.Event(),
+            'progress': None,
+            'started': None,
+            'log_prefix': ""
+        }
+        build['thread'] = threading.Thread(target=self.create_document, args=(build,))
+        build['thread'].daemon = True
+        self.active_builds.append(build)
+        self._update_log_prefixes()
+        
+        self.progress_label.config(text="Подготовка...")
+        self.cancel_button.config(state=tk.NORMAL)
         
         # Запускаем в отдельном потоке
-        thread = threading.Thread(target=self.create_document)
-        thread.daemon = True
-        thread.start()
+        build['thread'].start()
     
-    def create_document(self):
-        """Создает документ"""
+    def cancel_creation(self):
+        """Отменяет идущие сборки: они остановятся перед следующим фото"""
+        if not self.active_builds:
+            return
+        for build in self.active_builds:
+            build['cancel_event'].set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="Отмена...")
+        self.log("⏳ Отмена сборки...")
+    
+    def _poll_progress(self):
+        """Обновляет полосу хода сборки, пока идет хотя бы одна сборка"""
+        finished = [build for build in self.active_builds if not build['thread'].is_alive()]
+        for build in finished:
+            self.active_builds.remove(build)
+        if finished:
+            self._update_log_prefixes()
+        
+        if self.active_builds:
+            self._show_progress(self.active_builds)
+            self.root.after(PROGRESS_INTERVAL_MS, self._poll_progress)
+            return
+        
+        # Все сборки завершены, итог показываем по последней
+        self.cancel_button.config(state=tk.DISABLED)
+        build = finished[-1] if finished else None
+        progress = build['progress'] if build else None
+        if build and build['cancel_event'].is_set():
+            self.progress_label.config(text="Сборка отменена")
+        elif progress and progress[1] and progress[0] == progress[1]:
+            self.progress_bar['value'] = 1.0
+            self.progress_label.config(text=f"Готово: {progress[1]} фото")
+        else:
+            self.progress_label.config(text="")
+    
+    def _update_log_prefixes(self):
+        """При одновременных сборках помечает их сообщения именем документа (только из потока Tk)"""
+        several = len(self.active_builds) > 1
+        for build in self.active_builds:
+            build['log_prefix'] = f"[{build['job'].name}] " if several else ""
+    
+    def _show_progress(self, builds):
+        """Показывает общий ход идущих сборок"""
+        started = [build['started'] for build in builds if build['started']]
+        progress = [build['progress'] for build in builds if build['progress']]
+        if not progress or any(build['cancel_event'].is_set() for build in builds):
+            return
+        
+        done = sum(item[0] for item in progress)
+        total = sum(item[1] for item in progress)
+        bytes_read = sum(item[2] for item in progress)
+        if total:
+            self.progress_bar['value'] = done / total
+        
+        text = self._format_progress(done, total, bytes_read, min(started) if started else None)
+        if len(builds) > 1:
+            text = f"Сборок: {len(builds)} · " + text
+        self.progress_label.config(text=text)
+    
+    def _format_progress(self, done, total, bytes_read, started):
+        """Формирует строку хода сборки: фото, скорость и оставшееся время"""
+        text = f"{done} из {total} фото"
+        elapsed = time.monotonic() - started if started else 0
+        if done and elapsed > 1:
+            rate = done / elapsed
+            remaining = int((total - done) / rate)
+            minutes, seconds = divmod(remaining, 60)
+            text += f" · {rate:.1f} фото/с · {bytes_read / elapsed / 1048576:.1f} МБ/с · осталось {minutes}:{seconds:02d}"
+        return text
+    
+    def create_document(self, build):
+        """Создает документ по снимку задания (выполняется в потоке сборки)"""
+        job = build['job']
+        
+        def log(message):
+            # Префикс выставляет поток Tk, здесь он только читается
+            self.log(build['log_prefix'] + message)
+        
+        def on_progress(done, total, bytes_read):
+            if done == 0:
+                build['started'] = time.monotonic()
+            build['progress'] = (done, total, bytes_read)
+        
         try:
-            self.log("🚀 Начало создания документа...")
+            log("🚀 Начало создания документа...")
+            for message in job.describe():
+                log(message)
             
-            # Получаем изображения в зависимости от режима
-            if self.multi_folder_mode.get() and self.folder_sequence:
-                self.log("🔀 Режим: Многопапковый")
-                
-                # Проверяем, есть ли расширенный порядок сортировки
-                if hasattr(self, 'advanced_sort_order') and self.advanced_sort_order:
-                    self.log("🔀 Используется расширенный порядок сортировки")
-                    image_data_list = self.get_images_from_advanced_sort()
-                else:
-                    image_data_list = self.get_all_images_multi_folder()
-                
-                image_files_count = len(image_data_list)
-                self.log(f"📁 Обрабатывается {len(self.folder_sequence)} папок, всего {image_files_count} фото")
-            else:
-                self.log("🔀 Режим: Одна папка")
-                folder = self.screenshots_folder.get()
+            if not job.multi_folder_mode:
+                folder = job.config.get('screenshots_folder', '')
                 if not folder or not os.path.exists(folder):
-                    self.log("❌ Папка с фотографиями не существует")
-                    return
-                    
-                image_files = get_image_files(folder)
-                
-                if not image_files:
-                    self.log("❌ В папке нет изображений")
+                    log("❌ Папка с фотографиями не существует")
                     return
-                
-                # Сортируем изображения
-                if self.sort_method.get() == "name_asc":
-                    image_files.sort(key=natural_sort_key)
-                elif self.sort_method.get() == "name_desc":
-                    image_files.sort(key=natural_sort_key, reverse=True)
-                elif self.sort_method.get() == "manual" and self.manual_sort_order:
-                    # Ручная сортировка
-                    manual_files = [f for f in self.manual_sort_order if f in image_files]
-                    remaining_files = [f for f in image_files if f not in manual_files]
-                    image_files = manual_files + remaining_files
-                else:
-                    image_files.sort(key=natural_sort_key)  # По умолчанию
-                
-                self.log(f"📁 Найдено {len(image_files)} изображений")
-                
-                # Подготавливаем данные изображений
-                image_data_list = []
-                for i, img_file in enumerate(image_files, 1):
-                    image_data_list.append({
-                        'path': os.path.join(folder, img_file),
-                        'filename': img_file,
-                        'global_number': i,
-                        'folder_rules': [],
-                        'folder_start_number': 1
-                    })
-                image_files_count = len(image_files)
             
+            # Список фотографий составляется по снимку, без обращения к окну
+            image_data_list = job.get_image_data_list()
             if not image_data_list:
-                self.log("❌ Нет изображений для обработки")
+                log("❌ Нет изображений для обработки")
                 return
             
-            # Создаем конфиг для DocumentCreator
-            config = {
-                'word_file': self.word_file.get(),
-                'image_width': self.image_width.get(),
-                'image_height': self.image_height.get(),
-                'images_per_page': self.images_per_page.get(),
-                'department_name': self.department_name.get(),
-                'photo_table_title': self.photo_table_title.get(),
-                'font_family': self.font_family.get(),
-                'font_size': self.font_size.get(),
-                'font_bold': self.font_bold.get(),
-                'officer_position': self.officer_position.get(),
-                'footer_department': self.footer_department.get(),
-                'officer_rank': self.officer_rank.get(),
-                'officer_name': self.officer_name.get(),
-                'enable_footer': self.enable_footer.get(),
-                'caption_rules': self.caption_rules,
-                'multi_folder_mode': self.multi_folder_mode.get(),
-                'rotation_info': getattr(self, 'rotation_info', {})  # Добавляем информацию о поворотах
-            }
-            
             # Создаем документ
-            doc_creator = DocumentCreator(config)
-            success, result, count = doc_creator.create_document(image_data_list, self.log)
+            success, result, count = job.run(log, image_data_list, on_progress, build['cancel_event'])
             
             if success:
                 # Пытаемся открыть документ
                 try:
                     os.startfile(result)
-                    self.log("🔓 Документ открыт в Word")
+                    log("🔓 Документ открыт в Word")
                 except:
-                    self.log("ℹ️ Файл создан, но не удалось открыть его автоматически")
+                    log("ℹ️ Файл создан, но не удалось открыть его автоматически")
                     
         except Exception as e:
-            self.log(f"❌ Критическая ошибка: {str(e)}")
+            log(f"❌ Критическая ошибка: {str(e)}")
             logger.error(f"Ошибка при создании документа: {e}")
     
     def visual_sort_images(self):
@@ -473,29 +553,7 @@ class PhotoDocCreator:
     
     def get_images_from_advanced_sort(self):
         """Получает изображения из расширенного порядка сортировки"""
-        image_data_list = []
-        
-        for i, filename in enumerate(self.advanced_sort_order, 1):
-            # Находим полный путь к файлу
-            full_path = None
-            for folder_data in self.folder_sequence:
-                folder_path = folder_data['path']
-                potential_path = os.path.join(folder_path, filename)
-                if os.path.exists(potential_path):
-                    full_path = potential_path
-                    break
-            
-            if full_path and os.path.exists(full_path):
-                image_data_list.append({
-                    'path': full_path,
-                    'filename': filename,
-                    'global_number': i,
-                    'folder_rules': [],
-                    'folder_start_number': 1,
-                    'rotation': self.rotation_info.get(full_path, 0)
-                })
-        
-        return image_data_list
+        return get_images_from_advanced_sort(self.advanced_sort_order, self.folder_sequence, self.rotation_info)
     
     def load_selected_preset(self):
         """Заглушка для загрузки пресета"""
@@ -659,13 +717,11 @@ class PhotoDocCreator:
                     messagebox.showerror("Ошибка", "Введите текст подписи")
                     return
                 
-                # Проверяем пересечения с существующими правилами
-                for rule in folder_data['caption_rules']:
-                    if len(rule) >= 3:
-                        rule_start, rule_end, _ = rule[0], rule[1], rule[2]
-                        if not (end < rule_start or start > rule_end):
-                            messagebox.showerror("Ошибка", f"Диапазон пересекается с существующим правилом: фото {rule_start}-{rule_end}")
-                            return
+                # Проверяем пересечение нового диапазона с существующими правилами
+                overlap = RuleIndex(folder_data['caption_rules']).find_overlap(start, end)
+                if overlap:
+                    messagebox.showerror("Ошибка", f"Диапазон пересекается с существующим правилом: фото {overlap[0]}-{overlap[1]}")
+                    return
                 
                 # Добавляем правило
                 folder_data['caption_rules'].append((start, end, text))
@@ -787,52 +843,11 @@ class PhotoDocCreator:
     
     def get_sorted_images_multi_folder(self, folder_path):
         """Возвращает отсортированный список изображений для многопапкового режима"""
-        if not os.path.exists(folder_path):
-            return []
-            
-        image_files = [f for f in os.listdir(folder_path) if
-                      f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
-        
-        sort_method = self.multi_folder_sort_method.get()
-        
-        if sort_method == "name_asc" or sort_method == "По имени (А-Я)":
-            image_files.sort(key=self.natural_sort_key)
-        elif sort_method == "name_desc" or sort_method == "По имени (Я-А)":
-            image_files.sort(key=self.natural_sort_key, reverse=True)
-        elif sort_method == "date_asc" or sort_method == "По дате создания (сначала старые)":
-            image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder_path, f)))
-        elif sort_method == "date_desc" or sort_method == "По дате создания (сначала новые)":
-            image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder_path, f)), reverse=True)
-        else:
-            # По умолчанию - естественная сортировка
-            image_files.sort(key=self.natural_sort_key)
-            
-        return image_files
+        return get_sorted_images_multi_folder(folder_path, self.multi_folder_sort_method.get())
     
     def get_all_images_multi_folder(self):
         """Получение всех изображений из всех папок в правильном порядке"""
-        all_images = []
-        current_photo_number = 1
-        
-        for folder_data in self.folder_sequence:
-            folder_path = folder_data['path']
-            image_files = folder_data['images']
-            
-            folder_start_number = current_photo_number
-            
-            for img_file in image_files:
-                full_path = os.path.join(folder_path, img_file)
-                all_images.append({
-                    'path': full_path,
-                    'filename': img_file,
-                    'folder_path': folder_path,
-                    'global_number': current_photo_number,
-                    'folder_start_number': folder_start_number,
-                    'folder_rules': folder_data['caption_rules']
-                })
-                current_photo_number += 1
-        
-        return all_images
+        return get_images_multi_folder(self.folder_sequence, self.multi_folder_sort_method.get())
     
     def setup_caption_rules_tab(self, parent):
         """Настраивает вкладку правил подписей"""
@@ -916,6 +931,10 @@ class PhotoDocCreator:
             
             self.log(f"✓ Добавлено правило: фото {start}-{end}")
             
+            # Предупреждаем о пересечениях: действует правило, которое выше в списке
+            for problem in self.get_caption_index().global_rules.problems:
+                self.log(f"⚠️ {problem}")
+            
         except ValueError:
             messagebox.showerror("Ошибка", "Введите корректные номера фотографий")
     
@@ -943,81 +962,21 @@ class PhotoDocCreator:
         for start, end, text in self.caption_rules:
             self.rules_tree.insert("", tk.END, values=(start, end, text))
     
-    def get_caption_for_photo(self, photo_number):
-        """Возвращает подпись для фото на основе правил"""
-        for start, end, text in self.caption_rules:
-            if start <= photo_number <= end:
-                return f"Фото № {photo_number}. {text}"
-        return f"Фото № {photo_number}"
+    def get_caption_index(self):
+        """Компилирует текущие правила подписей для предпросмотра"""
+        return CaptionIndex(self.caption_rules)
     
-    def get_caption_for_photo_multi(self, photo_info):
-        """Получение подписи для фото в многопапковом режиме"""
-        photo_number = photo_info['global_number']
-        folder_rules = photo_info['folder_rules']
-        folder_start = photo_info['folder_start_number']
-        
-        # Вычисляем локальный номер фото в папке
-        local_photo_number = photo_number - folder_start + 1
-        
-        # Сначала проверяем правила конкретной папки (по локальному номеру)
-        for start, end, text in folder_rules:
-            if start <= local_photo_number <= end:
-                return f"Фото № {photo_number}. {text}"
-        
-        # Затем проверяем общие правила (по глобальному номеру)
-        for start, end, text in self.caption_rules:
-            if start <= photo_number <= end:
-                return f"Фото № {photo_number}. {text}"
-        
-        # Если правил нет - стандартная подпись
-        return f"Фото № {photo_number}"
+    def get_caption_for_photo(self, photo_number, caption_index=None):
+        """Возвращает подпись для фото на основе правил"""
+        return (caption_index or self.get_caption_index()).get_caption(photo_number)
     
-    def natural_sort_key(self, filename):
-        """Ключ для естественной сортировки файлов (учитывает числа в названиях)"""
-        import re
-        return [int(text) if text.isdigit() else text.lower()
-                for text in re.split(r'(\d+)', filename)]
+    def get_caption_for_photo_multi(self, photo, caption_index=None):
+        """Получение подписи для фото (PhotoRecord) в многопапковом режиме"""
+        return (caption_index or self.get_caption_index()).get_caption_multi(photo)
     
     def get_all_images_single_folder(self):
         """Получает изображения для одиночного режима"""
-        folder = self.screenshots_folder.get()
-        if not folder or not os.path.exists(folder):
-            return []
-        
-        image_files = get_image_files(folder)
-        
-        # Применяем сортировку
-        sort_method = self.sort_method.get()
-        
-        if sort_method == "name_asc":
-            image_files.sort(key=natural_sort_key)
-        elif sort_method == "name_desc":
-            image_files.sort(key=natural_sort_key, reverse=True)
-        elif sort_method == "date_asc":
-            image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder, f)))
-        elif sort_method == "date_desc":
-            image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder, f)), reverse=True)
-        elif sort_method == "manual" and self.manual_sort_order:
-            # Ручная сортировка
-            manual_files = [f for f in self.manual_sort_order if f in image_files]
-            remaining_files = [f for f in image_files if f not in manual_files]
-            image_files = manual_files + remaining_files
-        else:
-            # По умолчанию - естественная сортировка
-            image_files.sort(key=natural_sort_key)
-        
-        # Преобразуем в нужный формат
-        image_data_list = []
-        for i, img_file in enumerate(image_files, 1):
-            image_data_list.append({
-                'path': os.path.join(folder, img_file),
-                'filename': img_file,
-                'global_number': i,
-                'folder_rules': [],
-                'folder_start_number': 1
-            })
-        
-        return image_data_list
+        return get_images_single_folder(self.screenshots_folder.get(), self.sort_method.get(), self.manual_sort_order)
     
     def apply_sort_to_all_folders(self):
         """Применяет выбранную сортировку ко всем папкам"""
@@ -0,0 +1,188 @@
+"""
+Пакетная сборка: много фототаблиц за один запуск.
+
+Задания берутся из манифеста (JSON со списком заданий) или из корневой
+папки, где каждая подпапка - отдельное дело. Документы собираются
+параллельно в нескольких процессах. Общий бюджет процессов делится между
+заданиями и предобработкой изображений внутри каждого задания, чтобы
+вместе они не занимали больше ядер, чем задано.
+"""
+import os
+import json
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .job import load_job, make_job_config, run_job
+from utils.file_utils import natural_sort_key, get_image_files
+
+logger = logging.getLogger(__name__)
+
+
+def load_batch_manifest(manifest_file):
+    """
+    Загружает манифест пакета. Формат:
+    {"defaults": {...}, "jobs": [{...}, {"config": "дело1.json", ...}]}
+    или просто список заданий. Каждое задание - настройки в формате
+    config.json; ключ "config" указывает файл задания (путь относительно
+    манифеста), остальные ключи задания дополняют его.
+    """
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    
+    if isinstance(manifest, list):
+        manifest = {'jobs': manifest}
+    
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+    defaults = manifest.get('defaults', {})
+    
+    jobs = []
+    for entry in manifest.get('jobs', []):
+        job = dict(defaults)
+        if entry.get('config'):
+            job.update(load_job(os.path.join(base_dir, entry['config'])))
+        job.update({key: value for key, value in entry.items() if key != 'config'})
+        jobs.append(make_job_config(job))
+    
+    return jobs
+
+
+def discover_case_jobs(root_dir, output_dir=None, defaults=None):
+    """
+    Составляет задания по корневой папке: каждая подпапка с изображениями -
+    отдельное дело, документ называется по имени подпапки.
+    """
+    output_dir = output_dir or root_dir
+    jobs = []
+    
+    for name in sorted(os.listdir(root_dir), key=natural_sort_key):
+        folder = os.path.join(root_dir, name)
+        if not os.path.isdir(folder) or not get_image_files(folder):
+            continue
+        
+        job = dict(defaults or {})
+        job.update({
+            'name': name,
+            'screenshots_folder': folder,
+            'word_file': os.path.join(output_dir, f"{name}.docx"),
+            'multi_folder_mode': False
+        })
+        jobs.append(make_job_config(job))
+    
+    return jobs
+
+
+def get_job_name(job):
+    """Название задания для журнала и отчета"""
+    return job.get('name') or os.path.splitext(os.path.basename(job.get('word_file', '')))[0]
+
+
+def plan_worker_budget(job_count, total_workers=0, parallel_jobs=0):
+    """
+    Делит общий бюджет процессов между заданиями.
+    Возвращает (число одновременных заданий, процессов предобработки на задание).
+    """
+    if not total_workers or total_workers < 0:
+        total_workers = os.cpu_count() or 1
+    if not parallel_jobs or parallel_jobs < 0:
+        parallel_jobs = total_workers
+    
+    parallel_jobs = max(1, min(parallel_jobs, job_count, total_workers))
+    return parallel_jobs, max(1, total_workers // parallel_jobs)
+
+
+def get_job_result(job, success, result, count, seconds, problems):
+    """Строка отчета о задании: результат run_job, время и размер документа"""
+    return {
+        'name': get_job_name(job),
+        'success': success,
+        'output': result if success else job.get('word_file', ''),
+        'error': None if success else result,
+        'photos': count,
+        'seconds': round(seconds, 3),
+        'size': os.path.getsize(result) if success else 0,
+        'problems': problems
+    }
+
+
+def build_batch_job(job):
+    """
+    Собирает один документ пакета. Выполняется в процессе пакетной сборки.
+    Возвращает строку отчета о задании.
+    """
+    problems = []
+    
+    def log_callback(message):
+        # В отчет попадают только ошибки и предупреждения
+        if message.startswith(("❌", "⚠️")):
+            problems.append(message)
+    
+    started = time.perf_counter()
+    try:
+        success, result, count = run_job(job, log_callback)
+    except Exception as e:
+        logger.error(f"Ошибка сборки {get_job_name(job)}: {e}", exc_info=True)
+        success, result, count = False, str(e), 0
+    
+    return get_job_result(job, success, result, count, time.perf_counter() - started, problems)
+
+
+def run_batch(jobs, total_workers=0, parallel_jobs=0, log_callback=None):
+    """
+    Собирает документы пакета параллельно.
+    Возвращает отчет со строкой по каждому заданию в исходном порядке.
+    """
+    parallel_jobs, job_workers = plan_worker_budget(len(jobs), total_workers, parallel_jobs)
+    for job in jobs:
+        job['preprocess_workers'] = job_workers
+    
+    if log_callback:
+        log_callback(f"📦 Заданий: {len(jobs)}, одновременно: {parallel_jobs}, "
+                     f"процессов предобработки на задание: {job_workers}")
+    
+    started = time.perf_counter()
+    results = [None] * len(jobs)
+    
+    def on_done(index, result):
+        results[index] = result
+        if log_callback:
+            if result['success']:
+                log_callback(f"✅ {result['name']}: {result['photos']} фото, "
+                             f"{result['size'] / 1048576:.1f} МБ, {result['seconds']:.1f} с")
+            else:
+                log_callback(f"❌ {result['name']}: {result['error']}")
+    
+    if parallel_jobs <= 1:
+        for index, job in enumerate(jobs):
+            on_done(index, build_batch_job(job))
+    else:
+        with ProcessPoolExecutor(max_workers=parallel_jobs) as executor:
+            futures = {executor.submit(build_batch_job, job): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # Процесс сборки завершился аварийно
+                    result = get_job_result(jobs[index], False, str(e), 0, 0, [])
+                on_done(index, result)
+    
+    return {
+        'jobs': results,
+        'succeeded': sum(1 for result in results if result['success']),
+        'failed': sum(1 for result in results if not result['success']),
+        'photos': sum(result['photos'] for result in results),
+        'size': sum(result['size'] for result in results),
+        'seconds': round(time.perf_counter() - started, 3),
+        'parallel_jobs': parallel_jobs,
+        'job_workers': job_workers
+    }
+
+
+def write_batch_report(report, report_file):
+    """Сохраняет отчет пакетной сборки в JSON"""
+    directory = os.path.dirname(report_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,67 @@
+"""
+Неизменяемый снимок задания сборки.
+
+Окно программы в потоке Tk собирает все настройки, порядок фотографий,
+повороты и правила подписей в BuildJob и передает его потоку сборки.
+Поток сборки работает только со снимком и не обращается к переменным
+Tk: пользователь может менять настройки во время сборки, а несколько
+документов в разные файлы могут собираться одновременно.
+"""
+import os
+from types import MappingProxyType
+
+from .job import get_image_data_list, run_job
+
+
+def freeze(value):
+    """Возвращает неизменяемую копию настроек: словари только для чтения и кортежи"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class BuildJob:
+    """Снимок задания сборки. После создания не изменяется"""
+    
+    __slots__ = ('config', 'output_file', 'multi_folder_mode')
+    
+    def __init__(self, config):
+        config = freeze(config)
+        object.__setattr__(self, 'config', config)
+        object.__setattr__(self, 'output_file', config.get('word_file', ''))
+        object.__setattr__(self, 'multi_folder_mode',
+                           bool(config.get('multi_folder_mode', False) and config.get('folder_sequence')))
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("Задание сборки нельзя изменить")
+    
+    def __delattr__(self, name):
+        raise AttributeError("Задание сборки нельзя изменить")
+    
+    @property
+    def name(self):
+        """Имя документа для журнала"""
+        return os.path.basename(self.output_file)
+    
+    def describe(self):
+        """Сообщения журнала о режиме сборки"""
+        if not self.multi_folder_mode:
+            return ["🔀 Режим: Одна папка"]
+        
+        messages = ["🔀 Режим: Многопапковый"]
+        if self.config.get('advanced_sort_order'):
+            messages.append("🔀 Используется расширенный порядок сортировки")
+        messages.append(f"📁 Обрабатывается {len(self.config['folder_sequence'])} папок")
+        return messages
+    
+    def get_image_data_list(self):
+        """Составляет список фотографий по снимку (без обращения к окну программы)"""
+        return get_image_data_list(self.config)
+    
+    def run(self, log_callback=None, image_data_list=None, progress_callback=None, cancel_event=None):
+        """Собирает документ, возвращает (успех, путь к файлу или текст ошибки, число фото)"""
+        return run_job(self.config, log_callback, image_data_list, progress_callback, cancel_event)
@@ -0,0 +1,180 @@
+"""
+Манифест сборки для инкрементального пересоздания документа.
+
+Рядом с документом сохраняется файл <документ>.manifest.json, в котором для
+каждой страницы записаны ее входные данные (пути к фото, время изменения,
+размер, поворот, текст подписи, параметры макета), положение разметки страницы
+в word/document.xml и использованные ею изображения. При следующей сборке
+страницы с теми же входными данными берутся из предыдущего документа без
+повторной обработки фотографий.
+"""
+import hashlib
+import json
+import os
+import re
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = '.manifest.json'
+
+# Параметры макета, от которых зависит разметка страницы
+LAYOUT_KEYS = (
+    'image_width', 'image_height', 'images_per_page',
+    'font_family', 'font_size', 'font_bold', 'target_dpi'
+)
+
+
+def get_manifest_path(output_file):
+    """Возвращает путь к манифесту для документа"""
+    return output_file + MANIFEST_SUFFIX
+
+
+def get_photo_inputs(path, rotation, caption):
+    """Собирает входные данные одного фото для ключа страницы"""
+    try:
+        stat = os.stat(path)
+        return [path, stat.st_mtime_ns, stat.st_size, rotation, caption]
+    except OSError:
+        return [path, None, None, rotation, caption]
+
+
+class BuildManifest:
+    """Манифест предыдущей и текущей сборки"""
+    
+    def __init__(self, output_file, config):
+        self.output_file = output_file
+        self.manifest_path = get_manifest_path(output_file)
+        self.layout = [config.get(key) for key in LAYOUT_KEYS]
+        
+        self.previous_pages = []
+        self.previous_body_start = 0
+        self.previous_document = None  # поток word/document.xml, страницы читаются по смещениям
+        self.previous_package = None
+        self.previous_names = set()
+        
+        self.pages = []
+    
+    def load_previous(self):
+        """
+        Загружает манифест и документ предыдущей сборки.
+        Возвращает False, если их нельзя использовать.
+        """
+        if not os.path.exists(self.manifest_path) or not os.path.exists(self.output_file):
+            return False
+        
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            
+            # Документ должен быть тем самым, который описан в манифесте
+            stat = os.stat(self.output_file)
+            if (manifest.get('version') != MANIFEST_VERSION
+                    or manifest.get('output_size') != stat.st_size
+                    or manifest.get('output_mtime') != stat.st_mtime_ns):
+                logger.info("Манифест не соответствует документу, полная пересборка")
+                return False
+            
+            self.previous_package = zipfile.ZipFile(self.output_file)
+            self.previous_names = set(self.previous_package.namelist())
+            self.previous_document = self.previous_package.open('word/document.xml')
+            self.previous_body_start = manifest['body_start']
+            self.previous_pages = manifest['pages']
+            return True
+        except Exception as e:
+            logger.warning(f"Не удалось загрузить манифест {self.manifest_path}: {e}")
+            self.close()
+            return False
+    
+    def close(self):
+        """Закрывает документ предыдущей сборки"""
+        if self.previous_document is not None:
+            self.previous_document.close()
+            self.previous_document = None
+        if self.previous_package is not None:
+            self.previous_package.close()
+            self.previous_package = None
+        self.previous_names = set()
+    
+    def page_key(self, page_index, photo_inputs):
+        """Вычисляет ключ страницы по ее входным данным"""
+        payload = json.dumps([MANIFEST_VERSION, page_index, self.layout, photo_inputs], ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def find_reusable(self, page_index, key):
+        """
+        Возвращает сохраненную страницу предыдущей сборки с тем же ключом:
+        (разметка, изображения, число добавленных фото) или None.
+        """
+        if self.previous_document is None or page_index >= len(self.previous_pages):
+            return None
+        
+        page = self.previous_pages[page_index]
+        if page['key'] != key:
+            return None
+        
+        # Изображения страницы должны быть в предыдущем документе
+        if any('word/' + part_name not in self.previous_names for _, part_name in page['media']):
+            return None
+        
+        # Читаем только разметку этой страницы, не распаковывая документ целиком
+        start = self.previous_body_start + page['start']
+        end = self.previous_body_start + page['end']
+        self.previous_document.seek(start)
+        xml = self.previous_document.read(end - start)
+        
+        return xml, page['media'], page['added']
+    
+    def record_page(self, key, chunk, added):
+        """Запоминает страницу текущей сборки"""
+        start, end, media = chunk
+        self.pages.append({
+            'key': key,
+            'start': start,
+            'end': end,
+            'media': media,
+            'added': added
+        })
+    
+    def save(self, body_start):
+        """Сохраняет манифест текущей сборки рядом с документом"""
+        stat = os.stat(self.output_file)
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'output_size': stat.st_size,
+            'output_mtime': stat.st_mtime_ns,
+            'body_start': body_start,
+            'pages': self.pages
+        }
+        try:
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить манифест {self.manifest_path}: {e}")
+    
+    def remove(self):
+        """Удаляет устаревший манифест"""
+        if os.path.exists(self.manifest_path):
+            try:
+                os.unlink(self.manifest_path)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить манифест {self.manifest_path}: {e}")
+
+
+def renumber_shape_ids(xml, next_id):
+    """
+    Перенумеровывает wp:docPr в разметке страницы, начиная с next_id,
+    чтобы идентификаторы фигур в документе не повторялись.
+    Возвращает (новая разметка, следующий свободный идентификатор).
+    """
+    counter = [next_id]
+    
+    def replace(match):
+        value = counter[0]
+        counter[0] += 1
+        return b'<wp:docPr id="%d"' % value
+    
+    xml = re.sub(rb'<wp:docPr id="\d+"', replace, xml)
+    return xml, counter[0]
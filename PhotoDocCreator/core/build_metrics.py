@@ -0,0 +1,190 @@
+"""
+Метрики сборки документа.
+
+Во время сборки записывается время каждого этапа, время подготовки и
+вставки каждого фото, прочитанные и записанные байты. В конце сборки в
+журнал выводится сводка с самыми медленными фото и причинами (очень
+большое, CMYK, конвертация...), а рядом с документом сохраняется отчет
+<документ>.report.json.
+"""
+import os
+import json
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+REPORT_VERSION = 1
+REPORT_SUFFIX = '.report.json'
+
+# Этапы сборки, время которых измеряется
+STAGES = (
+    'setup',       # документ, заголовки, манифест, способ записи
+    'plan',        # подписи, разбиение на страницы, поиск копий, задания
+    'preprocess',  # ожидание подготовленных изображений
+    'insert',      # вставка изображений и подписей
+    'footer',      # колонтитулы
+    'save'         # сохранение документа
+)
+
+STAGE_LABELS = {
+    'setup': 'подготовка',
+    'plan': 'планирование',
+    'preprocess': 'ожидание фото',
+    'insert': 'вставка',
+    'footer': 'колонтитулы',
+    'save': 'сохранение'
+}
+
+# Названия шагов плана преобразований для журнала
+PLAN_LABELS = {
+    'resize': 'уменьшение',
+    'rotate': 'поворот',
+    'convert': 'конвертация'
+}
+
+# Причины, по которым фото могло обрабатываться долго
+REASON_LABELS = dict(PLAN_LABELS, **{
+    'huge': 'очень большое',
+    'cmyk': 'CMYK',
+    'spilled': 'сброшено на диск',
+    'duplicate': 'копия',
+    'error': 'ошибка'
+})
+
+# Фото от этого размера (в мегапикселях) считаются очень большими
+HUGE_MEGAPIXELS = 24
+
+# Сколько самых медленных фото показывать в журнале и в отчете
+SLOWEST_IN_LOG = 5
+SLOWEST_IN_REPORT = 20
+
+
+def get_report_path(output_file):
+    """Возвращает путь к отчету о сборке для документа"""
+    return output_file + REPORT_SUFFIX
+
+
+def get_photo_reasons(prepared, success):
+    """Причины, по которым фото могло обрабатываться долго"""
+    reasons = []
+    image_size = prepared.get('image_size')
+    if image_size and image_size[0] * image_size[1] >= HUGE_MEGAPIXELS * 1000000:
+        reasons.append('huge')
+    if prepared.get('image_mode') == 'CMYK':
+        reasons.append('cmyk')
+    reasons.extend(prepared.get('plan', []))
+    if prepared.get('data_path'):
+        reasons.append('spilled')
+    if prepared.get('duplicate'):
+        reasons.append('duplicate')
+    if not success:
+        reasons.append('error')
+    return reasons
+
+
+class BuildMetrics:
+    """Метрики одной сборки"""
+    
+    def __init__(self):
+        self.stage_times = dict.fromkeys(STAGES, 0.0)
+        self.photos = []
+        self.reused_photos = 0
+        self.bytes_read = 0
+        self.bytes_embedded = 0
+        self.bytes_written = 0
+        self.total_time = 0.0
+        self.started = time.perf_counter()
+    
+    @contextmanager
+    def stage(self, name):
+        """Засекает время этапа сборки"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.perf_counter() - started
+    
+    def record_photo(self, filename, prepared, insert_time, success):
+        """Записывает метрики одного фото"""
+        photo = {
+            'filename': filename,
+            'path': prepared['path'],
+            'success': success,
+            'prepare_seconds': prepared.get('seconds', 0.0),
+            'insert_seconds': insert_time,
+            'bytes_read': prepared.get('source_bytes', 0),
+            'bytes_embedded': 0 if prepared.get('duplicate') else prepared.get('size', 0),
+            'image_size': prepared.get('image_size'),
+            'image_mode': prepared.get('image_mode'),
+            'reasons': get_photo_reasons(prepared, success)
+        }
+        photo['seconds'] = photo['prepare_seconds'] + photo['insert_seconds']
+        self.photos.append(photo)
+        
+        self.bytes_read += photo['bytes_read']
+        if success:
+            self.bytes_embedded += photo['bytes_embedded']
+    
+    def finish(self, output_file=None):
+        """Завершает замер сборки"""
+        self.total_time = time.perf_counter() - self.started
+        if output_file and os.path.exists(output_file):
+            self.bytes_written = os.path.getsize(output_file)
+    
+    def get_slowest(self, count):
+        """Возвращает самые медленные фото"""
+        return sorted(self.photos, key=lambda photo: photo['seconds'], reverse=True)[:count]
+    
+    def get_summary(self):
+        """Формирует сводку для журнала"""
+        stages = ", ".join(
+            f"{STAGE_LABELS[name]} {self.stage_times[name]:.1f} с"
+            for name in STAGES if self.stage_times[name] >= 0.05
+        )
+        lines = [f"⏱ Время сборки: {self.total_time:.1f} с" + (f" ({stages})" if stages else "")]
+        
+        if self.photos:
+            prepare_time = sum(photo['prepare_seconds'] for photo in self.photos)
+            lines.append(f"⏱ На фото в среднем: подготовка {prepare_time / len(self.photos) * 1000:.0f} мс, "
+                         f"вставка {self.stage_times['insert'] / len(self.photos) * 1000:.0f} мс")
+        
+        lines.append(f"📊 Прочитано {self.bytes_read / 1048576:.1f} МБ, "
+                     f"вставлено изображений {self.bytes_embedded / 1048576:.1f} МБ, "
+                     f"размер документа {self.bytes_written / 1048576:.1f} МБ")
+        
+        slowest = self.get_slowest(SLOWEST_IN_LOG)
+        if len(self.photos) > SLOWEST_IN_LOG:
+            lines.append("🐢 Самые медленные фото:")
+            for photo in slowest:
+                reasons = ", ".join(REASON_LABELS[reason] for reason in photo['reasons'])
+                lines.append(f"   {photo['filename']} - {photo['seconds']:.2f} с" + (f" ({reasons})" if reasons else ""))
+        
+        return lines
+    
+    def to_dict(self):
+        """Отчет о сборке в виде словаря"""
+        return {
+            'version': REPORT_VERSION,
+            'total_seconds': self.total_time,
+            'stages': dict(self.stage_times),
+            'photos': len(self.photos),
+            'reused_photos': self.reused_photos,
+            'bytes_read': self.bytes_read,
+            'bytes_embedded': self.bytes_embedded,
+            'bytes_written': self.bytes_written,
+            'slowest': self.get_slowest(SLOWEST_IN_REPORT),
+            'photo_details': self.photos
+        }
+    
+    def write_report(self, output_file):
+        """Сохраняет отчет рядом с документом, возвращает путь к нему или None"""
+        report_path = get_report_path(output_file)
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            return report_path
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить отчет о сборке {report_path}: {e}")
+            return None
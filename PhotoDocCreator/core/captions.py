@@ -0,0 +1,162 @@
+"""
+Индекс правил подписей.
+
+Правило подписи - (с фото №, по фото №, текст). Правила компилируются
+один раз на сборку в отсортированный список непересекающихся интервалов,
+поэтому подпись фото находится двоичным поиском, а не перебором всех
+правил. Если диапазоны пересекаются, как и раньше действует правило,
+которое стоит в списке раньше; такие пересечения и правила, которые
+никогда не сработают, сообщаются заранее.
+"""
+import os
+import bisect
+
+
+def format_caption(photo_number, text=None):
+    """Формирует подпись фото"""
+    if text is None:
+        return f"Фото № {photo_number}"
+    return f"Фото № {photo_number}. {text}"
+
+
+class RuleIndex:
+    """Скомпилированный набор правил одного уровня: общие правила или правила папки"""
+    
+    def __init__(self, rules, prefix=""):
+        self.prefix = prefix
+        self.problems = []
+        
+        # (с номера, по номер, текст, номер правила в списке)
+        self.rules = []
+        for position, rule in enumerate(rules, 1):
+            if len(rule) < 3:
+                continue
+            start, end, text = rule[0], rule[1], rule[2]
+            if start > end:
+                self.problems.append(f"{prefix}правило {position} ({start}-{end}): начальный номер больше конечного, правило не сработает")
+                continue
+            self.rules.append((start, end, text, position))
+        
+        self._compile()
+        self._find_overlaps()
+    
+    def _compile(self):
+        """Строит непересекающиеся интервалы с текстом действующего правила"""
+        self.starts = []
+        self.ends = []
+        self.texts = []
+        self.positions = positions = []
+        
+        # Между соседними границами все номера покрыты одним и тем же набором правил
+        bounds = sorted({rule[0] for rule in self.rules} | {rule[1] + 1 for rule in self.rules})
+        for low, high in zip(bounds, bounds[1:]):
+            for start, end, text, position in self.rules:
+                if start <= low and high - 1 <= end:
+                    if positions and positions[-1] == position and self.ends[-1] == low - 1:
+                        self.ends[-1] = high - 1
+                    else:
+                        self.starts.append(low)
+                        self.ends.append(high - 1)
+                        self.texts.append(text)
+                        positions.append(position)
+                    break
+        
+        # Правила, которые полностью закрыты правилами выше по списку
+        used = set(positions)
+        for start, end, text, position in self.rules:
+            if position not in used:
+                self.problems.append(f"{self.prefix}правило {position} ({start}-{end}) полностью перекрыто правилами выше и не сработает")
+    
+    def _find_overlaps(self):
+        """Сообщает о пересекающихся диапазонах"""
+        ordered = sorted(self.rules)
+        for index, (start, end, text, position) in enumerate(ordered):
+            for other_start, other_end, other_text, other_position in ordered[index + 1:]:
+                if other_start > end:
+                    break
+                first, second = sorted([(position, start, end), (other_position, other_start, other_end)])
+                low, high = max(start, other_start), min(end, other_end)
+                self.problems.append(
+                    f"{self.prefix}правило {second[0]} ({second[1]}-{second[2]}) пересекается с правилом "
+                    f"{first[0]} ({first[1]}-{first[2]}): для фото {low}-{high} действует правило {first[0]}"
+                )
+    
+    def find(self, number):
+        """Возвращает текст правила для номера или None"""
+        index = bisect.bisect_right(self.starts, number) - 1
+        if index >= 0 and number <= self.ends[index]:
+            return self.texts[index]
+        return None
+    
+    def find_overlap(self, start, end):
+        """Возвращает первое по номерам правило (с, по, текст), действующее в диапазоне start-end, или None"""
+        index = bisect.bisect_left(self.ends, start)
+        if index == len(self.starts) or self.starts[index] > end:
+            return None
+        position = self.positions[index]
+        return next(rule[:3] for rule in self.rules if rule[3] == position)
+    
+    def check_count(self, count):
+        """Сообщает о правилах, начинающихся после последнего из count фото"""
+        return [
+            f"{self.prefix}правило {position} ({start}-{end}) не сработает: всего фото {count}"
+            for start, end, text, position in self.rules
+            if start > count
+        ]
+
+
+class CaptionIndex:
+    """
+    Подписи для всей сборки: правила папки применяются по номеру фото
+    в папке, общие правила - по сквозному номеру.
+    """
+    
+    def __init__(self, caption_rules):
+        self.global_rules = RuleIndex(caption_rules, "Общие правила: ")
+        self.folder_indexes = {}
+    
+    def get_folder_index(self, folder_rules):
+        """Возвращает скомпилированные правила папки (компилируются один раз на список)"""
+        entry = self.folder_indexes.get(id(folder_rules))
+        if entry is None or entry[0] is not folder_rules:
+            entry = (folder_rules, RuleIndex(folder_rules))
+            self.folder_indexes[id(folder_rules)] = entry
+        return entry[1]
+    
+    def get_caption(self, photo_number):
+        """Генерирует подпись для одиночного режима"""
+        return format_caption(photo_number, self.global_rules.find(photo_number))
+    
+    def get_caption_multi(self, photo):
+        """Генерирует подпись для многопапкового режима (photo - PhotoRecord)"""
+        folder_rules = photo.folder.caption_rules
+        
+        # Сначала правила папки по локальному номеру фото
+        if folder_rules:
+            text = self.get_folder_index(folder_rules).find(photo.local_number)
+            if text is not None:
+                return format_caption(photo.global_number, text)
+        
+        return self.get_caption(photo.global_number)
+    
+    def check(self, image_data_list, multi_folder_mode=False):
+        """Возвращает список проблем в правилах для данного набора фотографий"""
+        problems = list(self.global_rules.problems)
+        problems.extend(self.global_rules.check_count(len(image_data_list)))
+        
+        if not multi_folder_mode:
+            return problems
+        
+        # Число фото каждой папки с правилами
+        folders = {}
+        for photo in image_data_list:
+            if photo.folder.caption_rules:
+                folders[photo.folder] = folders.get(photo.folder, 0) + 1
+        
+        for folder, count in folders.items():
+            name = os.path.basename(folder.path) or f"с фото № {folder.start_number}"
+            folder_index = RuleIndex(folder.caption_rules, f"Папка {name}: ")
+            problems.extend(folder_index.problems)
+            problems.extend(folder_index.check_count(count))
+        
+        return problems
@@ -1,65 +1,432 @@
 from docx import Document
 from docx.shared import Cm, Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.image.image import Image as DocxImage
 import os
+import io
+import hashlib
+import uuid
+import shutil
+import time
 import logging
-from PIL import Image
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageFile
 import tempfile
 
+from .docx_writers import DocxWriter, StreamingDocxWriter
+from .build_manifest import BuildManifest, get_photo_inputs
+from .captions import CaptionIndex
+from .build_metrics import BuildMetrics, PLAN_LABELS
+from .photo_records import to_photo_records
+
 logger = logging.getLogger(__name__)
 
+# Разрешаем загрузку усеченных изображений (в том числе в процессах предобработки,
+# которые при запуске через spawn не импортируют utils.file_utils)
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+# Не пересжимаем изображения, которые больше нужного размера меньше чем на 10%
+DOWNSCALE_THRESHOLD = 1.1
+
+# Поля результата предобработки, которые копии фото берут у первого вхождения
+SHARED_RESULT_FIELDS = ('error', 'plan', 'size', 'source_bytes', 'warning')
+
+
+class BuildCancelled(Exception):
+    """Сборка отменена пользователем"""
+
+
+def get_target_pixels(width_cm, height_cm, dpi):
+    """Возвращает размер в пикселях для печати области width×height см с заданным DPI"""
+    return (max(1, round(width_cm / 2.54 * dpi)), max(1, round(height_cm / 2.54 * dpi)))
+
+
+def needs_downscale(size, target_size):
+    """Проверяет, нужно ли уменьшать изображение размера size до target_size"""
+    factor = min(size[0] / target_size[0], size[1] / target_size[1])
+    return factor >= DOWNSCALE_THRESHOLD
+
+
+def downscale_image(img, target_size):
+    """
+    Декодирует и уменьшает только что открытое изображение так, чтобы каждая
+    сторона была не меньше target_size. Для JPEG используется draft()
+    (декодирование в 1/2-1/8 масштаба), для целых коэффициентов - reduce().
+    Палитровые, 1-битные и 16-битные изображения сначала переводятся в режим,
+    с которым работают reduce() и сглаживание LANCZOS.
+    """
+    factor = min(img.width / target_size[0], img.height / target_size[1])
+    wanted = (int(img.width / factor), int(img.height / factor))
+    
+    if img.format == 'JPEG':
+        img.draft(img.mode, wanted)
+        factor = min(img.width / target_size[0], img.height / target_size[1])
+    
+    if img.mode == 'P':
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    elif img.mode == '1':
+        img = img.convert('L')
+    elif img.mode.startswith('I;16'):
+        img = img.convert('I')
+    
+    if int(factor) >= 2:
+        img = img.reduce(int(factor))
+        factor = min(img.width / target_size[0], img.height / target_size[1])
+    
+    if factor >= DOWNSCALE_THRESHOLD:
+        img = img.resize(wanted, Image.Resampling.LANCZOS)
+    
+    return img
+
+
+def hash_file(path):
+    """Вычисляет sha1 содержимого файла"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1048576), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_source(path):
+    """Хеширует исходный файл (в процессе пула); вместо ошибки чтения возвращает None"""
+    try:
+        return hash_file(path), None
+    except OSError as e:
+        return None, str(e)
+
+
+def find_duplicate_sources(paths, map_func=map):
+    """
+    Находит фото с одинаковым содержимым (например, копии одного файла
+    в разных папках). Хешируются только файлы, размер которых совпадает
+    с размером другого файла; map_func позволяет хешировать их в пуле процессов.
+    Возвращает {путь: sha1} для фото, у которых есть копии.
+    """
+    occurrences = {}
+    for path in paths:
+        occurrences[path] = occurrences.get(path, 0) + 1
+    
+    by_size = {}
+    for path in occurrences:
+        try:
+            by_size.setdefault(os.path.getsize(path), []).append(path)
+        except OSError:
+            continue
+    
+    candidates = [
+        path
+        for same_size in by_size.values() if len(same_size) > 1 or occurrences[same_size[0]] > 1
+        for path in same_size
+    ]
+    
+    by_digest = {}
+    for path, (digest, error) in zip(candidates, map_func(hash_source, candidates)):
+        if error:
+            logger.warning(f"Не удалось прочитать файл {path}: {error}")
+            continue
+        by_digest.setdefault(digest, []).append(path)
+    
+    return {
+        path: digest
+        for digest, same_content in by_digest.items()
+        if len(same_content) > 1 or occurrences[same_content[0]] > 1
+        for path in same_content
+    }
+
+
+def get_media_key(digest, rotation):
+    """
+    Ключ подготовленного изображения. Одинаковые исходные байты с одинаковым
+    преобразованием дают одинаковый результат; повороты на 90/180/270° байты
+    не меняют, от них зависит только ориентация размера уменьшения.
+    """
+    variant = rotation % 180 if rotation % 90 == 0 else rotation % 360
+    return f"{digest}:{variant}"
+
+
+def is_docx_compatible(data):
+    """Проверяет по заголовку, сможет ли python-docx вставить изображение"""
+    try:
+        DocxImage.from_blob(data)
+        return True
+    except Exception:
+        return False
+
+
+def prepare_image(task):
+    """Подготавливает одно изображение и засекает время подготовки"""
+    started = time.perf_counter()
+    result = _prepare_image(task)
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def _prepare_image(task):
+    """
+    Подготавливает одно изображение к вставке в документ.
+    Выполняется в процессе-воркере. Заголовок читается один раз, по нему
+    составляется план (уменьшение / поворот / конвертация), и пиксели
+    декодируются не больше одного раза, только если план не пуст.
+    Повороты на 90/180/270° не требуют декодирования: они выполняются
+    при вставке через атрибут rot в a:xfrm, байты файла не меняются.
+    Возвращает словарь с готовыми к вставке байтами или описанием ошибки.
+    """
+    path = task['path']
+    rotation = task.get('rotation', 0)
+    result = {
+        'path': path,
+        'rotation': rotation,
+        'xfrm_rotation': 0,
+        'data': None,
+        'error': None,
+        'plan': [],
+        'decodes': 0,
+        'data_path': None,
+        'size': 0,
+        'source_bytes': 0,
+        'warning': None,
+        'media_key': task.get('media_key'),
+        'duplicate': False,
+        'image_size': None,
+        'image_mode': None,
+        'seconds': 0.0
+    }
+    
+    if task.get('duplicate'):
+        # Копия уже подготовленного фото: в документе будет ссылка на то же изображение
+        result['duplicate'] = True
+        if rotation % 90 == 0:
+            result['xfrm_rotation'] = rotation % 360
+        return result
+    
+    if not os.path.exists(path):
+        result['error'] = 'not_found'
+        return result
+    
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        result['source_bytes'] = len(data)
+        
+        # Читаем только заголовок
+        img = Image.open(io.BytesIO(data))
+    except Exception as e:
+        result['error'] = f"invalid: {e}"
+        return result
+    
+    with img:
+        result['image_size'] = img.size
+        result['image_mode'] = img.mode
+        
+        # Составляем план преобразований
+        target_size = task.get('target_size')
+        if target_size and rotation % 180 == 90:
+            # После поворота на 90° ширина и высота фото меняются местами
+            target_size = (target_size[1], target_size[0])
+        
+        plan = result['plan']
+        if target_size and needs_downscale(img.size, target_size):
+            plan.append('resize')
+        if rotation % 90 == 0:
+            result['xfrm_rotation'] = rotation % 360
+        else:
+            plan.append('rotate')
+        if not is_docx_compatible(data):
+            plan.append('convert')
+        
+        if not plan:
+            # Изображение вставляется как есть, достаточно проверки без декодирования
+            try:
+                img.verify()
+            except Exception as e:
+                result['error'] = f"invalid: {e}"
+                return result
+        else:
+            try:
+                source_format = img.format
+                exif = img.info.get('exif')
+                
+                # Единственное декодирование (draft() для JPEG выполняется до него)
+                if 'resize' in plan:
+                    transformed = downscale_image(img, target_size)
+                else:
+                    img.load()
+                    transformed = img
+                result['decodes'] = 1
+                
+                if 'rotate' in plan:
+                    # Произвольный угол возможен только поворотом пикселей
+                    transformed = transformed.rotate(rotation, expand=True)
+                
+                buffer = io.BytesIO()
+                if source_format == 'PNG' and plan == ['resize']:
+                    # Скриншоты оставляем в PNG, чтобы не размывать текст
+                    transformed.save(buffer, 'PNG', optimize=True)
+                else:
+                    if transformed.mode not in ('RGB', 'L'):
+                        transformed = transformed.convert('RGB')
+                    # EXIF сохраняем только при простом уменьшении, как у исходного файла
+                    exif = exif if plan == ['resize'] else None
+                    transformed.save(buffer, 'JPEG', quality=95, optimize='convert' in plan, exif=exif or b'')
+                data = buffer.getvalue()
+            except Exception as e:
+                if 'convert' in plan:
+                    result['error'] = f"convert: {e}"
+                    return result
+                # Вставляем исходное изображение без преобразований
+                result['warning'] = f"Ошибка обработки: {e}"
+                result['plan'] = []
+    
+    result['size'] = len(data)
+    result['data'] = data
+    return result
+
+
+class MediaMemoryBudget:
+    """
+    Учитывает байты подготовленных изображений, которые ждут вставки в памяти.
+    Изображение, с которым сумма превысила бы лимит, сбрасывается на диск.
+    """
+    
+    def __init__(self, limit, spill_dir):
+        self.limit = limit
+        self.spill_dir = spill_dir
+        self.held = 0
+        self.peak = 0
+        self.admitted = {}  # id(результата) -> байт в памяти
+    
+    def admit(self, result):
+        """Оставляет результат в памяти, если он помещается в лимит, иначе сбрасывает на диск"""
+        if id(result) in self.admitted:
+            return
+        data = result['data']
+        size = len(data) if data else 0
+        
+        if size and self.limit and self.held + size > self.limit:
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                fd, spill_path = tempfile.mkstemp(suffix='.bin', dir=self.spill_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                result['data_path'] = spill_path
+                result['data'] = None
+                size = 0
+            except OSError as e:
+                logger.warning(f"Не удалось сбросить изображение на диск {result['path']}: {e}")
+        
+        self.admitted[id(result)] = size
+        self.held += size
+        self.peak = max(self.peak, self.held)
+    
+    def release(self, result):
+        """Изображение вставлено в документ, его байты больше не учитываются"""
+        self.held -= self.admitted.pop(id(result), 0)
+
+
+def open_prepared_media(prepared):
+    """Возвращает поток с подготовленным изображением (из памяти или с диска)"""
+    if prepared.get('data_path'):
+        with open(prepared['data_path'], 'rb') as f:
+            data = f.read()
+        os.unlink(prepared['data_path'])
+        return io.BytesIO(data)
+    return io.BytesIO(prepared['data'])
+
+
 class DocumentCreator:
     def __init__(self, config):
         self.config = config
         self.doc = None
-        self.temp_files = []  # Для хранения временных файлов
+        self.writer = None
+        self.manifest = None
+        # Метрики последней сборки, время этапов в секундах
+        self.metrics = BuildMetrics()
+        self.stage_times = self.metrics.stage_times
+        # Общая временная папка задания, создается только при нехватке памяти
+        self.spill_dir = os.path.join(tempfile.gettempdir(), f"photodoc_{uuid.uuid4().hex}")
     
-    def __del__(self):
-        """Очистка временных файлов при удалении объекта"""
-        self.cleanup_temp_files()
+    @contextmanager
+    def _stage(self, name):
+        """Засекает время этапа сборки"""
+        with self.metrics.stage(name):
+            yield
     
     def cleanup_temp_files(self):
-        """Удаляет все временные файлы"""
-        for temp_file in self.temp_files:
+        """Удаляет временную папку задания"""
+        if os.path.exists(self.spill_dir):
             try:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
+                shutil.rmtree(self.spill_dir)
             except Exception as e:
-                logger.warning(f"Не удалось удалить временный файл {temp_file}: {e}")
-        self.temp_files = []
+                logger.warning(f"Не удалось удалить временную папку {self.spill_dir}: {e}")
     
-    def create_document(self, image_data_list, log_callback=None):
-        """Создает документ Word с фотографиями"""
+    def create_document(self, image_data_list, log_callback=None, progress_callback=None, cancel_event=None):
+        """
+        Создает документ Word с фотографиями.
+        progress_callback(обработано фото, всего фото, прочитано байт) вызывается
+        после каждого фото. Если установлен cancel_event (threading.Event),
+        сборка останавливается перед следующим фото, документ не сохраняется.
+        """
         try:
             if log_callback:
                 log_callback("🚀 Начало создания документа...")
             
-            # Создаем документ
-            self.doc = Document()
-            self._setup_page_layout()
+            self.metrics = BuildMetrics()
+            self.stage_times = self.metrics.stage_times
             
-            # Добавляем заголовки
-            self._add_titles()
+            with self._stage('setup'):
+                # Создаем документ
+                self.doc = Document()
+                self._setup_page_layout()
+                
+                # Добавляем заголовки
+                self._add_titles()
+                
+                output_file = self.config.get('word_file', 'output.docx')
+                self._ensure_directory_exists(output_file)
+                
+                # Инкрементальная сборка: манифест предыдущей сборки рядом с документом
+                if self.config.get('incremental_build', False):
+                    self.manifest = BuildManifest(output_file, self.config)
+                    if self.manifest.load_previous() and log_callback:
+                        log_callback("♻️ Найдена предыдущая сборка, неизмененные страницы будут взяты из нее")
+                
+                self.writer = self._create_writer(output_file, log_callback)
             
             # Добавляем фотографии
-            added_count = self._add_images(image_data_list, log_callback)
+            added_count = self._add_images(to_photo_records(image_data_list), log_callback, progress_callback, cancel_event)
+            self._check_cancelled(cancel_event)
             
             # Добавляем колонтитулы
-            if self.config.get('enable_footer', True):
-                self._add_footers()
-                if log_callback:
-                    log_callback("✅ Колонтитул добавлен")
-            else:
-                if log_callback:
-                    log_callback("ℹ️ Колонтитул отключен")
+            with self._stage('footer'):
+                if self.config.get('enable_footer', True):
+                    self._add_footers()
+                    if log_callback:
+                        log_callback("✅ Колонтитул добавлен")
+                else:
+                    if log_callback:
+                        log_callback("ℹ️ Колонтитул отключен")
             
             # Сохраняем документ
-            output_file = self.config.get('word_file', 'output.docx')
-            self._ensure_directory_exists(output_file)
-            self.doc.save(output_file)
+            self._check_cancelled(cancel_event)
+            with self._stage('save'):
+                if self.manifest:
+                    self.manifest.close()
+                self.writer.save(output_file)
+                if self.manifest:
+                    self.manifest.save(self.writer.body_start)
             
-            # Очищаем временные файлы
-            self.cleanup_temp_files()
+            # Сводка по времени и объему, отчет рядом с документом
+            self.metrics.finish(output_file)
+            if log_callback:
+                for line in self.metrics.get_summary():
+                    log_callback(line)
+            if self.config.get('run_report', True):
+                report_path = self.metrics.write_report(output_file)
+                if report_path and log_callback:
+                    log_callback(f"📝 Отчет о сборке: {report_path}")
             
             if log_callback:
                 log_callback(f"✅ Готово! Создан документ с {added_count} фотографиями")
@@ -67,13 +434,33 @@ class DocumentCreator:
             
             return True, output_file, added_count
             
+        except BuildCancelled:
+            # Недописанный файл и временные файлы удаляются ниже, прежний документ не меняется
+            if log_callback:
+                log_callback("⛔ Сборка отменена, документ не сохранен")
+            return False, "Сборка отменена", 0
         except Exception as e:
             error_msg = f"❌ Критическая ошибка создания документа: {str(e)}"
             if log_callback:
                 log_callback(error_msg)
             logger.error(error_msg, exc_info=True)
-            self.cleanup_temp_files()
             return False, str(e), 0
+        finally:
+            # Очищаем временные файлы
+            if self.writer:
+                self.writer.close()
+            if self.manifest:
+                self.manifest.close()
+            self.cleanup_temp_files()
+    
+    def _create_writer(self, output_file, log_callback=None):
+        """Выбирает способ записи документа"""
+        # Инкрементальная сборка возможна только при потоковой записи
+        if self.manifest or self.config.get('writer_backend', 'docx') == 'stream':
+            if log_callback:
+                log_callback("💾 Потоковая запись документа")
+            return StreamingDocxWriter(self.doc, output_file)
+        return DocxWriter(self.doc)
     
     def _setup_page_layout(self):
         """Настраивает параметры страницы"""
@@ -106,7 +493,13 @@ class DocumentCreator:
         table_title_paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
         table_title_paragraph.paragraph_format.space_after = Pt(24)
     
-    def _add_images(self, image_data_list, log_callback=None):
+    @staticmethod
+    def _check_cancelled(cancel_event):
+        """Прерывает сборку, если пользователь ее отменил"""
+        if cancel_event is not None and cancel_event.is_set():
+            raise BuildCancelled()
+    
+    def _add_images(self, image_data_list, log_callback=None, progress_callback=None, cancel_event=None):
         """Добавляет изображения в документ"""
         images_per_page = self.config.get('images_per_page', 2)
         image_width = self.config.get('image_width', 6.0)
@@ -116,144 +509,351 @@ class DocumentCreator:
         font_bold = self.config.get('font_bold', False)
         multi_folder_mode = self.config.get('multi_folder_mode', False)
         rotation_info = self.config.get('rotation_info', {})
+        target_dpi = self.config.get('target_dpi', 0)
+        plan_started = time.perf_counter()
         
-        added_count = 0
+        # Размер в пикселях, достаточный для печати с заданным DPI
+        target_size = None
+        if target_dpi:
+            target_size = get_target_pixels(image_width, image_height, target_dpi)
+        
+        # Правила подписей компилируются один раз, проблемы в них сообщаются до сборки
+        caption_index = CaptionIndex(self.config.get('caption_rules', []))
+        if log_callback:
+            for problem in caption_index.check(image_data_list, multi_folder_mode):
+                log_callback(f"⚠️ Подписи: {problem}")
         
-        for i in range(0, len(image_data_list), images_per_page):
-            # Добавляем разрыв страницы (кроме первой)
-            if i > 0:
-                self.doc.add_page_break()
-                for _ in range(2):
-                    self.doc.add_paragraph()
+        # Пути, повороты и подписи определяем заранее, от них зависит содержимое страниц
+        photos = []
+        for photo in image_data_list:
+            img_path = photo.path
             
-            # Добавляем фото на текущую страницу
-            photos_on_this_page = 0
-            for j in range(images_per_page):
-                img_index = i + j
-                if img_index >= len(image_data_list):
-                    break
-                    
-                photo_info = image_data_list[img_index]
-                img_path = photo_info['path']
-                filename = photo_info.get('filename', 'Unknown')
-                
-                # Получаем информацию о повороте
-                rotation = photo_info.get('rotation', 0)
-                if not rotation and img_path in rotation_info:
-                    rotation = rotation_info[img_path]
-                
-                # Получаем подпись
-                if multi_folder_mode:
-                    caption = self._get_caption_multi(photo_info)
-                else:
-                    caption = self._get_caption_single(photo_info)
+            # Получаем информацию о повороте
+            rotation = photo.rotation
+            if not rotation and img_path in rotation_info:
+                rotation = rotation_info[img_path]
+            
+            # Получаем подпись
+            if multi_folder_mode:
+                caption = caption_index.get_caption_multi(photo)
+            else:
+                caption = caption_index.get_caption(photo.global_number)
+            
+            photos.append((photo, img_path, rotation, caption))
+        
+        pages = [photos[i:i + images_per_page] for i in range(0, len(photos), images_per_page)]
+        
+        # Страницы, которые можно взять из предыдущей сборки без изменений
+        page_keys = []
+        reused_pages = {}
+        if self.manifest:
+            for page_index, page in enumerate(pages):
+                photo_inputs = [get_photo_inputs(img_path, rotation, caption) for photo, img_path, rotation, caption in page]
+                key = self.manifest.page_key(page_index, photo_inputs)
+                page_keys.append(key)
+                reusable = self.manifest.find_reusable(page_index, key)
+                if reusable:
+                    reused_pages[page_index] = reusable
+            
+            if log_callback and reused_pages:
+                log_callback(f"♻️ Без изменений страниц: {len(reused_pages)} из {len(pages)}")
+        
+        # Лимит памяти под подготовленные изображения, ожидающие вставки
+        photo_count = sum(len(page) for page_index, page in enumerate(pages) if page_index not in reused_pages)
+        workers = self._get_worker_count(photo_count)
+        memory_budget = MediaMemoryBudget(self.config.get('media_memory_limit_mb', 256) * 1048576, self.spill_dir)
+        executor = self._start_pool(workers, log_callback)
+        
+        # Одинаковые фото подготавливаются и записываются в документ один раз,
+        # файлы-кандидаты хешируются в процессах пула
+        try:
+            duplicate_sources = find_duplicate_sources(
+                (img_path
+                 for page_index, page in enumerate(pages) if page_index not in reused_pages
+                 for photo, img_path, rotation, caption in page),
+                executor.map if executor else map
+            )
+        except BaseException:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        seen_media = set()
+        
+        # Задания для этапа предобработки (только для изменившихся страниц)
+        tasks = []
+        for page_index, page in enumerate(pages):
+            if page_index in reused_pages:
+                continue
+            for page_position, (photo, img_path, rotation, caption) in enumerate(page):
+                task = {
+                    'index': page_index * images_per_page + page_position,
+                    'path': img_path,
+                    'rotation': rotation,
+                    'target_size': target_size
+                }
+                if img_path in duplicate_sources:
+                    media_key = get_media_key(duplicate_sources[img_path], rotation)
+                    task['media_key'] = media_key
+                    task['duplicate'] = media_key in seen_media
+                    seen_media.add(media_key)
+                tasks.append(task)
+        
+        self.stage_times['plan'] += time.perf_counter() - plan_started
+        prepared_images = self._iter_prepared_images(tasks, executor, workers, memory_budget)
+        
+        added_count = 0
+        resized_count = 0
+        decode_counts = {}
+        source_bytes = 0
+        embedded_bytes = 0
+        media_results = {}
+        media_decodes = {}
+        duplicate_count = 0
+        skipped_decodes = 0
+        processed = 0
+        total = len(photos)
+        
+        if progress_callback:
+            progress_callback(0, total, 0)
+        
+        try:
+            for page_index, page in enumerate(pages):
+                self._check_cancelled(cancel_event)
+                if page_index in reused_pages:
+                    xml, media, page_added = reused_pages[page_index]
+                    with self._stage('insert'):
+                        chunk = self.writer.add_page_xml(xml, media, self.manifest.previous_package)
+                    self.manifest.record_page(page_keys[page_index], chunk, page_added)
+                    added_count += page_added
+                    self.metrics.reused_photos += page_added
+                    processed += len(page)
+                    if progress_callback:
+                        progress_callback(processed, total, self.metrics.bytes_read)
+                    continue
                 
-                # Пытаемся добавить изображение
-                success = self._add_single_image(
-                    img_path, filename, image_width, image_height, 
-                    caption, font_family, font_size, font_bold, 
-                    log_callback, rotation
-                )
+                # Добавляем разрыв страницы (кроме первой)
+                if page_index > 0:
+                    self.writer.add_page_break()
+                    for _ in range(2):
+                        self.writer.add_paragraph()
                 
-                if success:
-                    added_count += 1
-                    photos_on_this_page += 1
+                page_added = 0
+                for photo, img_path, rotation, caption in page:
+                    self._check_cancelled(cancel_event)
+                    with self._stage('preprocess'):
+                        prepared = next(prepared_images)
+                    filename = photo.filename
                     
-                    if log_callback:
-                        log_callback(f"✅ Добавлено: {caption}")
-                else:
-                    if log_callback:
-                        log_callback(f"❌ Не удалось добавить: {filename}")
+                    # Копия берет результат предобработки у первого вхождения
+                    if prepared['duplicate']:
+                        prepared.update(media_results[prepared['media_key']])
+                    elif prepared['media_key']:
+                        media_results[prepared['media_key']] = {field: prepared[field] for field in SHARED_RESULT_FIELDS}
+                        media_decodes[prepared['media_key']] = prepared['decodes']
+                    
+                    # Пытаемся добавить изображение
+                    insert_started = time.perf_counter()
+                    with self._stage('insert'):
+                        success = self._add_single_image(
+                            prepared, filename, image_width, image_height, 
+                            caption, font_family, font_size, font_bold, 
+                            log_callback
+                        )
+                    self.metrics.record_photo(filename, prepared, time.perf_counter() - insert_started, success)
+                    processed += 1
+                    if progress_callback:
+                        progress_callback(processed, total, self.metrics.bytes_read)
+                    
+                    if success and prepared['duplicate']:
+                        page_added += 1
+                        duplicate_count += 1
+                        skipped_decodes += media_decodes[prepared['media_key']]
+                        if log_callback:
+                            log_callback(f"✅ Добавлено: {caption} (копия уже добавленного фото)")
+                    elif success:
+                        page_added += 1
+                        if 'resize' in prepared['plan']:
+                            resized_count += 1
+                        decode_counts[prepared['decodes']] = decode_counts.get(prepared['decodes'], 0) + 1
+                        source_bytes += prepared['source_bytes']
+                        embedded_bytes += prepared['size']
+                        
+                        if log_callback:
+                            if prepared['decodes']:
+                                plan_text = ", ".join(PLAN_LABELS[step] for step in prepared['plan'])
+                                log_callback(f"✅ Добавлено: {caption} ({plan_text}; декодирований: {prepared['decodes']})")
+                            else:
+                                log_callback(f"✅ Добавлено: {caption}")
+                    else:
+                        if log_callback:
+                            log_callback(f"❌ Не удалось добавить: {filename}")
+                
+                added_count += page_added
+                with self._stage('insert'):
+                    chunk = self.writer.end_page()
+                if self.manifest:
+                    self.manifest.record_page(page_keys[page_index], chunk, page_added)
+        finally:
+            prepared_images.close()
+            # Генератор мог не начать работу (отмена до первого фото)
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+        
+        if decode_counts and log_callback:
+            stats = ", ".join(f"{count}× - {total} фото" for count, total in sorted(decode_counts.items()))
+            log_callback(f"🔍 Декодирований на фото: {stats}")
+        
+        if duplicate_count and log_callback:
+            log_callback(f"🔗 Повторяющихся фото: {duplicate_count}, подготовлены один раз, "
+                         f"пропущено декодирований и пересжатий: {skipped_decodes}")
+        
+        if resized_count and log_callback:
+            log_callback(f"📉 Уменьшено до {target_dpi} DPI: {resized_count} фото, "
+                         f"{source_bytes / 1048576:.1f} МБ → {embedded_bytes / 1048576:.1f} МБ")
         
         return added_count
     
-    def _convert_image_for_docx(self, image_path):
+    def _get_worker_count(self, task_count):
+        """Определяет число процессов для предобработки"""
+        workers = self.config.get('preprocess_workers', 0)
+        if not workers or workers < 0:
+            workers = os.cpu_count() or 1
+        return max(1, min(workers, task_count))
+    
+    def _start_pool(self, workers, log_callback=None):
+        """Запускает пул процессов предобработки или возвращает None для работы в текущем процессе"""
+        if workers <= 1:
+            return None
+        
+        try:
+            executor = ProcessPoolExecutor(max_workers=workers)
+        except Exception as e:
+            logger.warning(f"Не удалось запустить пул процессов: {e}")
+            return None
+        
+        if log_callback:
+            log_callback(f"⚙️ Предобработка изображений, процессов: {workers}")
+        return executor
+    
+    def _iter_prepared_images(self, tasks, executor, workers, memory_budget):
+        """
+        Выполняет предобработку изображений в пуле процессов executor
+        (без пула - в текущем процессе) и останавливает пул по окончании.
+        Результаты возвращаются в исходном порядке, при этом в работе
+        одновременно находится не больше двух заданий на процесс, а готовые
+        изображения сверх лимита memory_budget сбрасываются на диск.
+        """
+        if executor is None:
+            yield from self._iter_prepared_serial(tasks, memory_budget)
+            return
+        
+        try:
+            task_iter = iter(tasks)
+            pending = deque()
+            for task in task_iter:
+                pending.append(executor.submit(prepare_image, task))
+                if len(pending) >= workers * 2:
+                    break
+            
+            while pending:
+                result = pending.popleft().result()
+                memory_budget.admit(result)
+                next_task = next(task_iter, None)
+                if next_task is not None:
+                    pending.append(executor.submit(prepare_image, next_task))
+                
+                # Готовые результаты, ждущие своей очереди, тоже занимают память
+                for future in pending:
+                    if future.done() and future.exception() is None:
+                        memory_budget.admit(future.result())
+                
+                yield result
+                memory_budget.release(result)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _iter_prepared_serial(self, tasks, memory_budget):
+        """Предобработка в текущем процессе (один процесс или пул недоступен)"""
+        for task in tasks:
+            result = prepare_image(task)
+            memory_budget.admit(result)
+            yield result
+            memory_budget.release(result)
+    
+    def _convert_image_for_docx(self, stream, filename):
         """
-        Конвертирует изображение в формат, совместимый с Word
-        Возвращает путь к временному файлу
+        Конвертирует изображение из потока в формат, совместимый с Word
+        Возвращает поток с JPEG в памяти
         """
         try:
-            with Image.open(image_path) as img:
+            stream.seek(0)
+            with Image.open(stream) as img:
                 # Конвертируем в RGB если нужно
                 if img.mode in ('RGBA', 'P', 'LA', 'CMYK'):
                     img = img.convert('RGB')
                 
-                # Создаем временный файл
-                fd, temp_path = tempfile.mkstemp(suffix='.jpg')
-                os.close(fd)
-                
                 # Сохраняем в JPEG с оптимальным качеством
-                img.save(temp_path, 'JPEG', quality=95, optimize=True)
-                self.temp_files.append(temp_path)
+                buffer = io.BytesIO()
+                img.save(buffer, 'JPEG', quality=95, optimize=True)
+                buffer.seek(0)
                 
-                logger.debug(f"Изображение конвертировано: {image_path} -> {temp_path}")
-                return temp_path
+                logger.debug(f"Изображение конвертировано: {filename}")
+                return buffer
                 
         except Exception as e:
-            logger.error(f"Ошибка конвертации {image_path}: {e}")
+            logger.error(f"Ошибка конвертации {filename}: {e}")
             return None
     
-    def _add_single_image(self, img_path, filename, width, height, caption, font_family, font_size, font_bold, log_callback=None, rotation=0):
-        """Добавляет одно изображение с подписью и поворотом"""
+    def _add_single_image(self, prepared, filename, width, height, caption, font_family, font_size, font_bold, log_callback=None):
+        """Добавляет одно подготовленное изображение с подписью"""
         try:
-            # Проверяем существование файла
-            if not os.path.exists(img_path):
+            # Проверяем результат предобработки
+            error = prepared['error']
+            if error == 'not_found':
                 if log_callback:
                     log_callback(f"❌ Файл не найден: {filename}")
                 return False
-            
-            # Проверяем, что файл является валидным изображением
-            try:
-                with Image.open(img_path) as img:
-                    img.verify()
-            except Exception as e:
+            if error:
                 if log_callback:
-                    log_callback(f"❌ Файл поврежден или не является изображением {filename}: {str(e)}")
+                    log_callback(f"❌ Файл поврежден или не является изображением {filename}: {error}")
                 return False
             
-            # Обработка поворота
-            final_img_path = img_path
-            temp_rotated_path = None
-            
-            if rotation != 0:
-                try:
-                    with Image.open(img_path) as img:
-                        rotated_img = img.rotate(rotation, expand=True)
-                        
-                        # Создаем временный файл для повернутого изображения
-                        fd, temp_rotated_path = tempfile.mkstemp(suffix='.jpg')
-                        os.close(fd)
-                        rotated_img.save(temp_rotated_path, 'JPEG', quality=95)
-                        final_img_path = temp_rotated_path
-                        self.temp_files.append(temp_rotated_path)
-                        
-                        if log_callback:
-                            log_callback(f"↷ Изображение повернуто на {rotation}°: {filename}")
-                except Exception as e:
-                    if log_callback:
-                        log_callback(f"⚠️ Ошибка поворота {filename}: {str(e)}")
+            if prepared['warning'] and log_callback:
+                log_callback(f"⚠️ {prepared['warning']}: {filename}")
+            if prepared['rotation'] and log_callback:
+                log_callback(f"↷ Изображение повернуто на {prepared['rotation']}°: {filename}")
+            if 'convert' in prepared['plan']:
+                logger.debug(f"Изображение {filename} добавлено через конвертацию")
             
             # Добавляем изображение в документ
-            p_image = self.doc.add_paragraph()
+            p_image = self.writer.add_paragraph()
             p_image.alignment = WD_ALIGN_PARAGRAPH.CENTER
             run_image = p_image.add_run()
             
-            # Используем повернутое изображение если есть
+            # При повороте на 90/270° исходная картинка вставляется с переставленными
+            # сторонами, чтобы после поворота занять область width×height
+            xfrm_rotation = prepared['xfrm_rotation']
+            picture_width, picture_height = width, height
+            if xfrm_rotation in (90, 270):
+                picture_width, picture_height = height, width
+            
+            # Для копии фото изображение уже есть в документе
+            media_key = prepared['media_key']
+            stream = None if prepared['duplicate'] else open_prepared_media(prepared)
+            
             success = False
             try:
-                run_image.add_picture(final_img_path, width=Cm(width), height=Cm(height))
+                self.writer.add_picture(run_image, stream, Cm(picture_width), Cm(picture_height), media_key, xfrm_rotation)
                 success = True
             except Exception as e1:
                 logger.warning(f"Прямое добавление не удалось для {filename}: {e1}")
                 
-                # Пробуем через конвертацию
+                # Пробуем через конвертацию подготовленного изображения (поворот и уменьшение уже выполнены)
                 try:
-                    temp_path = self._convert_image_for_docx(final_img_path)
-                    if temp_path and os.path.exists(temp_path):
-                        run_image.add_picture(temp_path, width=Cm(width), height=Cm(height))
+                    converted = self._convert_image_for_docx(stream, filename) if stream else None
+                    if converted:
+                        self.writer.add_picture(run_image, converted, Cm(picture_width), Cm(picture_height), media_key, xfrm_rotation)
                         success = True
-                        if log_callback:
-                            logger.debug(f"Изображение {filename} добавлено через конвертацию")
                     else:
                         if log_callback:
                             log_callback(f"❌ Не удалось конвертировать изображение {filename}")
@@ -263,7 +863,7 @@ class DocumentCreator:
             
             # Добавляем подпись если изображение было успешно добавлено
             if success:
-                p_caption = self.doc.add_paragraph()
+                p_caption = self.writer.add_paragraph()
                 p_caption.alignment = WD_ALIGN_PARAGRAPH.CENTER
                 run_caption = p_caption.add_run(caption)
                 
@@ -274,7 +874,7 @@ class DocumentCreator:
                     run_caption.font.bold = True
                 
                 # Добавляем отступ
-                self.doc.add_paragraph()
+                self.writer.add_paragraph()
                 
                 return True
             
@@ -286,47 +886,6 @@ class DocumentCreator:
             logger.error(f"Ошибка добавления изображения {filename}: {e}", exc_info=True)
             return False
     
-    def _get_caption_single(self, photo_info):
-        """Генерирует подпись для одиночного режима"""
-        photo_number = photo_info['global_number']
-        caption_rules = self.config.get('caption_rules', [])
-        
-        # Проверяем правила подписей
-        for rule in caption_rules:
-            if len(rule) >= 3:
-                start, end, text = rule[0], rule[1], rule[2]
-                if start <= photo_number <= end:
-                    return f"Фото № {photo_number}. {text}"
-        
-        # Если правил нет - стандартная подпись
-        return f"Фото № {photo_number}"
-    
-    def _get_caption_multi(self, photo_info):
-        """Генерирует подпись для многопапкового режима"""
-        photo_number = photo_info['global_number']
-        folder_rules = photo_info.get('folder_rules', [])
-        folder_start = photo_info.get('folder_start_number', 1)
-        
-        # Локальный номер фото в папке
-        local_photo_number = photo_number - folder_start + 1
-        
-        # Сначала проверяем правила папки
-        for rule in folder_rules:
-            if len(rule) >= 3:
-                start, end, text = rule[0], rule[1], rule[2]
-                if start <= local_photo_number <= end:
-                    return f"Фото № {photo_number}. {text}"
-        
-        # Затем общие правила
-        caption_rules = self.config.get('caption_rules', [])
-        for rule in caption_rules:
-            if len(rule) >= 3:
-                start, end, text = rule[0], rule[1], rule[2]
-                if start <= photo_number <= end:
-                    return f"Фото № {photo_number}. {text}"
-        
-        return f"Фото № {photo_number}"
-    
     def _add_footers(self):
         """Добавляет колонтитулы"""
         footer_text = self._generate_footer_text()
@@ -0,0 +1,303 @@
+"""
+Способы записи документа Word.
+
+DocxWriter - обычная запись через python-docx: весь документ вместе со всеми
+изображениями хранится в памяти до сохранения.
+
+StreamingDocxWriter - потоковая запись для очень больших фототаблиц: разметка
+страниц сбрасывается во временный файл, а изображения сразу пишутся в zip,
+поэтому в памяти находится не больше одной страницы. Разметка каждой страницы
+и ее изображения могут быть повторно использованы при следующей сборке.
+"""
+from docx.enum.text import WD_BREAK
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.document import _Body
+from docx.image.image import Image as DocxImage
+from docx.oxml import OxmlElement, parse_xml
+from docx.oxml.ns import nsdecls
+from docx.oxml.shape import CT_Inline
+from docx.shape import InlineShape
+from docx.shared import Emu
+from .build_manifest import renumber_shape_ids
+from lxml import etree
+import hashlib
+import io
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+import logging
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_PART = 'word/document.xml'
+DOCUMENT_RELS_PART = 'word/_rels/document.xml.rels'
+CONTENT_TYPES_PART = '[Content_Types].xml'
+IMAGE_RELATIONSHIP = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/image'
+
+# Уже сжатые форматы не имеет смысла сжимать в zip повторно
+STORED_EXTENSIONS = ('jpg', 'jpeg', 'png', 'gif')
+
+
+def rotate_inline(inline, rotation):
+    """
+    Поворачивает картинку wp:inline средствами DrawingML.
+    rotation задается против часовой стрелки, как в PIL и в сортировщике,
+    а rot в a:xfrm - по часовой стрелке в 1/60000 градуса. a:ext остается
+    размером неповернутой картинки, wp:extent становится размером повернутой
+    области, а на сколько неповернутая картинка выступает за эту область,
+    указывается в wp:effectExtent (значения не могут быть отрицательными).
+    """
+    if not rotation:
+        return
+    
+    xfrm = inline.graphic.graphicData.pic.spPr.xfrm
+    xfrm.set('rot', str((360 - rotation) % 360 * 60000))
+    
+    cx, cy = inline.extent.cx, inline.extent.cy
+    if rotation in (90, 270):
+        inline.extent.cx, inline.extent.cy = cy, cx
+    dx = max(0, (cx - inline.extent.cx) // 2)
+    dy = max(0, (cy - inline.extent.cy) // 2)
+    
+    effect_extent = OxmlElement('wp:effectExtent')
+    effect_extent.set('l', str(dx))
+    effect_extent.set('t', str(dy))
+    effect_extent.set('r', str(dx))
+    effect_extent.set('b', str(dy))
+    inline.extent.addnext(effect_extent)
+
+
+class DocxWriter:
+    """Запись через python-docx, документ целиком хранится в памяти"""
+    
+    def __init__(self, doc):
+        self.doc = doc
+        self.media = {}  # ключ исходного изображения -> ImagePart
+    
+    def add_paragraph(self):
+        """Добавляет пустой абзац"""
+        return self.doc.add_paragraph()
+    
+    def add_page_break(self):
+        """Добавляет разрыв страницы"""
+        self.doc.add_page_break()
+    
+    def add_picture(self, run, stream, width, height, media_key=None, rotation=0):
+        """
+        Вставляет изображение размером width×height, повернутое на rotation
+        градусов, в run и возвращает InlineShape.
+        Если изображение с ключом media_key уже вставлено, stream не читается,
+        а картинка ссылается на уже существующую часть пакета.
+        """
+        if media_key in self.media:
+            image_part = self.media[media_key]
+            rId = run.part.relate_to(image_part, RT.IMAGE)
+            cx, cy = image_part.image.scaled_dimensions(width, height)
+            inline = CT_Inline.new_pic_inline(run.part.next_id, rId, image_part.filename, cx, cy)
+        else:
+            inline = run.part.new_pic_inline(stream, width, height)
+            if media_key is not None:
+                rId = inline.graphic.graphicData.pic.blipFill.blip.embed
+                self.media[media_key] = run.part.related_parts[rId]
+        
+        rotate_inline(inline, rotation)
+        run._r.add_drawing(inline)
+        return InlineShape(inline)
+    
+    def end_page(self):
+        """Отмечает конец страницы (для python-docx ничего не требуется)"""
+        pass
+    
+    def save(self, output_file):
+        """Сохраняет документ"""
+        self.doc.save(output_file)
+    
+    def close(self):
+        """Освобождает ресурсы"""
+        pass
+
+
+class StreamingDocxWriter:
+    """
+    Потоковая запись документа.
+    
+    doc - документ python-docx без фотографий: в нем уже настроены страница,
+    заголовки и колонтитулы. Он сохраняется как основа пакета, а абзацы
+    с фотографиями вставляются в word/document.xml перед w:sectPr.
+    """
+    
+    def __init__(self, doc, output_file):
+        self.doc = doc
+        self.output_file = output_file
+        self.partial_file = output_file + '.partial'
+        self.package = zipfile.ZipFile(self.partial_file, 'w', zipfile.ZIP_DEFLATED)
+        self.body_file = tempfile.TemporaryFile()
+        
+        # Абзацы текущей страницы собираются в отдельном w:body
+        self.page = _Body(parse_xml('<w:body %s/>' % nsdecls('w', 'r', 'wp')), None)
+        
+        self.relationships = {}  # путь внутри word/ -> rId
+        self.media = {}  # ключ исходного изображения -> (путь, DocxImage)
+        self.content_types = {}  # расширение -> тип содержимого
+        self.page_media = []  # изображения текущей страницы: [rId, путь]
+        self.shape_id = 0
+        self.body_start = 0
+    
+    def add_paragraph(self):
+        """Добавляет пустой абзац на текущую страницу"""
+        return self.page.add_paragraph()
+    
+    def add_page_break(self):
+        """Добавляет разрыв страницы"""
+        self.add_paragraph().add_run().add_break(WD_BREAK.PAGE)
+    
+    def add_picture(self, run, stream, width, height, media_key=None, rotation=0):
+        """
+        Записывает изображение в пакет и вставляет ссылку на него в run,
+        картинка поворачивается на rotation градусов.
+        Если изображение с ключом media_key уже записано, stream не читается.
+        """
+        if media_key in self.media:
+            # Байты изображения в памяти не держим, размеры картинки заданы явно
+            part_name, ext, content_type, filename = self.media[media_key]
+            rId = self._add_media(part_name, ext, content_type, None)
+            cx, cy = Emu(width), Emu(height)
+        else:
+            blob = stream.read()
+            image = DocxImage.from_blob(blob)
+            
+            # Имя части определяется содержимым, поэтому его можно переиспользовать
+            digest = hashlib.sha1(blob).hexdigest()[:20]
+            part_name = f"media/image_{digest}.{image.ext}"
+            rId = self._add_media(part_name, image.ext, image.content_type, blob)
+            cx, cy = image.scaled_dimensions(width, height)
+            filename = image.filename
+            if media_key is not None:
+                self.media[media_key] = (part_name, image.ext, image.content_type, filename)
+        
+        self.shape_id += 1
+        inline = CT_Inline.new_pic_inline(self.shape_id, rId, filename, cx, cy)
+        rotate_inline(inline, rotation)
+        run._r.add_drawing(inline)
+        return InlineShape(inline)
+    
+    def end_page(self):
+        """
+        Сбрасывает разметку текущей страницы во временный файл.
+        Возвращает (начало, конец, изображения) страницы в теле документа.
+        """
+        body = self.page._element
+        start = self.body_file.tell()
+        if len(body):
+            xml = etree.tostring(body, encoding='utf-8')
+            xml_start = xml.index(b'>') + 1
+            xml_end = xml.rindex(b'</w:body>')
+            self.body_file.write(xml[xml_start:xml_end])
+            
+            for child in list(body):
+                body.remove(child)
+        
+        media, self.page_media = self.page_media, []
+        return start, self.body_file.tell(), media
+    
+    def add_page_xml(self, xml, media, source):
+        """
+        Добавляет готовую разметку страницы из предыдущей сборки.
+        Изображения страницы копируются из пакета source без обработки.
+        Возвращает (начало, конец, изображения) страницы в теле документа.
+        """
+        self.end_page()
+        
+        for _, part_name in media:
+            if part_name not in self.relationships:
+                blob = source.read('word/' + part_name)
+                image = DocxImage.from_blob(blob)
+                self._add_media(part_name, image.ext, image.content_type, blob)
+        self.page_media = []
+        
+        xml, next_id = renumber_shape_ids(xml, self.shape_id + 1)
+        self.shape_id = next_id - 1
+        
+        start = self.body_file.tell()
+        self.body_file.write(xml)
+        return start, self.body_file.tell(), [list(item) for item in media]
+    
+    def save(self, output_file):
+        """Дописывает в пакет основу документа и переименовывает его в output_file"""
+        self.end_page()
+        
+        # Основа: документ python-docx без фотографий
+        skeleton = io.BytesIO()
+        self.doc.save(skeleton)
+        
+        with zipfile.ZipFile(skeleton) as source:
+            for item in source.infolist():
+                data = source.read(item.filename)
+                if item.filename == DOCUMENT_PART:
+                    self._write_document(data)
+                    continue
+                if item.filename == DOCUMENT_RELS_PART:
+                    data = self._add_relationships(data)
+                elif item.filename == CONTENT_TYPES_PART:
+                    data = self._add_content_types(data)
+                self.package.writestr(item.filename, data)
+        
+        self.package.close()
+        self.body_file.close()
+        os.replace(self.partial_file, output_file)
+    
+    def close(self):
+        """Освобождает ресурсы и удаляет недописанный файл"""
+        if self.package.fp is not None:
+            self.package.close()
+        if not self.body_file.closed:
+            self.body_file.close()
+        if os.path.exists(self.partial_file):
+            try:
+                os.unlink(self.partial_file)
+            except OSError as e:
+                logger.warning(f"Не удалось удалить недописанный файл {self.partial_file}: {e}")
+    
+    def _add_media(self, part_name, ext, content_type, blob):
+        """Записывает изображение в пакет один раз и возвращает его rId"""
+        if part_name not in self.relationships:
+            compress_type = zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+            self.package.writestr('word/' + part_name, blob, compress_type=compress_type)
+            # rId тоже определяется содержимым и не меняется между сборками
+            self.relationships[part_name] = 'rIdImg' + part_name.split('_', 1)[1].split('.', 1)[0]
+            self.content_types.setdefault(ext, content_type)
+        
+        rId = self.relationships[part_name]
+        self.page_media.append([rId, part_name])
+        return rId
+    
+    def _write_document(self, data):
+        """Записывает document.xml, вставляя сохраненные страницы перед w:sectPr"""
+        split_at = data.rindex(b'<w:sectPr')
+        self.body_start = split_at
+        
+        with self.package.open(DOCUMENT_PART, 'w', force_zip64=True) as target:
+            target.write(data[:split_at])
+            self.body_file.seek(0)
+            shutil.copyfileobj(self.body_file, target)
+            target.write(data[split_at:])
+    
+    def _add_relationships(self, data):
+        """Добавляет связи с изображениями в document.xml.rels"""
+        relationships = ''.join(
+            f'<Relationship Id="{rId}" Type="{IMAGE_RELATIONSHIP}" Target="{target}"/>'
+            for target, rId in self.relationships.items()
+        )
+        return data.replace(b'</Relationships>', relationships.encode('utf-8') + b'</Relationships>')
+    
+    def _add_content_types(self, data):
+        """Добавляет типы содержимого для расширений изображений"""
+        existing = set(re.findall(rb'Default Extension="([^"]+)"', data))
+        defaults = ''.join(
+            f'<Default Extension="{ext}" ContentType="{content_type}"/>'
+            for ext, content_type in self.content_types.items()
+            if ext.encode('utf-8') not in existing
+        )
+        return data.replace(b'</Types>', defaults.encode('utf-8') + b'</Types>')
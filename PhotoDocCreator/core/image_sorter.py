@@ -1,8 +1,13 @@
 import tkinter as tk
 from tkinter import ttk
-from PIL import Image, ImageTk
+from PIL import ImageTk
 import os
 
+from .thumbnail_grid import ThumbnailGrid
+from .sort_model import SortModel
+from .thumbnail_cache import make_thumbnail
+from .thumbnail_loader import ThumbnailLoader, get_priority_order
+
 class VisualImageSorter:
     def __init__(self, parent, image_folder):
         self.parent = parent
@@ -10,8 +15,7 @@ class VisualImageSorter:
         self.image_files = []
         self.thumbnails = []
         self.current_order = []
-        self.dragged_item = None
-        self.drag_start_index = None
+        self.loader = None
         
     def sort_images(self):
         """Запускает визуальную сортировку и возвращает новый порядок"""
@@ -21,11 +25,11 @@ class VisualImageSorter:
         self.sort_window.geometry("1000x700")
         self.sort_window.state('zoomed')  # Разворачиваем на весь экран
         
-        # Загружаем изображения
+        # Список изображений (миниатюры загружаются в фоне после открытия окна)
         self.load_images()
         
         if not self.thumbnails:
-            tk.messagebox.showerror("Ошибка", "В папке нет изображений или они не загружаются")
+            tk.messagebox.showerror("Ошибка", "В папке нет изображений")
             self.sort_window.destroy()
             return []
         
@@ -40,21 +44,11 @@ class VisualImageSorter:
         ttk.Label(left_frame, text="Перетащите миниатюры для изменения порядка", 
                  font=("Arial", 10, "bold")).pack(pady=5)
         
-        # Canvas с прокруткой для миниатюр
-        self.canvas = tk.Canvas(left_frame, bg="white")
-        scrollbar = ttk.Scrollbar(left_frame, orient=tk.VERTICAL, command=self.canvas.yview)
-        self.scrollable_frame = ttk.Frame(self.canvas)
-        
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
-        )
-        
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=scrollbar.set)
-        
-        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Сетка миниатюр (рисуются только видимые строки)
+        self.grid = ThumbnailGrid(left_frame, self.get_cell, cell_size=(130, 130),
+                                  on_select=self.on_select, on_move=self.on_move,
+                                  on_render=self.on_visible_changed)
+        self.grid.pack(fill=tk.BOTH, expand=True)
         
         # Правая панель - предпросмотр
         right_frame = ttk.LabelFrame(main_frame, text="Предпросмотр", width=400)
@@ -79,16 +73,20 @@ class VisualImageSorter:
         ttk.Button(button_frame, text="Авто-сортировка по имени", 
                   command=self.auto_sort_by_name).pack(side=tk.RIGHT, padx=5)
         
-        # Отображаем миниатюры
+        # Отображаем заглушки и запускаем загрузку миниатюр
         self.display_thumbnails()
+        self.loader = ThumbnailLoader(self.sort_window, [img['path'] for img in self.thumbnails],
+                                      self.on_thumbnails_loaded)
+        self.loader.start()
         
         # Ждем закрытия окна
         self.parent.wait_window(self.sort_window)
+        self.loader.stop()
         
         return self.current_order
     
     def load_images(self):
-        """Загружает изображения и создает миниатюры"""
+        """Составляет список изображений папки (миниатюры пока не загружены)"""
         if not os.path.exists(self.image_folder):
             return
             
@@ -96,131 +94,66 @@ class VisualImageSorter:
         self.image_files = [f for f in os.listdir(self.image_folder) 
                            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp'))]
         
-        # Создаем миниатюры
-        self.thumbnails = []
-        thumb_size = (120, 90)  # Размер миниатюр
-        
-        for img_file in self.image_files:
-            try:
-                img_path = os.path.join(self.image_folder, img_file)
-                img = Image.open(img_path)
-                img.thumbnail(thumb_size, Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-                self.thumbnails.append({
-                    'filename': img_file,
-                    'thumbnail': photo,
-                    'path': img_path,
-                    'image_obj': img
-                })
-            except Exception as e:
-                print(f"Ошибка загрузки {img_file}: {e}")
-        
         # Начальный порядок
+        self.thumbnails = SortModel({
+            'filename': img_file,
+            'thumbnail': None,
+            'path': os.path.join(self.image_folder, img_file),
+            'image_size': None,
+            'image_mode': None,
+            'image_format': None,
+            'error': None
+        } for img_file in self.image_files)
         self.current_order = [img['filename'] for img in self.thumbnails]
     
     def display_thumbnails(self):
-        """Отображает миниатюры в scrollable_frame"""
-        # Очищаем фрейм
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        # Создаем фреймы для миниатюр
-        self.thumbnail_frames = []
-        
-        for i, thumb_data in enumerate(self.thumbnails):
-            # Фрейм для одной миниатюры
-            thumb_frame = ttk.Frame(self.scrollable_frame, relief="solid", borderwidth=1)
-            thumb_frame.grid(row=i//4, column=i%4, padx=5, pady=5, sticky="w")
-            thumb_frame.config(width=130, height=130)
-            thumb_frame.pack_propagate(False)
-            
-            # Метка с номером
-            number_label = ttk.Label(thumb_frame, text=f"{i+1}", font=("Arial", 8, "bold"))
-            number_label.pack(anchor="nw", padx=2, pady=2)
-            
-            # Изображение
-            img_label = ttk.Label(thumb_frame, image=thumb_data['thumbnail'])
-            img_label.image = thumb_data['thumbnail']  # Сохраняем ссылку
-            img_label.pack(padx=5, pady=2)
-            
-            # Имя файла (обрезаем если длинное)
-            short_name = thumb_data['filename'][:15] + "..." if len(thumb_data['filename']) > 18 else thumb_data['filename']
-            name_label = ttk.Label(thumb_frame, text=short_name, font=("Arial", 8), 
-                                  wraplength=120, justify="center")
-            name_label.pack(padx=2, pady=2)
-            
-            # Привязываем события для перетаскивания
-            self.bind_drag_events(thumb_frame, i)
-            
-            # Привязываем события для предпросмотра
-            img_label.bind("<Button-1>", lambda e, path=thumb_data['path']: self.show_preview(path))
-            name_label.bind("<Button-1>", lambda e, path=thumb_data['path']: self.show_preview(path))
-            
-            self.thumbnail_frames.append(thumb_frame)
-        
-        # Обновляем scrollregion после загрузки всех изображений
-        self.scrollable_frame.update_idletasks()
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        """Перерисовывает сетку миниатюр"""
+        self.grid.set_count(len(self.thumbnails))
     
-    def bind_drag_events(self, widget, index):
-        """Привязывает события перетаскивания к виджету"""
-        widget.bind("<ButtonPress-1>", lambda e: self.on_drag_start(e, index))
-        widget.bind("<B1-Motion>", self.on_drag_motion)
-        widget.bind("<ButtonRelease-1>", self.on_drag_release)
-        
-        # Привязываем ко всем дочерним элементам
-        for child in widget.winfo_children():
-            child.bind("<ButtonPress-1>", lambda e: self.on_drag_start(e, index))
-            child.bind("<B1-Motion>", self.on_drag_motion)
-            child.bind("<ButtonRelease-1>", self.on_drag_release)
+    def get_cell(self, index):
+        """Данные ячейки сетки: номер, миниатюра и имя файла"""
+        thumb_data = self.thumbnails[index]
+        # Имя файла (обрезаем если длинное)
+        short_name = thumb_data['filename'][:15] + "..." if len(thumb_data['filename']) > 18 else thumb_data['filename']
+        if thumb_data['error']:
+            short_name = "⚠ " + short_name
+        return {'title': f"{index+1}", 'image': thumb_data['thumbnail'], 'name': short_name}
     
-    def on_drag_start(self, event, index):
-        """Начало перетаскивания"""
-        self.drag_start_index = index
-        self.dragged_item = self.thumbnail_frames[index]
-        
-        # Визуально выделяем перетаскиваемый элемент
-        self.dragged_item.configure(relief="raised", borderwidth=2)
+    def on_thumbnails_loaded(self, batch):
+        """Готовые миниатюры из фоновой загрузки - обновляем только их ячейки"""
+        changed = []
+        for path, photo, info, error in batch:
+            index = self.thumbnails.position_of(path)
+            thumb_data = self.thumbnails[index]
+            if error is not None:
+                print(f"Ошибка загрузки {thumb_data['filename']}: {error}")
+                thumb_data['error'] = str(error)
+            else:
+                thumb_data['thumbnail'] = photo
+                thumb_data['image_size'], thumb_data['image_mode'], thumb_data['image_format'] = info
+            changed.append(index)
+        self.grid.refresh(changed)
     
-    def on_drag_motion(self, event):
-        """Движение при перетаскивании"""
-        if self.dragged_item is None:
-            return
-            
-        # Находим виджет под курсором
-        widget = event.widget.winfo_containing(event.x_root, event.y_root)
-        
-        # Ищем родительский фрейм миниатюры
-        while widget and widget not in self.thumbnail_frames:
-            widget = widget.master
-        
-        if widget and widget in self.thumbnail_frames:
-            current_index = self.thumbnail_frames.index(widget)
-            if current_index != self.drag_start_index:
-                # Перемещаем элемент в списке
-                dragged_data = self.thumbnails.pop(self.drag_start_index)
-                self.thumbnails.insert(current_index, dragged_data)
-                
-                # Обновляем отображение
-                self.display_thumbnails()
-                
-                # Обновляем начальный индекс
-                self.drag_start_index = current_index
+    def on_visible_changed(self, first, last):
+        """Видимые миниатюры загружаются первыми"""
+        if self.loader is not None:
+            order = get_priority_order(first, last, len(self.thumbnails))
+            self.loader.prioritize([self.thumbnails[index]['path'] for index in order])
+    
+    def on_select(self, index):
+        """Клик по миниатюре - предпросмотр"""
+        self.show_preview(self.thumbnails[index]['path'])
     
-    def on_drag_release(self, event):
-        """Завершение перетаскивания"""
-        if self.dragged_item:
-            self.dragged_item.configure(relief="solid", borderwidth=1)
-            self.dragged_item = None
-            self.drag_start_index = None
+    def on_move(self, source, target):
+        """Перетаскивание: перемещаем фото и перерисовываем только сдвинутые ячейки"""
+        self.grid.refresh_range(*self.thumbnails.move(source, target))
     
     def show_preview(self, image_path):
         """Показывает полноразмерный предпросмотр изображения"""
         try:
-            img = Image.open(image_path)
-            # Масштабируем для предпросмотра
+            # Масштабируем для предпросмотра (JPEG декодируется сразу в уменьшенном виде)
             preview_size = (360, 480)
-            img.thumbnail(preview_size, Image.Resampling.LANCZOS)
+            img, (image_size, _, _) = make_thumbnail(image_path, preview_size)
             photo = ImageTk.PhotoImage(img)
             
             self.preview_canvas.delete("all")
@@ -230,7 +163,7 @@ class VisualImageSorter:
             # Показываем информацию
             file_name = os.path.basename(image_path)
             file_size = os.path.getsize(image_path) // 1024  # KB
-            img_info = f"{file_name}\nРазмер: {file_size} KB\n{img.size[0]}×{img.size[1]}px"
+            img_info = f"{file_name}\nРазмер: {file_size} KB\n{image_size[0]}×{image_size[1]}px"
             
             self.preview_label.config(text=img_info)
             
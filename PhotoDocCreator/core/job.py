@@ -0,0 +1,183 @@
+"""
+Задание на сборку фототаблицы без графического интерфейса.
+
+Общие для окна программы и командной строки шаги: список фотографий
+в режиме одной папки и нескольких папок, настройки для DocumentCreator
+и запуск сборки. Модуль не импортирует tkinter и сортировщики.
+"""
+import os
+import json
+import logging
+
+from .doc_creator import DocumentCreator
+from .photo_records import FolderInfo, PhotoRecord
+from utils.config_manager import ConfigManager
+from utils.file_utils import natural_sort_key, get_image_files
+
+logger = logging.getLogger(__name__)
+
+# Способы сортировки в многопапковом режиме могут быть сохранены подписями из интерфейса
+SORT_METHOD_ALIASES = {
+    "По имени (А-Я)": "name_asc",
+    "По имени (Я-А)": "name_desc",
+    "По дате создания (сначала старые)": "date_asc",
+    "По дате создания (сначала новые)": "date_desc"
+}
+
+# Настройки, которые передаются в DocumentCreator
+DOCUMENT_KEYS = (
+    'word_file', 'image_width', 'image_height', 'images_per_page',
+    'target_dpi', 'writer_backend', 'incremental_build',
+    'department_name', 'photo_table_title',
+    'font_family', 'font_size', 'font_bold',
+    'officer_position', 'footer_department', 'officer_rank', 'officer_name',
+    'enable_footer', 'caption_rules', 'multi_folder_mode',
+    'preprocess_workers', 'media_memory_limit_mb', 'run_report'
+)
+
+
+def make_job_config(job):
+    """Дополняет задание настройками по умолчанию"""
+    config = ConfigManager().default_config.copy()
+    config.update(job)
+    return config
+
+
+def load_job(job_file):
+    """Загружает задание (файл в формате config.json) поверх настроек по умолчанию"""
+    with open(job_file, "r", encoding="utf-8") as f:
+        job = json.load(f)
+    
+    return make_job_config(job)
+
+
+def sort_image_files(folder, image_files, sort_method, manual_sort_order=None):
+    """Сортирует имена файлов папки выбранным способом"""
+    sort_method = SORT_METHOD_ALIASES.get(sort_method, sort_method)
+    
+    if sort_method == "name_asc":
+        image_files.sort(key=natural_sort_key)
+    elif sort_method == "name_desc":
+        image_files.sort(key=natural_sort_key, reverse=True)
+    elif sort_method == "date_asc":
+        image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder, f)))
+    elif sort_method == "date_desc":
+        image_files.sort(key=lambda f: os.path.getctime(os.path.join(folder, f)), reverse=True)
+    elif sort_method == "manual" and manual_sort_order:
+        # Ручная сортировка
+        manual_files = [f for f in manual_sort_order if f in image_files]
+        remaining_files = [f for f in image_files if f not in manual_files]
+        image_files = manual_files + remaining_files
+    else:
+        # По умолчанию - естественная сортировка
+        image_files.sort(key=natural_sort_key)
+    
+    return image_files
+
+
+def get_images_single_folder(folder, sort_method, manual_sort_order=None):
+    """Получает изображения для одиночного режима"""
+    if not folder or not os.path.exists(folder):
+        return []
+    
+    image_files = sort_image_files(folder, get_image_files(folder), sort_method, manual_sort_order)
+    
+    folder_info = FolderInfo(folder)
+    return [PhotoRecord(folder_info, img_file, i) for i, img_file in enumerate(image_files, 1)]
+
+
+def get_sorted_images_multi_folder(folder_path, sort_method):
+    """Возвращает отсортированный список изображений папки для многопапкового режима"""
+    if not os.path.exists(folder_path):
+        return []
+    
+    return sort_image_files(folder_path, get_image_files(folder_path), sort_method)
+
+
+def get_images_multi_folder(folder_sequence, sort_method="name_asc"):
+    """
+    Получение всех изображений из всех папок в правильном порядке.
+    Если для папки не сохранен список файлов, он составляется заново.
+    """
+    all_images = []
+    current_photo_number = 1
+    
+    for folder_data in folder_sequence:
+        folder_path = folder_data['path']
+        image_files = folder_data.get('images')
+        if image_files is None:
+            image_files = get_sorted_images_multi_folder(folder_path, sort_method)
+        
+        # Данные папки хранятся один раз для всех ее фото
+        folder_info = FolderInfo(folder_path, current_photo_number, tuple(folder_data.get('caption_rules', ())))
+        
+        for img_file in image_files:
+            all_images.append(PhotoRecord(folder_info, img_file, current_photo_number))
+            current_photo_number += 1
+    
+    return all_images
+
+
+def get_images_from_advanced_sort(advanced_sort_order, folder_sequence, rotation_info=None):
+    """Получает изображения из расширенного порядка сортировки"""
+    rotation_info = rotation_info or {}
+    image_data_list = []
+    
+    # В расширенном порядке правила папок не применяются, нумерация сквозная
+    folders = [FolderInfo(folder_data['path']) for folder_data in folder_sequence]
+    
+    for i, filename in enumerate(advanced_sort_order, 1):
+        # Находим папку с файлом
+        for folder_info in folders:
+            full_path = os.path.join(folder_info.path, filename)
+            if os.path.exists(full_path):
+                image_data_list.append(PhotoRecord(folder_info, filename, i, rotation_info.get(full_path, 0)))
+                break
+    
+    return image_data_list
+
+
+def get_image_data_list(config):
+    """Составляет список фотографий задания в зависимости от режима"""
+    folder_sequence = config.get('folder_sequence', [])
+    
+    if config.get('multi_folder_mode', False) and folder_sequence:
+        advanced_sort_order = config.get('advanced_sort_order', [])
+        if advanced_sort_order:
+            return get_images_from_advanced_sort(advanced_sort_order, folder_sequence, config.get('rotation_info', {}))
+        return get_images_multi_folder(folder_sequence, config.get('multi_folder_sort_method', 'name_asc'))
+    
+    return get_images_single_folder(
+        config.get('screenshots_folder', ''),
+        config.get('sort_method', 'name_asc'),
+        config.get('manual_sort_order', [])
+    )
+
+
+def get_document_config(config):
+    """Выбирает из настроек задания то, что нужно DocumentCreator"""
+    document_config = {key: config[key] for key in DOCUMENT_KEYS if key in config}
+    document_config['rotation_info'] = config.get('rotation_info', {})
+    return document_config
+
+
+def run_job(config, log_callback=None, image_data_list=None, progress_callback=None, cancel_event=None):
+    """
+    Собирает документ по заданию. Если список фотографий не передан,
+    он составляется по настройкам задания. progress_callback и cancel_event
+    передаются в DocumentCreator.create_document.
+    Возвращает (успех, путь к файлу или текст ошибки, число фото).
+    """
+    if not config.get('word_file'):
+        return False, "Не указан файл для сохранения", 0
+    
+    if image_data_list is None:
+        image_data_list = get_image_data_list(config)
+    if not image_data_list:
+        return False, "Нет изображений для обработки", 0
+    
+    if log_callback:
+        log_callback(f"📁 Найдено {len(image_data_list)} изображений")
+    
+    doc_creator = DocumentCreator(get_document_config(config))
+    return doc_creator.create_document(image_data_list, log_callback, progress_callback, cancel_event)
@@ -0,0 +1,96 @@
+"""
+Клиент сервера сборки (core/job_server.py).
+
+Отправляет задание, следит за ходом сборки и скачивает готовый документ.
+Используется командой python -m PhotoDocCreator submit и для проверки
+сервера на одной машине.
+"""
+import os
+import json
+import time
+import shutil
+import logging
+from urllib.request import Request, urlopen
+from urllib.error import HTTPError
+
+logger = logging.getLogger(__name__)
+
+
+class JobClientError(Exception):
+    """Ошибка обращения к серверу сборки"""
+
+
+class JobClient:
+    """Клиент сервера сборки"""
+    
+    def __init__(self, server_url, timeout=30):
+        self.server_url = server_url.rstrip('/')
+        self.timeout = timeout
+    
+    def submit(self, job):
+        """Отправляет задание и возвращает его идентификатор"""
+        return self._request('POST', '/jobs', job)['id']
+    
+    def status(self, job_id):
+        """Возвращает состояние задания"""
+        return self._request('GET', f'/jobs/{job_id}')
+    
+    def list(self):
+        """Возвращает состояние всех заданий сервера"""
+        return self._request('GET', '/jobs')['jobs']
+    
+    def remove(self, job_id):
+        """Удаляет завершенное задание на сервере"""
+        self._request('DELETE', f'/jobs/{job_id}')
+    
+    def wait(self, job_id, poll_interval=0.5, progress_callback=None, timeout=None):
+        """
+        Ждет завершения задания и возвращает его итоговое состояние.
+        progress_callback получает состояние при каждом опросе.
+        """
+        started = time.monotonic()
+        while True:
+            state = self.status(job_id)
+            if progress_callback:
+                progress_callback(state)
+            if state['status'] in ('done', 'failed'):
+                return state
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise JobClientError(f"Задание {job_id} не завершилось за {timeout} с")
+            time.sleep(poll_interval)
+    
+    def download(self, job_id, output_file):
+        """Скачивает готовый документ задания в output_file"""
+        directory = os.path.dirname(output_file)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        with self._open('GET', f'/jobs/{job_id}/document') as response:
+            with open(output_file, 'wb') as f:
+                shutil.copyfileobj(response, f)
+        return output_file
+    
+    def _open(self, method, path, data=None):
+        """Выполняет запрос и возвращает ответ сервера"""
+        body = None
+        headers = {}
+        if data is not None:
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+        
+        request = Request(self.server_url + path, data=body, headers=headers, method=method)
+        try:
+            return urlopen(request, timeout=self.timeout)
+        except HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error', e.reason)
+            except ValueError:
+                message = e.reason
+            raise JobClientError(f"{method} {path}: {e.code} {message}") from e
+        except OSError as e:
+            raise JobClientError(f"Сервер сборки недоступен ({self.server_url}): {e}") from e
+    
+    def _request(self, method, path, data=None):
+        """Выполняет запрос и возвращает ответ в виде JSON"""
+        with self._open(method, path, data) as response:
+            return json.loads(response.read().decode('utf-8'))
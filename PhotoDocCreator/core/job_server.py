@@ -0,0 +1,365 @@
+"""
+Локальный сервер сборки фототаблиц.
+
+Рабочие места отправляют задания на одну мощную машину по HTTP, сервер
+ставит их в очередь и собирает в пуле процессов фиксированного размера.
+    
+    POST   /jobs                 - задание в формате config.json, ответ {"id": ...}
+    GET    /jobs                 - состояние всех заданий
+    GET    /jobs/<id>            - состояние и ход сборки задания
+    GET    /jobs/<id>/document   - готовый документ
+    DELETE /jobs/<id>            - удалить завершенное задание и его документ
+
+Пути к фотографиям в задании должны быть доступны серверу (например,
+общая сетевая папка). Документ сохраняется в папке сервера, word_file
+из задания задает только имя файла.
+
+Авторизации нет: любой, кто может подключиться к серверу, читает через
+задания папки сервера и создает в нем документы. По умолчанию сервер
+слушает только 127.0.0.1.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import quote
+
+from .job import make_job_config, get_image_data_list, run_job
+from .batch import plan_worker_budget
+
+logger = logging.getLogger(__name__)
+
+DOCX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+# Задание больше этого размера не принимается
+MAX_JOB_SIZE = 10 * 1048576
+
+# Сколько последних сообщений журнала хранится для каждого задания
+LOG_TAIL = 20
+
+# Адреса, на которых сервер недоступен из сети
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+# Очередь хода сборки в процессах пула
+_progress_queue = None
+
+
+def init_job_worker(progress_queue):
+    """Инициализирует процесс пула сервера"""
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def run_server_job(job_id, config):
+    """
+    Собирает документ задания сервера. Выполняется в процессе пула,
+    ход сборки отправляется серверу через очередь.
+    """
+    def report(kind, **fields):
+        _progress_queue.put((job_id, kind, fields))
+    
+    started = time.perf_counter()
+    try:
+        image_data_list = get_image_data_list(config)
+        report('started', total=len(image_data_list))
+        
+        def log_callback(message):
+            report('log', message=message)
+        
+        def progress_callback(done, total, bytes_read):
+            report('progress', processed=done)
+        
+        success, result, count = run_job(config, log_callback, image_data_list, progress_callback)
+    except Exception as e:
+        logger.error(f"Ошибка сборки задания {job_id}: {e}", exc_info=True)
+        success, result, count = False, str(e), 0
+    
+    return {
+        'success': success,
+        'error': None if success else result,
+        'photos': count,
+        'size': os.path.getsize(result) if success else 0,
+        'seconds': round(time.perf_counter() - started, 3)
+    }
+
+
+def hide_output_path(message, state):
+    """Заменяет в сообщении путь документа на сервере именем файла"""
+    if not message:
+        return message
+    return message.replace(state['output'], state['filename'])
+
+
+class JobServer:
+    """Очередь заданий и пул процессов сборки"""
+    
+    def __init__(self, output_dir, workers=2, total_workers=0):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+        
+        self.jobs = {}
+        self.lock = threading.Lock()
+        
+        # Процессы предобработки делятся между одновременно собираемыми заданиями
+        self.workers, self.job_workers = plan_worker_budget(workers, total_workers, workers)
+        
+        self.progress_queue = multiprocessing.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_job_worker,
+            initargs=(self.progress_queue,)
+        )
+        self.listener = threading.Thread(target=self._listen_progress, daemon=True)
+        self.listener.start()
+    
+    def submit(self, job):
+        """Ставит задание в очередь и возвращает его состояние"""
+        job_id = uuid.uuid4().hex[:12]
+        config = make_job_config(job)
+        
+        # Документ всегда сохраняется на сервере, в папке задания
+        filename = os.path.basename(config.get('word_file', '')) or 'phototable.docx'
+        if not filename.lower().endswith('.docx'):
+            filename += '.docx'
+        config['word_file'] = os.path.join(self.output_dir, job_id, filename)
+        config['preprocess_workers'] = self.job_workers
+        # Предыдущей сборки на сервере нет
+        config['incremental_build'] = False
+        
+        state = {
+            'id': job_id,
+            'name': job.get('name') or os.path.splitext(filename)[0],
+            'status': 'queued',
+            'submitted': time.time(),
+            'started': None,
+            'finished': None,
+            'total': None,
+            'processed': 0,
+            'progress': 0.0,
+            'log': [],
+            'output': config['word_file'],
+            'filename': filename,
+            'photos': 0,
+            'size': 0,
+            'seconds': None,
+            'error': None
+        }
+        with self.lock:
+            self.jobs[job_id] = state
+        
+        future = self.executor.submit(run_server_job, job_id, config)
+        future.add_done_callback(lambda done: self._on_done(job_id, done))
+        logger.info(f"Задание {job_id} поставлено в очередь")
+        return self.get(job_id)
+    
+    def get(self, job_id):
+        """Возвращает копию состояния задания или None"""
+        with self.lock:
+            state = self.jobs.get(job_id)
+            if state is None:
+                return None
+            state = dict(state, log=list(state['log']))
+        
+        # Путь на сервере клиенту не нужен (в журнале и ошибке он заменен именем файла)
+        state.pop('output')
+        return state
+    
+    def list(self):
+        """Возвращает состояние всех заданий в порядке поступления"""
+        with self.lock:
+            job_ids = list(self.jobs)
+        return [self.get(job_id) for job_id in job_ids]
+    
+    def get_document(self, job_id):
+        """Возвращает (путь, имя файла) готового документа или None"""
+        with self.lock:
+            state = self.jobs.get(job_id)
+            if state is None or state['status'] != 'done':
+                return None
+            return state['output'], state['filename']
+    
+    def remove(self, job_id):
+        """Удаляет завершенное задание и его документ. Возвращает False, если задание еще выполняется"""
+        with self.lock:
+            state = self.jobs.get(job_id)
+            if state is None or state['status'] in ('queued', 'running'):
+                return False
+            del self.jobs[job_id]
+        
+        shutil.rmtree(os.path.dirname(state['output']), ignore_errors=True)
+        return True
+    
+    def shutdown(self):
+        """Останавливает пул и поток хода сборки"""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.progress_queue.put(None)
+        self.listener.join()
+    
+    def _listen_progress(self):
+        """Переносит ход сборки из процессов пула в состояние заданий"""
+        while True:
+            item = self.progress_queue.get()
+            if item is None:
+                return
+            
+            job_id, kind, fields = item
+            with self.lock:
+                state = self.jobs.get(job_id)
+                if state is None:
+                    continue
+                if kind == 'started':
+                    state['started'] = time.time()
+                    state['total'] = fields['total']
+                    # Результат сборки мог прийти раньше последних сообщений очереди
+                    if state['status'] == 'queued':
+                        state['status'] = 'running'
+                elif kind == 'log':
+                    message = hide_output_path(fields['message'], state)
+                    state['log'] = (state['log'] + [message])[-LOG_TAIL:]
+                elif kind == 'progress':
+                    state['processed'] = fields['processed']
+                if state['status'] == 'running' and state['total']:
+                    state['progress'] = round(min(1.0, state['processed'] / state['total']), 3)
+    
+    def _on_done(self, job_id, future):
+        """Записывает результат сборки задания"""
+        try:
+            result = future.result()
+        except Exception as e:
+            # Процесс сборки завершился аварийно или задание отменено
+            result = {'success': False, 'error': str(e) or type(e).__name__, 'photos': 0, 'size': 0, 'seconds': None}
+        
+        with self.lock:
+            state = self.jobs.get(job_id)
+            if state is None:
+                return
+            state.update({
+                'status': 'done' if result['success'] else 'failed',
+                'finished': time.time(),
+                'photos': result['photos'],
+                'size': result['size'],
+                'seconds': result['seconds'],
+                'error': hide_output_path(result['error'], state)
+            })
+            if result['success']:
+                state['progress'] = 1.0
+        
+        logger.info(f"Задание {job_id} завершено: {'успешно' if result['success'] else result['error']}")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик HTTP-запросов сервера сборки"""
+    
+    def do_GET(self):
+        parts = self._get_path_parts()
+        job_server = self.server.job_server
+        
+        if parts == ['jobs']:
+            self._send_json(200, {'jobs': job_server.list()})
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            state = job_server.get(parts[1])
+            if state is None:
+                self._send_json(404, {'error': "Задание не найдено"})
+            else:
+                self._send_json(200, state)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'document':
+            document = job_server.get_document(parts[1])
+            if document is None:
+                self._send_json(409, {'error': "Документ не готов: задание не найдено, выполняется или завершилось с ошибкой"})
+            else:
+                self._send_file(*document)
+        else:
+            self._send_json(404, {'error': "Неизвестный адрес"})
+    
+    def do_POST(self):
+        if self._get_path_parts() != ['jobs']:
+            self._send_json(404, {'error': "Неизвестный адрес"})
+            return
+        
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_JOB_SIZE:
+            self._send_json(413, {'error': "Слишком большое задание"})
+            return
+        
+        try:
+            job = json.loads(self.rfile.read(length).decode('utf-8'))
+            if not isinstance(job, dict):
+                raise ValueError("задание должно быть объектом JSON")
+        except ValueError as e:
+            self._send_json(400, {'error': f"Некорректное задание: {e}"})
+            return
+        
+        self._send_json(202, self.server.job_server.submit(job))
+    
+    def do_DELETE(self):
+        parts = self._get_path_parts()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self._send_json(404, {'error': "Неизвестный адрес"})
+        elif self.server.job_server.remove(parts[1]):
+            self._send_json(200, {'id': parts[1]})
+        else:
+            self._send_json(409, {'error': "Задание не найдено или еще выполняется"})
+    
+    def log_message(self, format, *args):
+        """Запросы пишутся в журнал приложения, а не в stderr"""
+        logger.debug(f"{self.address_string()} - {format % args}")
+    
+    def _get_path_parts(self):
+        """Разбивает путь запроса на части без параметров"""
+        return [part for part in self.path.split('?', 1)[0].split('/') if part]
+    
+    def _send_json(self, status, data):
+        """Отправляет ответ в формате JSON"""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_file(self, path, filename):
+        """Отправляет готовый документ"""
+        self.send_response(200)
+        self.send_header('Content-Type', DOCX_CONTENT_TYPE)
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(filename)}")
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+
+class JobHTTPServer(ThreadingHTTPServer):
+    """HTTP-сервер с очередью заданий"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address, job_server):
+        self.job_server = job_server
+        super().__init__(address, JobRequestHandler)
+
+
+def serve(host, port, output_dir, workers=2, total_workers=0, log_callback=None):
+    """Запускает сервер сборки и обслуживает запросы до прерывания"""
+    job_server = JobServer(output_dir, workers, total_workers)
+    http_server = JobHTTPServer((host, port), job_server)
+    
+    if log_callback:
+        log_callback(f"🌐 Сервер сборки: http://{host}:{http_server.server_port}/jobs, "
+                     f"процессов сборки: {job_server.workers}, предобработки на задание: {job_server.job_workers}")
+        if host not in LOCAL_HOSTS:
+            log_callback("⚠️ Сервер доступен из сети без авторизации: любой, кто подключится, "
+                         "сможет читать папки этой машины через задания")
+    
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        job_server.shutdown()
@@ -0,0 +1,76 @@
+"""
+Журнал сборки в окне программы.
+
+Сообщения могут приходить из любого потока: они складываются в очередь,
+а поток Tk забирает их пачками по таймеру after() и вставляет в текстовое
+поле одной операцией. Так сборка не ждет перерисовки окна на каждой
+строке, а к виджетам Tk обращается только главный поток. Число строк в
+поле ограничено, старые строки удаляются.
+"""
+import queue
+import tkinter as tk
+
+# Период вывода накопленных сообщений (примерно 20 кадров в секунду)
+FLUSH_INTERVAL_MS = 50
+
+# Сколько строк хранить в поле журнала
+MAX_LINES = 5000
+
+# Старые строки удаляются пачкой, когда их набирается на столько больше лимита
+TRIM_SLACK = 500
+
+# Сколько сообщений выводить за один кадр, чтобы не блокировать окно
+MAX_BATCH = 2000
+
+
+class LogSink:
+    """Потокобезопасный вывод сообщений в текстовое поле журнала"""
+    
+    def __init__(self, root, text_widget, max_lines=MAX_LINES, interval_ms=FLUSH_INTERVAL_MS):
+        self.root = root
+        self.text_widget = text_widget
+        self.max_lines = max_lines
+        self.interval_ms = interval_ms
+        self.messages = queue.SimpleQueue()
+        self.root.after(self.interval_ms, self._flush)
+    
+    def write(self, message):
+        """Добавляет сообщение в очередь (можно вызывать из любого потока)"""
+        self.messages.put(message)
+    
+    def clear(self):
+        """Очищает журнал и еще не выведенные сообщения (только из потока Tk)"""
+        self._take_batch(None)
+        self.text_widget.delete(1.0, tk.END)
+    
+    def _take_batch(self, limit):
+        """Забирает из очереди не больше limit сообщений"""
+        batch = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self.messages.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+    
+    def _flush(self):
+        """Выводит накопленные сообщения одной вставкой"""
+        try:
+            batch = self._take_batch(MAX_BATCH)
+            if batch:
+                # Прокручиваем вниз, только если пользователь не листает журнал
+                at_end = self.text_widget.yview()[1] >= 1.0
+                self.text_widget.insert(tk.END, "\n".join(batch) + "\n")
+                self._trim()
+                if at_end:
+                    self.text_widget.see(tk.END)
+            self.root.after(self.interval_ms, self._flush)
+        except tk.TclError:
+            # Окно закрыто
+            pass
+    
+    def _trim(self):
+        """Удаляет старые строки сверх лимита"""
+        line_count = int(self.text_widget.index('end-1c').split('.')[0])
+        if line_count > self.max_lines + TRIM_SLACK:
+            self.text_widget.delete(1.0, f"{line_count - self.max_lines + 1}.0")
@@ -0,0 +1,68 @@
+"""
+Компактные записи о фотографиях задания.
+
+Вместо словаря на каждое фото (path, filename, global_number, folder_rules,
+folder_start_number, rotation) используется PhotoRecord со __slots__.
+Данные папки - путь, номер первого фото и правила подписей - хранятся
+один раз в FolderInfo, а запись фото ссылается на него. Полный путь к
+файлу собирается из пути папки и имени файла.
+"""
+import os
+
+
+class FolderInfo:
+    """Общие данные папки для всех ее фотографий"""
+    
+    __slots__ = ('path', 'start_number', 'caption_rules')
+    
+    def __init__(self, path, start_number=1, caption_rules=()):
+        self.path = path
+        self.start_number = start_number
+        self.caption_rules = caption_rules
+
+
+class PhotoRecord:
+    """Одно фото задания"""
+    
+    __slots__ = ('folder', 'filename', 'global_number', 'rotation')
+    
+    def __init__(self, folder, filename, global_number, rotation=0):
+        self.folder = folder
+        self.filename = filename
+        self.global_number = global_number
+        self.rotation = rotation
+    
+    @property
+    def path(self):
+        """Полный путь к файлу"""
+        return os.path.join(self.folder.path, self.filename)
+    
+    @property
+    def local_number(self):
+        """Номер фото внутри папки"""
+        return self.global_number - self.folder.start_number + 1
+
+
+def to_photo_records(image_data_list):
+    """
+    Приводит список фотографий к PhotoRecord. Словари в прежнем формате
+    тоже принимаются; фото одной папки с одинаковыми правилами получают
+    общий FolderInfo.
+    """
+    folders = {}
+    records = []
+    for item in image_data_list:
+        if isinstance(item, PhotoRecord):
+            records.append(item)
+            continue
+        
+        path = item['path']
+        folder_path = os.path.dirname(path)
+        caption_rules = tuple(tuple(rule) for rule in item.get('folder_rules', ()))
+        key = (folder_path, item.get('folder_start_number', 1), caption_rules)
+        folder = folders.get(key)
+        if folder is None:
+            folder = folders[key] = FolderInfo(folder_path, key[1], caption_rules)
+        
+        records.append(PhotoRecord(folder, os.path.basename(path), item['global_number'], item.get('rotation', 0)))
+    return records
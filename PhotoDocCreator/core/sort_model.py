@@ -0,0 +1,52 @@
+"""
+Порядок фотографий в окне сортировки.
+
+Хранит список фото и словарь "ключ фото -> позиция". Перемещение фото
+обновляет позиции только между старым и новым местом и возвращает этот
+диапазон, чтобы сетка перерисовала лишь изменившиеся ячейки. Позицию фото
+по ключу (например, выбранного для поворота) можно узнать без поиска по
+списку.
+"""
+
+
+class SortModel:
+    """Упорядоченный список фото с быстрым поиском позиции"""
+    
+    def __init__(self, items=(), key=lambda item: item['path']):
+        self.key = key
+        self.items = list(items)
+        self.positions = {}
+        self._update_positions(0, len(self.items))
+    
+    def __len__(self):
+        return len(self.items)
+    
+    def __getitem__(self, position):
+        return self.items[position]
+    
+    def __iter__(self):
+        return iter(self.items)
+    
+    def position_of(self, key):
+        """Позиция фото по ключу или None"""
+        return self.positions.get(key)
+    
+    def move(self, source, target):
+        """
+        Перемещает фото с позиции source на target.
+        Возвращает диапазон (начало, конец + 1) позиций, которые изменились.
+        """
+        item = self.items.pop(source)
+        self.items.insert(target, item)
+        start, stop = min(source, target), max(source, target) + 1
+        self._update_positions(start, stop)
+        return start, stop
+    
+    def sort(self, key):
+        """Сортирует фото, все позиции пересчитываются"""
+        self.items.sort(key=key)
+        self._update_positions(0, len(self.items))
+    
+    def _update_positions(self, start, stop):
+        for position in range(start, stop):
+            self.positions[self.key(self.items[position])] = position
\ No newline at end of file
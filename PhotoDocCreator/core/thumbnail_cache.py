@@ -0,0 +1,339 @@
+"""
+Постоянный кэш миниатюр для окон сортировки.
+
+Миниатюры хранятся в папке кэша пользователя в одном файле-атласе,
+разбитом на ячейки фиксированного размера (120×90 пикселей RGB). Файл
+отображается в память (mmap), поэтому миниатюра из кэша читается без
+декодирования исходного фото. Рядом лежит индекс thumbnails.index.json:
+для каждого пути записаны размер и время изменения файла, номер ячейки
+и сведения об исходном изображении. Если файл изменился, миниатюра
+создается заново в той же ячейке. Число ячеек ограничено; когда место
+заканчивается, вытесняются давно не использованные миниатюры.
+
+Новые миниатюры создаются быстрым путем: для JPEG берется миниатюра,
+встроенная камерой в EXIF, если она не меньше нужной, иначе фото
+декодируется сразу в уменьшенном масштабе (draft). PNG и BMP
+уменьшаются как обычно.
+"""
+import io
+import os
+import sys
+import json
+import mmap
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ExifTags
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+ATLAS_FILE = 'thumbnails.atlas'
+INDEX_FILE = 'thumbnails.index.json'
+
+# Размер миниатюр сортировщика
+THUMB_SIZE = (120, 90)
+
+# Ограничение размера атласа по умолчанию
+CACHE_LIMIT_MB = 200
+
+# На сколько ячеек атлас увеличивается за раз
+GROW_SLOTS = 256
+
+# Теги EXIF со смещением и длиной встроенной миниатюры JPEG
+EXIF_THUMBNAIL_OFFSET = 0x0201
+EXIF_THUMBNAIL_LENGTH = 0x0202
+
+# Допустимое расхождение пропорций миниатюры EXIF и фото (иначе у нее могут быть черные полосы)
+EXIF_ASPECT_TOLERANCE = 0.02
+
+
+def get_cache_dir():
+    """Папка кэша миниатюр текущего пользователя"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'PhotoDocCreator', 'thumbnails')
+
+
+def to_rgb(image):
+    """Переводит миниатюру в RGB; прозрачные области становятся белыми"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def get_fitted_size(image_size, size):
+    """Размер изображения, вписанного в size с сохранением пропорций"""
+    factor = min(size[0] / image_size[0], size[1] / image_size[1], 1)
+    return max(1, round(image_size[0] * factor)), max(1, round(image_size[1] * factor))
+
+
+def read_exif_thumbnail(img, size):
+    """
+    Встроенная в EXIF миниатюра открытого JPEG, если она не меньше, чем фото,
+    вписанное в size, и с теми же пропорциями. Иначе None.
+    """
+    try:
+        ifd = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+        offset, length = ifd.get(EXIF_THUMBNAIL_OFFSET), ifd.get(EXIF_THUMBNAIL_LENGTH)
+        if not offset or not length:
+            return None
+        
+        # Смещения отсчитываются от заголовка TIFF, который идет после "Exif\0\0"
+        data = img.info.get('exif', b'')
+        if data.startswith(b'Exif\x00\x00'):
+            offset += 6
+        thumbnail = Image.open(io.BytesIO(data[offset:offset + length]))
+        thumbnail.load()
+    except Exception:
+        return None
+    
+    fitted = get_fitted_size(img.size, size)
+    if thumbnail.width < fitted[0] or thumbnail.height < fitted[1]:
+        return None
+    if abs(thumbnail.width / thumbnail.height - img.width / img.height) > EXIF_ASPECT_TOLERANCE * img.width / img.height:
+        return None
+    return thumbnail
+
+
+def make_thumbnail(path, size=THUMB_SIZE):
+    """
+    Создает миниатюру фото, вписанную в size. Возвращает (миниатюра RGB,
+    сведения об исходном изображении: размер, режим, формат). Файл
+    закрывается сразу.
+    """
+    with Image.open(path) as img:
+        info = (img.size, img.mode, img.format)
+        
+        if img.format == 'JPEG':
+            thumbnail = read_exif_thumbnail(img, size)
+            if thumbnail is not None:
+                thumbnail.thumbnail(size, Image.Resampling.LANCZOS)
+                return to_rgb(thumbnail), info
+            # Декодирование сразу в 1/2-1/8 масштаба, но не меньше size
+            img.draft(img.mode, size)
+        
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        return to_rgb(img), info
+
+
+class AtlasEntry:
+    """Запись индекса: одна миниатюра в атласе"""
+    
+    __slots__ = ('file_size', 'mtime', 'slot', 'width', 'height', 'image_size', 'image_mode', 'image_format')
+    
+    def __init__(self, file_size, mtime, slot, width, height, image_size, image_mode, image_format):
+        self.file_size = file_size
+        self.mtime = mtime
+        self.slot = slot
+        self.width = width
+        self.height = height
+        self.image_size = image_size
+        self.image_mode = image_mode
+        self.image_format = image_format
+
+
+class ThumbnailAtlas:
+    """Миниатюры в файле с ячейками фиксированного размера, отображенном в память"""
+    
+    def __init__(self, cache_dir=None, thumb_size=THUMB_SIZE, limit_mb=CACHE_LIMIT_MB):
+        self.cache_dir = cache_dir or get_cache_dir()
+        self.thumb_size = tuple(thumb_size)
+        self.slot_bytes = self.thumb_size[0] * self.thumb_size[1] * 3
+        self.max_slots = max(1, int(limit_mb * 1048576) // self.slot_bytes)
+        self.atlas_path = os.path.join(self.cache_dir, ATLAS_FILE)
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILE)
+        
+        self.entries = OrderedDict()  # путь -> AtlasEntry, от давно использованных к недавним
+        self.free_slots = []
+        self.slot_count = 0
+        self.file = None
+        self.map = None
+        self.dirty = False
+        self.lock = threading.Lock()
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+        self._open_atlas()
+    
+    def _load_index(self):
+        """Читает индекс; несовместимый или поврежденный индекс отбрасывается"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if (index.get('version') != CACHE_VERSION
+                    or tuple(index.get('thumb_size', ())) != self.thumb_size
+                    or index['slots'] > self.max_slots):
+                logger.info("Кэш миниатюр устарел, создается заново")
+                return
+            
+            for path, file_size, mtime, slot, width, height, image_size, image_mode, image_format in index['entries']:
+                self.entries[path] = AtlasEntry(file_size, mtime, slot, width, height,
+                                                tuple(image_size), image_mode, image_format)
+            self.slot_count = index['slots']
+        except Exception as e:
+            logger.warning(f"Не удалось прочитать кэш миниатюр {self.index_path}: {e}")
+            self.entries.clear()
+            self.slot_count = 0
+    
+    def _open_atlas(self):
+        """Открывает файл атласа и отображает его в память"""
+        mode = 'r+b' if os.path.exists(self.atlas_path) else 'w+b'
+        self.file = open(self.atlas_path, mode)
+        
+        # Атлас короче, чем записано в индексе, - индекс не используется
+        if os.fstat(self.file.fileno()).st_size < self.slot_count * self.slot_bytes:
+            self.entries.clear()
+            self.slot_count = 0
+        
+        used = {entry.slot for entry in self.entries.values()}
+        self.free_slots = [slot for slot in range(self.slot_count - 1, -1, -1) if slot not in used]
+        self._map()
+    
+    def _map(self):
+        if self.slot_count:
+            self.map = mmap.mmap(self.file.fileno(), self.slot_count * self.slot_bytes)
+    
+    def _grow(self):
+        """Добавляет в атлас ячейки (отображение пересоздается)"""
+        new_count = min(self.max_slots, self.slot_count + GROW_SLOTS)
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.truncate(new_count * self.slot_bytes)
+        self.free_slots.extend(range(new_count - 1, self.slot_count - 1, -1))
+        self.slot_count = new_count
+        self._map()
+    
+    def _allocate_slot(self):
+        """Свободная ячейка; при заполненном атласе вытесняется давно не использованная миниатюра"""
+        if not self.free_slots and self.slot_count < self.max_slots:
+            self._grow()
+        if self.free_slots:
+            return self.free_slots.pop()
+        _, entry = self.entries.popitem(last=False)
+        return entry.slot
+    
+    def get(self, path):
+        """
+        Миниатюра из кэша и сведения об исходном изображении (размер, режим,
+        формат) или None, если миниатюры нет или файл изменился.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry.file_size != stat.st_size or entry.mtime != stat.st_mtime_ns:
+                return None
+            self.entries.move_to_end(path)
+            self.dirty = True
+            offset = entry.slot * self.slot_bytes
+            data = self.map[offset:offset + entry.width * entry.height * 3]
+        thumbnail = Image.frombytes('RGB', (entry.width, entry.height), data)
+        return thumbnail, (entry.image_size, entry.image_mode, entry.image_format)
+    
+    def put(self, path, thumbnail, info):
+        """Сохраняет миниатюру фото в атлас"""
+        thumbnail = to_rgb(thumbnail)
+        if thumbnail.width > self.thumb_size[0] or thumbnail.height > self.thumb_size[1]:
+            thumbnail.thumbnail(self.thumb_size, Image.Resampling.LANCZOS)
+        data = thumbnail.tobytes()
+        stat = os.stat(path)
+        image_size, image_mode, image_format = info
+        
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            slot = entry.slot if entry is not None else self._allocate_slot()
+            offset = slot * self.slot_bytes
+            self.map[offset:offset + len(data)] = data
+            self.entries[path] = AtlasEntry(stat.st_size, stat.st_mtime_ns, slot, thumbnail.width, thumbnail.height,
+                                            tuple(image_size), image_mode, image_format)
+            self.dirty = True
+    
+    def save(self):
+        """Сбрасывает атлас на диск и сохраняет индекс"""
+        with self.lock:
+            if not self.dirty:
+                return
+            index = {
+                'version': CACHE_VERSION,
+                'thumb_size': list(self.thumb_size),
+                'slots': self.slot_count,
+                'entries': [
+                    [path, entry.file_size, entry.mtime, entry.slot, entry.width, entry.height,
+                     list(entry.image_size), entry.image_mode, entry.image_format]
+                    for path, entry in self.entries.items()
+                ]
+            }
+            if self.map is not None:
+                self.map.flush()
+            self.dirty = False
+        
+        # Индекс заменяется целиком, чтобы не оставить его недописанным
+        temp_path = self.index_path + '.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить кэш миниатюр {self.index_path}: {e}")
+    
+    def close(self):
+        """Сохраняет индекс и закрывает атлас"""
+        self.save()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+_shared_atlas = None
+_shared_atlas_lock = threading.Lock()
+
+
+def get_thumbnail_atlas():
+    """Общий кэш миниатюр приложения или None, если папка кэша недоступна"""
+    global _shared_atlas
+    with _shared_atlas_lock:
+        if _shared_atlas is None:
+            try:
+                _shared_atlas = ThumbnailAtlas()
+            except Exception as e:
+                logger.warning(f"Кэш миниатюр недоступен: {e}")
+                _shared_atlas = False
+        return _shared_atlas or None
+
+
+def load_thumbnail(path, atlas=None):
+    """
+    Миниатюра фото из кэша; если ее нет или файл изменился, создается
+    заново и сохраняется в кэш. Возвращает (миниатюра, сведения об исходном
+    изображении).
+    """
+    if atlas is not None:
+        cached = atlas.get(path)
+        if cached is not None:
+            return cached
+    
+    thumbnail, info = make_thumbnail(path)
+    if atlas is not None:
+        try:
+            atlas.put(path, thumbnail, info)
+        except OSError as e:
+            logger.warning(f"Не удалось сохранить миниатюру {path} в кэш: {e}")
+    return thumbnail, info
\ No newline at end of file
@@ -0,0 +1,288 @@
+"""
+Виртуализированная сетка миниатюр для окон сортировки.
+
+Вместо отдельного фрейма с тремя метками на каждое фото сетка рисует
+ячейки прямо на Canvas и создает элементы только для строк, которые
+видны на экране. При прокрутке ячейки, ушедшие из видимой области,
+используются повторно для новых строк. Поэтому открытие окна и
+прокрутка зависят от размера окна, а не от числа фотографий.
+
+Содержимое ячейки запрашивается у get_cell(index), который возвращает
+словарь {'title': ..., 'image': PhotoImage или None, 'name': ...}. Пока
+миниатюра не загружена (image равно None), вместо нее рисуется заглушка.
+После каждой перерисовки вызывается on_render(first, last) с диапазоном
+видимых ячеек - по нему окно решает, какие миниатюры загружать первыми.
+"""
+import tkinter as tk
+from tkinter import ttk
+
+# Отступ между ячейками
+CELL_PADDING = 5
+
+# Зона у края окна, в которой при перетаскивании сетка прокручивается
+AUTOSCROLL_MARGIN = 30
+
+
+class ThumbnailGrid(ttk.Frame):
+    """Прокручиваемая сетка миниатюр на Canvas"""
+    
+    def __init__(self, parent, get_cell, cell_size=(130, 130), thumb_size=(120, 90),
+                 title_font=("Arial", 8, "bold"), name_font=("Arial", 8),
+                 on_select=None, on_move=None, on_render=None):
+        super().__init__(parent)
+        self.get_cell = get_cell
+        self.cell_width, self.cell_height = cell_size
+        self.thumb_width, self.thumb_height = thumb_size
+        self.title_font = title_font
+        self.name_font = name_font
+        self.on_select = on_select
+        self.on_move = on_move
+        self.on_render = on_render
+        
+        self.pitch_x = self.cell_width + 2 * CELL_PADDING
+        self.pitch_y = self.cell_height + 2 * CELL_PADDING
+        
+        self.count = 0
+        self.columns = 1
+        self.cells = {}  # индекс фото -> ячейка на холсте
+        self.free_cells = []  # скрытые ячейки для повторного использования
+        self.selected = None
+        self.drag_index = None
+        self._render_pending = None
+        
+        self.canvas = tk.Canvas(self, bg="white", highlightthickness=0,
+                                yscrollincrement=max(1, self.pitch_y // 4))
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.canvas.bind("<Configure>", lambda e: self.schedule_render())
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_motion)
+        self.canvas.bind("<ButtonRelease-1>", self._on_release)
+        self.canvas.bind("<Enter>", self._bind_wheel)
+        self.canvas.bind("<Leave>", self._unbind_wheel)
+        self.canvas.bind("<Destroy>", self._unbind_wheel)
+    
+    def set_count(self, count):
+        """Задает число фото в сетке и перерисовывает видимую часть"""
+        self.count = count
+        if self.selected is not None and self.selected >= count:
+            self.selected = None
+        self.refresh()
+    
+    def refresh(self, indices=None):
+        """
+        Обновляет содержимое ячеек. Без аргумента - все созданные ячейки,
+        иначе только перечисленные индексы (невидимые пропускаются).
+        """
+        if indices is None:
+            for index in [index for index in self.cells if index >= self.count]:
+                self._release(index)
+            indices = list(self.cells)
+            self.schedule_render()
+        
+        for index in indices:
+            cell = self.cells.get(index)
+            if cell is not None:
+                self._fill(cell, index)
+    
+    def refresh_range(self, start, stop):
+        """Обновляет созданные ячейки с индексами от start до stop - 1"""
+        self.refresh([index for index in self.cells if start <= index < stop])
+    
+    def select(self, index):
+        """Выделяет ячейку"""
+        previous, self.selected = self.selected, index
+        self.refresh([i for i in (previous, index) if i is not None])
+    
+    def see(self, index):
+        """Прокручивает сетку так, чтобы ячейка была видна"""
+        if not self.count:
+            return
+        row = index // self.columns
+        top = self.canvas.canvasy(0)
+        height = self.canvas.winfo_height()
+        y0 = row * self.pitch_y
+        total_height = self._get_total_height()
+        if y0 < top:
+            self.canvas.yview_moveto(y0 / total_height)
+        elif y0 + self.pitch_y > top + height:
+            self.canvas.yview_moveto((y0 + self.pitch_y - height) / total_height)
+        self.schedule_render()
+    
+    def get_visible_range(self):
+        """Возвращает (первый, последний + 1) индексы видимых ячеек"""
+        top = self.canvas.canvasy(0)
+        bottom = top + max(1, self.canvas.winfo_height())
+        first = max(0, int(top // self.pitch_y)) * self.columns
+        last = min(self.count, (int(bottom // self.pitch_y) + 1) * self.columns)
+        return first, max(first, last)
+    
+    def index_at(self, x, y):
+        """Индекс фото в точке окна сетки или None"""
+        column = int(self.canvas.canvasx(x) // self.pitch_x)
+        row = int(self.canvas.canvasy(y) // self.pitch_y)
+        if column < 0 or column >= self.columns or row < 0:
+            return None
+        index = row * self.columns + column
+        return index if index < self.count else None
+    
+    def schedule_render(self):
+        """Перерисовывает сетку при ближайшем простое цикла Tk (один раз на серию событий)"""
+        if self._render_pending is None:
+            self._render_pending = self.after_idle(self._render)
+    
+    def _get_total_height(self):
+        rows = (self.count + self.columns - 1) // self.columns
+        return max(1, rows * self.pitch_y)
+    
+    def _render(self):
+        """Создает ячейки для видимых строк и освобождает остальные"""
+        self._render_pending = None
+        try:
+            self._update_cells()
+        except tk.TclError:
+            # Окно сортировки закрыто
+            pass
+    
+    def _update_cells(self):
+        width = self.canvas.winfo_width()
+        columns = max(1, width // self.pitch_x)
+        if columns != self.columns:
+            # Изменилась ширина окна - меняются позиции всех ячеек
+            self.columns = columns
+            for index in list(self.cells):
+                self._release(index)
+        
+        self.canvas.configure(scrollregion=(0, 0, columns * self.pitch_x, self._get_total_height()))
+        
+        first, last = self.get_visible_range()
+        for index in [index for index in self.cells if not first <= index < last]:
+            self._release(index)
+        for index in range(first, last):
+            if index not in self.cells:
+                cell = self.free_cells.pop() if self.free_cells else self._create_cell()
+                self.cells[index] = cell
+                self._fill(cell, index)
+        
+        if self.on_render:
+            self.on_render(first, last)
+    
+    def _create_cell(self):
+        """Создает элементы холста для одной ячейки"""
+        return {
+            'frame': self.canvas.create_rectangle(0, 0, 0, 0, outline="gray"),
+            'placeholder': self.canvas.create_rectangle(0, 0, 0, 0, fill="#eeeeee", outline=""),
+            'title': self.canvas.create_text(0, 0, anchor="nw", font=self.title_font),
+            'image': self.canvas.create_image(0, 0, anchor="center"),
+            'name': self.canvas.create_text(0, 0, anchor="s", font=self.name_font,
+                                            width=self.cell_width - 10, justify="center"),
+            'photo': None
+        }
+    
+    def _fill(self, cell, index):
+        """Размещает ячейку на месте index и выводит в ней данные фото"""
+        data = self.get_cell(index)
+        x0 = (index % self.columns) * self.pitch_x + CELL_PADDING
+        y0 = (index // self.columns) * self.pitch_y + CELL_PADDING
+        
+        if index == self.drag_index:
+            outline, line_width = "orange", 2
+        elif index == self.selected:
+            outline, line_width = "blue", 2
+        else:
+            outline, line_width = "gray", 1
+        
+        canvas = self.canvas
+        canvas.coords(cell['frame'], x0, y0, x0 + self.cell_width, y0 + self.cell_height)
+        canvas.itemconfigure(cell['frame'], outline=outline, width=line_width, state="normal")
+        canvas.coords(cell['title'], x0 + 3, y0 + 2)
+        canvas.itemconfigure(cell['title'], text=data.get('title', ''), state="normal")
+        center_x, center_y = x0 + self.cell_width // 2, y0 + self.cell_height // 2
+        canvas.coords(cell['placeholder'], center_x - self.thumb_width // 2, center_y - self.thumb_height // 2,
+                      center_x + self.thumb_width // 2, center_y + self.thumb_height // 2)
+        canvas.itemconfigure(cell['placeholder'], state="hidden" if data.get('image') else "normal")
+        canvas.coords(cell['image'], center_x, center_y)
+        canvas.itemconfigure(cell['image'], image=data.get('image') or '', state="normal")
+        canvas.coords(cell['name'], x0 + self.cell_width // 2, y0 + self.cell_height - 2)
+        canvas.itemconfigure(cell['name'], text=data.get('name', ''), state="normal")
+        
+        # Холст не хранит ссылку на PhotoImage
+        cell['photo'] = data.get('image')
+    
+    def _release(self, index):
+        """Скрывает ячейку и возвращает ее в запас"""
+        cell = self.cells.pop(index)
+        for key in ('frame', 'placeholder', 'title', 'image', 'name'):
+            self.canvas.itemconfigure(cell[key], state="hidden")
+        cell['photo'] = None
+        self.free_cells.append(cell)
+    
+    def _on_scrollbar(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_render()
+    
+    def _on_wheel(self, event):
+        if event.num == 4:
+            step = -1
+        elif event.num == 5:
+            step = 1
+        else:
+            step = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(step * 4, "units")
+        self.schedule_render()
+    
+    def _bind_wheel(self, event):
+        self.canvas.bind_all("<MouseWheel>", self._on_wheel)
+        self.canvas.bind_all("<Button-4>", self._on_wheel)
+        self.canvas.bind_all("<Button-5>", self._on_wheel)
+    
+    def _unbind_wheel(self, event):
+        self.canvas.unbind_all("<MouseWheel>")
+        self.canvas.unbind_all("<Button-4>")
+        self.canvas.unbind_all("<Button-5>")
+    
+    def _on_press(self, event):
+        """Выбор фото и начало перетаскивания"""
+        index = self.index_at(event.x, event.y)
+        if index is None:
+            return
+        self.drag_index = index
+        self.select(index)
+        if self.on_select:
+            self.on_select(index)
+    
+    def _on_motion(self, event):
+        """Перетаскивание: фото перемещается на место ячейки под курсором"""
+        if self.drag_index is None:
+            return
+        
+        # У края окна сетка прокручивается
+        if event.y < AUTOSCROLL_MARGIN:
+            self.canvas.yview_scroll(-1, "units")
+            self.schedule_render()
+        elif event.y > self.canvas.winfo_height() - AUTOSCROLL_MARGIN:
+            self.canvas.yview_scroll(1, "units")
+            self.schedule_render()
+        
+        target = self.index_at(event.x, event.y)
+        if target is None:
+            if self.canvas.canvasy(event.y) < self._get_total_height():
+                return
+            # Ниже последней строки - в конец списка
+            target = self.count - 1
+        if target == self.drag_index:
+            return
+        
+        source, self.drag_index = self.drag_index, target
+        self.selected = target
+        if self.on_move:
+            self.on_move(source, target)
+    
+    def _on_release(self, event):
+        """Завершение перетаскивания"""
+        if self.drag_index is not None:
+            index, self.drag_index = self.drag_index, None
+            self.refresh([index])
\ No newline at end of file
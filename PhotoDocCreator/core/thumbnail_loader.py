@@ -0,0 +1,135 @@
+"""
+Фоновая загрузка миниатюр для окон сортировки.
+
+Окно сортировки открывается сразу с заглушками вместо миниатюр, а
+миниатюры создаются несколькими потоками (декодирование Pillow
+отпускает GIL). Сначала загружаются фото, которые сейчас видны в сетке,
+затем соседние с видимой областью, затем остальные по порядку. Готовые
+миниатюры складываются в очередь; поток Tk забирает их пачками по
+таймеру after(), создает ImageTk.PhotoImage и передает окну вместе со
+сведениями об исходном изображении; сами изображения Pillow окну не
+передаются и после этого освобождаются.
+"""
+import os
+import queue
+import threading
+import tkinter as tk
+from collections import deque
+
+from PIL import ImageTk
+
+from .thumbnail_cache import get_thumbnail_atlas, load_thumbnail
+
+# Период вывода готовых миниатюр
+DELIVER_INTERVAL_MS = 50
+
+# Сколько миниатюр передавать окну за один раз, чтобы не блокировать его
+MAX_BATCH = 64
+
+
+def get_loader_workers():
+    """Число потоков загрузки миниатюр"""
+    return max(2, min(8, os.cpu_count() or 1))
+
+
+def get_priority_order(first, last, count):
+    """
+    Порядок загрузки по видимым ячейкам first..last - 1: сначала видимые,
+    затем экран ниже и экран выше
+    """
+    screen = max(1, last - first)
+    below = range(last, min(count, last + screen))
+    above = range(first - 1, max(0, first - screen) - 1, -1)
+    return [*range(first, last), *below, *above]
+
+
+class ThumbnailLoader:
+    """Загружает миниатюры в фоновых потоках и передает их в поток Tk"""
+    
+    def __init__(self, root, paths, on_loaded, workers=None, interval_ms=DELIVER_INTERVAL_MS):
+        self.root = root
+        self.on_loaded = on_loaded
+        self.interval_ms = interval_ms
+        
+        self.lock = threading.Lock()
+        self.pending = set(paths)
+        self.total = len(self.pending)
+        self.delivered = 0
+        self.backlog = deque(paths)  # все фото в исходном порядке
+        self.urgent = deque()  # видимые и соседние с ними фото
+        self.results = queue.SimpleQueue()
+        self.stopped = threading.Event()
+        self.atlas = get_thumbnail_atlas()
+        
+        self.threads = [
+            threading.Thread(target=self._work, name=f"thumbnails-{i}", daemon=True)
+            for i in range(workers or get_loader_workers())
+        ]
+    
+    def start(self):
+        """Запускает потоки загрузки и вывод готовых миниатюр"""
+        for thread in self.threads:
+            thread.start()
+        self.root.after(self.interval_ms, self._deliver)
+    
+    def stop(self):
+        """Останавливает загрузку (при закрытии окна) и сохраняет кэш"""
+        self.stopped.set()
+        if self.atlas is not None:
+            self.atlas.save()
+    
+    def prioritize(self, paths):
+        """Загружать эти фото в первую очередь (заменяет прежний список)"""
+        with self.lock:
+            self.urgent = deque(path for path in paths if path in self.pending)
+    
+    def _next_path(self):
+        """Следующее фото для загрузки или None, если загружать больше нечего"""
+        with self.lock:
+            for source in (self.urgent, self.backlog):
+                while source:
+                    path = source.popleft()
+                    if path in self.pending:
+                        self.pending.discard(path)
+                        return path
+        return None
+    
+    def _work(self):
+        """Поток загрузки: создает миниатюры, пока есть фото и окно открыто"""
+        while not self.stopped.is_set():
+            path = self._next_path()
+            if path is None:
+                break
+            try:
+                thumbnail, info = load_thumbnail(path, self.atlas)
+                self.results.put((path, thumbnail, info, None))
+            except Exception as e:
+                self.results.put((path, None, None, e))
+    
+    def _deliver(self):
+        """Передает окну готовые миниатюры пачкой (поток Tk)"""
+        if self.stopped.is_set():
+            return
+        
+        try:
+            batch = []
+            while len(batch) < MAX_BATCH:
+                try:
+                    path, thumbnail, info, error = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if error is not None:
+                    batch.append((path, None, None, error))
+                else:
+                    batch.append((path, ImageTk.PhotoImage(thumbnail), info, None))
+            
+            if batch:
+                self.delivered += len(batch)
+                self.on_loaded(batch)
+            if self.delivered < self.total:
+                self.root.after(self.interval_ms, self._deliver)
+            elif self.atlas is not None:
+                self.atlas.save()
+        except tk.TclError:
+            # Окно закрыто
+            self.stop()
\ No newline at end of file
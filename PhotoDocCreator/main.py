@@ -2,6 +2,7 @@ import tkinter as tk
 import sys
 import os
 import logging
+import multiprocessing
 
 # Настраиваем логирование
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -63,4 +64,6 @@ def main():
         tk.messagebox.showerror("Критическая ошибка", f"Произошла ошибка при запуске: {e}")
 
 if __name__ == "__main__":
+    # Нужно для пула процессов в собранном EXE
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""
+PhotoDoc Creator - Tests
+Проверки модулей приложения (python -m pytest PhotoDocCreator/tests)
+"""
+import os
+import sys
+
+# Модули приложения импортируются так же, как в main.py
+package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if package_dir not in sys.path:
+    sys.path.insert(0, package_dir)
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Правила подписей"""
+import unittest
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.captions import RuleIndex
+
+
+class RuleIndexTest(unittest.TestCase):
+    
+    def test_first_rule_wins_on_overlap(self):
+        index = RuleIndex([(1, 10, "первое"), (5, 15, "второе"), (20, 20, "третье")])
+        
+        self.assertEqual(index.find(1), "первое")
+        self.assertEqual(index.find(7), "первое")
+        self.assertEqual(index.find(11), "второе")
+        self.assertEqual(index.find(20), "третье")
+        self.assertIsNone(index.find(16))
+        self.assertIsNone(index.find(21))
+        self.assertEqual(len(index.problems), 1)
+        self.assertIn("правило 2 (5-15) пересекается с правилом 1 (1-10)", index.problems[0])
+    
+    def test_covered_rule_is_reported(self):
+        index = RuleIndex([(1, 10, "общее"), (3, 4, "частное")])
+        
+        self.assertEqual(index.find(3), "общее")
+        self.assertTrue(any("полностью перекрыто" in problem for problem in index.problems))
+    
+    def test_find_overlap_checks_only_new_range(self):
+        # Уже пересекающиеся правила не мешают добавить непересекающееся
+        index = RuleIndex([(1, 10, "первое"), (5, 15, "второе")])
+        
+        self.assertIsNone(index.find_overlap(16, 30))
+        self.assertEqual(index.find_overlap(12, 20), (5, 15, "второе"))
+        self.assertEqual(index.find_overlap(0, 1), (1, 10, "первое"))
+        self.assertEqual(index.find_overlap(7, 7), (1, 10, "первое"))
+    
+    def test_find_overlap_between_rules(self):
+        index = RuleIndex([(1, 3, "первое"), (10, 12, "второе")])
+        
+        self.assertIsNone(index.find_overlap(4, 9))
+        self.assertEqual(index.find_overlap(4, 10), (10, 12, "второе"))
+        self.assertIsNone(RuleIndex([]).find_overlap(1, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
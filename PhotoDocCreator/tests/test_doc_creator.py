@@ -0,0 +1,388 @@
+"""Предобработка фото для документа"""
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+from docx import Document
+from lxml import etree
+from PIL import Image
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.doc_creator import (DocumentCreator, MediaMemoryBudget, downscale_image, find_duplicate_sources,
+                              open_prepared_media, prepare_image)
+from core.docx_writers import DocxWriter
+
+NAMESPACES = {
+    'wp': 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+    'pic': 'http://schemas.openxmlformats.org/drawingml/2006/picture'
+}
+
+# 1 см в EMU
+CM = 360000
+
+
+def save_truncated_jpeg(path, mode, size=(400, 300)):
+    """Сохраняет JPEG, у которого обрезан конец файла"""
+    Image.new(mode, size, (10, 20, 30, 40)[:len(mode)]).save(path, 'JPEG', quality=90)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:len(data) * 2 // 3])
+
+
+def run_build(folder, photos, messages=None, **config):
+    """
+    Собирает документ из фото [(путь, поворот)] и возвращает DocumentCreator сборки.
+    Сообщения журнала сборки добавляются в список messages.
+    """
+    output = os.path.join(folder, config.pop('name', 'out.docx'))
+    config = dict({'word_file': output, 'preprocess_workers': 1, 'image_width': 6.0, 'image_height': 4.0}, **config)
+    image_data_list = [
+        {'path': path, 'global_number': number, 'rotation': rotation}
+        for number, (path, rotation) in enumerate(photos, 1)
+    ]
+    creator = DocumentCreator(config)
+    success, result, count = creator.create_document(image_data_list, messages.append if messages is not None else None)
+    assert success, result
+    return creator
+
+
+def build_document(folder, photos, **config):
+    """Собирает документ из фото [(путь, поворот)] и возвращает путь к нему"""
+    return run_build(folder, photos, **config).config['word_file']
+
+
+def read_inlines(output):
+    """Возвращает элементы wp:inline из document.xml готового документа"""
+    with zipfile.ZipFile(output) as package:
+        root = etree.fromstring(package.read('word/document.xml'))
+    return root.findall('.//wp:inline', NAMESPACES)
+
+
+class TruncatedImageTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    def test_spawned_workers_accept_truncated_images(self):
+        # Процессы spawn не наследуют настройки Pillow родителя
+        cmyk_path = os.path.join(self.temp_dir.name, 'cmyk.jpg')
+        rgb_path = os.path.join(self.temp_dir.name, 'rgb.jpg')
+        save_truncated_jpeg(cmyk_path, 'CMYK')
+        save_truncated_jpeg(rgb_path, 'RGB')
+        tasks = [
+            {'path': cmyk_path, 'rotation': 0},
+            {'path': rgb_path, 'rotation': 0, 'target_size': (200, 150)},
+            {'path': rgb_path, 'rotation': 45}
+        ]
+        
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+            results = list(executor.map(prepare_image, tasks))
+        
+        self.assertEqual([result['plan'] for result in results], [['convert'], ['resize'], ['rotate']])
+        for result in results:
+            self.assertIsNone(result['error'])
+            self.assertIsNone(result['warning'])
+            self.assertTrue(result['data'])
+
+
+class DownscaleTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    def open_png(self, mode, size=(1000, 800)):
+        """Открывает PNG заданного режима так же, как prepare_image"""
+        img = Image.new(mode, size)
+        if mode == 'P':
+            img.putpalette([value for i in range(256) for value in (i, 255 - i, i // 2)])
+        img.paste(255 if mode in ('1', 'P') else 65535, (0, 0, size[0] // 2, size[1]))
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG')
+        buffer.seek(0)
+        return Image.open(buffer)
+    
+    def test_modes_without_reduce(self):
+        # reduce() не поддерживает палитру, 1-битные и 16-битные изображения
+        for mode in ('P', '1', 'I;16'):
+            with self.subTest(mode=mode):
+                img = self.open_png(mode)
+                self.assertEqual(img.mode, mode)
+                result = downscale_image(img, (200, 150))
+                self.assertEqual(result.size, (200, 160))
+    
+    def test_prepare_palette_and_bilevel_images(self):
+        for mode in ('P', '1'):
+            with self.subTest(mode=mode):
+                path = os.path.join(self.temp_dir.name, f'{mode}.png')
+                self.open_png(mode).save(path)
+                result = prepare_image({'path': path, 'rotation': 0, 'target_size': (200, 150)})
+                
+                self.assertIsNone(result['error'])
+                self.assertIsNone(result['warning'])
+                self.assertEqual(result['plan'], ['resize'])
+                with Image.open(io.BytesIO(result['data'])) as prepared:
+                    self.assertEqual(prepared.format, 'PNG')
+                    self.assertEqual(prepared.size, (200, 160))
+    
+    def test_target_box_follows_rotation(self):
+        # Поворот на 90° меняет стороны местами, на произвольный угол - нет
+        path = os.path.join(self.temp_dir.name, 'landscape.jpg')
+        Image.new('RGB', (1000, 800), (200, 100, 50)).save(path, 'JPEG')
+        expected = {
+            90: (250, 200),
+            270: (250, 200),
+            -90: (250, 200),
+            180: (200, 160),
+            45: Image.new('RGB', (200, 160)).rotate(45, expand=True).size
+        }
+        for rotation, size in expected.items():
+            with self.subTest(rotation=rotation):
+                result = prepare_image({'path': path, 'rotation': rotation, 'target_size': (200, 150)})
+                self.assertIsNone(result['error'])
+                self.assertIn('resize', result['plan'])
+                with Image.open(io.BytesIO(result['data'])) as prepared:
+                    self.assertEqual(prepared.size, size)
+
+
+
+class MediaMemoryBudgetTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    def test_spills_when_total_would_exceed_limit(self):
+        # Каждое изображение меньше лимита, но все вместе в него не помещаются
+        budget = MediaMemoryBudget(250, os.path.join(self.temp_dir.name, 'spill'))
+        results = [{'path': f'{i}.jpg', 'data': bytes([i]) * 100, 'data_path': None} for i in range(3)]
+        for result in results:
+            budget.admit(result)
+        budget.admit(results[0])
+        
+        self.assertEqual(budget.held, 200)
+        self.assertEqual([result['data_path'] is not None for result in results], [False, False, True])
+        self.assertEqual(open_prepared_media(results[2]).getvalue(), bytes([2]) * 100)
+        
+        budget.release(results[0])
+        third = {'path': '3.jpg', 'data': b'3' * 100, 'data_path': None}
+        budget.admit(third)
+        self.assertIsNone(third['data_path'])
+        self.assertEqual(budget.held, 200)
+        self.assertEqual(budget.peak, 200)
+    
+    def test_pool_results_stay_within_limit(self):
+        tasks = []
+        sources = {}
+        for i in range(8):
+            path = os.path.join(self.temp_dir.name, f'{i}.png')
+            Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3)).save(path)
+            with open(path, 'rb') as f:
+                sources[path] = f.read()
+            tasks.append({'index': i, 'path': path, 'rotation': 0})
+        limit = max(map(len, sources.values())) * 3 // 2
+        
+        budget = MediaMemoryBudget(limit, os.path.join(self.temp_dir.name, 'spill'))
+        creator = DocumentCreator({})
+        results = []
+        for result in creator._iter_prepared_images(tasks, creator._start_pool(2), 2, budget):
+            self.assertLessEqual(budget.held, limit)
+            self.assertEqual(open_prepared_media(result).getvalue(), sources[result['path']])
+            results.append(result)
+        
+        self.assertEqual([result['path'] for result in results], [task['path'] for task in tasks])
+        self.assertLessEqual(budget.peak, limit)
+        self.assertEqual(budget.held, 0)
+
+
+
+class RotationTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = os.path.join(self.temp_dir.name, 'landscape.jpg')
+        Image.new('RGB', (600, 400), (90, 120, 150)).save(self.path, 'JPEG')
+    
+    def test_xfrm_rotation_geometry(self):
+        # Область 6×4 см; a:ext - неповернутая картинка, wp:extent - повернутая область
+        expected = {
+            90: ('16200000', (4 * CM, 6 * CM), (6 * CM, 4 * CM), (0, CM, 0, CM)),
+            180: ('10800000', (6 * CM, 4 * CM), (6 * CM, 4 * CM), (0, 0, 0, 0)),
+            270: ('5400000', (4 * CM, 6 * CM), (6 * CM, 4 * CM), (0, CM, 0, CM))
+        }
+        for backend in ('docx', 'stream'):
+            output = build_document(self.temp_dir.name, [(self.path, rotation) for rotation in expected],
+                                    name=f'{backend}.docx', writer_backend=backend)
+            inlines = read_inlines(output)
+            self.assertEqual(len(inlines), len(expected))
+            
+            for inline, (rotation, (rot, ext, extent, effect)) in zip(inlines, expected.items()):
+                with self.subTest(backend=backend, rotation=rotation):
+                    xfrm = inline.find('.//pic:spPr/a:xfrm', NAMESPACES)
+                    a_ext = xfrm.find('a:ext', NAMESPACES)
+                    wp_extent = inline.find('wp:extent', NAMESPACES)
+                    effect_extent = inline.find('wp:effectExtent', NAMESPACES)
+                    
+                    self.assertEqual(xfrm.get('rot'), rot)
+                    self.assertEqual((int(a_ext.get('cx')), int(a_ext.get('cy'))), ext)
+                    self.assertEqual((int(wp_extent.get('cx')), int(wp_extent.get('cy'))), extent)
+                    self.assertEqual(tuple(int(effect_extent.get(side)) for side in 'ltrb'), effect)
+                    self.assertIs(wp_extent.getnext(), effect_extent)
+    
+    def test_fallback_converts_prepared_image(self):
+        # Запасной путь вставки не должен терять поворот на произвольный угол
+        add_picture = DocxWriter.add_picture
+        calls = []
+        
+        def fail_first(writer, *args, **kwargs):
+            calls.append(args)
+            if len(calls) == 1:
+                raise ValueError("unsupported image")
+            return add_picture(writer, *args, **kwargs)
+        
+        with mock.patch.object(DocxWriter, 'add_picture', autospec=True, side_effect=fail_first):
+            output = build_document(self.temp_dir.name, [(self.path, 45)])
+        
+        self.assertEqual(len(calls), 2)
+        with zipfile.ZipFile(output) as package:
+            media = [name for name in package.namelist() if name.startswith('word/media/')]
+            self.assertEqual(len(media), 1)
+            with Image.open(io.BytesIO(package.read(media[0]))) as embedded:
+                self.assertEqual(embedded.size, Image.new('RGB', (600, 400)).rotate(45, expand=True).size)
+
+
+
+class StreamingWriterTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.photos = []
+        for i in range(5):
+            path = os.path.join(self.temp_dir.name, f'{i}.png' if i % 2 else f'{i}.jpg')
+            Image.new('RGB', (300 + 40 * i, 200), (40 * i, 90, 160)).save(path)
+            self.photos.append((path, 90 if i == 3 else 0))
+    
+    def test_stream_output_matches_docx_backend(self):
+        config = {'images_per_page': 2, 'department_name': 'Отдел', 'enable_footer': True}
+        documents = {
+            backend: Document(build_document(self.temp_dir.name, self.photos, name=f'{backend}.docx',
+                                             writer_backend=backend, **config))
+            for backend in ('docx', 'stream')
+        }
+        
+        docx_doc, stream_doc = documents['docx'], documents['stream']
+        self.assertEqual(len(stream_doc.inline_shapes), len(self.photos))
+        self.assertEqual(len(stream_doc.inline_shapes), len(docx_doc.inline_shapes))
+        self.assertEqual([shape.width for shape in stream_doc.inline_shapes],
+                         [shape.width for shape in docx_doc.inline_shapes])
+        self.assertEqual([p.text for p in stream_doc.paragraphs], [p.text for p in docx_doc.paragraphs])
+        self.assertEqual(stream_doc.sections[0].footer.paragraphs[0].text,
+                         docx_doc.sections[0].footer.paragraphs[0].text)
+        
+        # Ссылки на изображения ведут на существующие части пакета
+        for shape in stream_doc.inline_shapes:
+            rId = shape._inline.graphic.graphicData.pic.blipFill.blip.embed
+            self.assertTrue(stream_doc.part.related_parts[rId].blob)
+
+
+
+class IncrementalBuildTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.photos = []
+        for i in range(6):
+            path = os.path.join(self.temp_dir.name, f'{i}.jpg')
+            Image.new('RGB', (300, 200), (40 * i, 90, 160)).save(path)
+            self.photos.append((path, 0))
+        self.config = {'incremental_build': True, 'images_per_page': 2}
+        self.first = run_build(self.temp_dir.name, self.photos, **self.config)
+    
+    def rebuild(self, **changes):
+        """Пересобирает документ и возвращает число фото, взятых из предыдущей сборки"""
+        creator = run_build(self.temp_dir.name, self.photos, **dict(self.config, **changes))
+        self.assertEqual(len(Document(creator.config['word_file']).inline_shapes), len(self.photos))
+        return creator.metrics.reused_photos
+    
+    def test_unchanged_pages_are_reused(self):
+        self.assertEqual(self.first.metrics.reused_photos, 0)
+        self.assertEqual(self.rebuild(), 6)
+        # Манифест перезаписывается, следующая сборка снова берет все страницы
+        self.assertEqual(self.rebuild(), 6)
+    
+    def test_changed_mtime_invalidates_page(self):
+        stat = os.stat(self.photos[2][0])
+        os.utime(self.photos[2][0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.rebuild(), 4)
+    
+    def test_changed_caption_invalidates_page(self):
+        self.assertEqual(self.rebuild(caption_rules=[[5, 5, 'Общий вид']]), 4)
+    
+    def test_changed_layout_invalidates_all_pages(self):
+        self.assertEqual(self.rebuild(font_size=14), 0)
+
+
+
+class DuplicateMediaTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        folders = [os.path.join(self.temp_dir.name, name) for name in ('first', 'second')]
+        for folder in folders:
+            os.makedirs(folder)
+        
+        # Одно и то же фото скопировано в две папки, третье фото другое
+        self.original = os.path.join(folders[0], 'scene.jpg')
+        self.copy = os.path.join(folders[1], 'scene.jpg')
+        self.other = os.path.join(folders[1], 'other.jpg')
+        Image.new('RGB', (1200, 800), (30, 60, 90)).save(self.original, quality=90)
+        shutil.copyfile(self.original, self.copy)
+        Image.new('RGB', (1600, 1200), (200, 60, 90)).save(self.other, quality=90)
+    
+    def test_hashes_only_same_size_files(self):
+        hashed = []
+        
+        def spy_map(func, paths):
+            hashed.extend(paths)
+            return map(func, paths)
+        
+        duplicates = find_duplicate_sources([self.original, self.copy, self.other], spy_map)
+        
+        self.assertEqual(sorted(hashed), sorted([self.original, self.copy]))
+        self.assertEqual(set(duplicates), {self.original, self.copy})
+        self.assertEqual(duplicates[self.original], duplicates[self.copy])
+    
+    def test_identical_photos_share_one_media_part(self):
+        photos = [(self.original, 0), (self.copy, 0), (self.other, 0), (self.copy, 180)]
+        for backend in ('docx', 'stream'):
+            with self.subTest(backend=backend):
+                messages = []
+                output = run_build(self.temp_dir.name, photos, messages, name=f'{backend}.docx',
+                                   writer_backend=backend, target_dpi=150, preprocess_workers=2).config['word_file']
+                
+                with zipfile.ZipFile(output) as package:
+                    media = [name for name in package.namelist() if name.startswith('word/media/')]
+                self.assertEqual(len(media), 2)
+                self.assertEqual(len(Document(output).inline_shapes), len(photos))
+                
+                # Копии не декодируются и не пересжимаются повторно
+                self.assertIn("🔗 Повторяющихся фото: 2, подготовлены один раз, "
+                              "пропущено декодирований и пересжатий: 2", messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
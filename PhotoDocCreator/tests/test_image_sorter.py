@@ -0,0 +1,61 @@
+"""Предпросмотр в окне визуальной сортировки"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from PIL import Image
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core import image_sorter
+from core.image_sorter import VisualImageSorter
+
+
+class FakeCanvas:
+    """Холст предпросмотра без окна: запоминает нарисованные изображения"""
+    
+    def __init__(self):
+        self.images = []
+    
+    def delete(self, tag):
+        self.images = []
+    
+    def create_image(self, x, y, image=None):
+        self.images.append(image)
+
+
+class FakeLabel:
+    """Подпись предпросмотра без окна"""
+    
+    def __init__(self):
+        self.text = ""
+    
+    def config(self, text=""):
+        self.text = text
+
+
+class ShowPreviewTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'photo.jpg')
+        Image.new('RGB', (1200, 900), 'red').save(self.path, 'JPEG')
+        
+        self.sorter = VisualImageSorter(None, self.temp_dir.name)
+        self.sorter.preview_canvas = FakeCanvas()
+        self.sorter.preview_label = FakeLabel()
+    
+    def tearDown(self):
+        self.temp_dir.cleanup()
+    
+    def test_preview_is_rendered(self):
+        with mock.patch.object(image_sorter.ImageTk, 'PhotoImage', side_effect=lambda img: img):
+            self.sorter.show_preview(self.path)
+        
+        self.assertNotIn("Ошибка", self.sorter.preview_label.text)
+        self.assertIn("1200×900px", self.sorter.preview_label.text)
+        self.assertEqual(len(self.sorter.preview_canvas.images), 1)
+        self.assertLessEqual(self.sorter.preview_canvas.images[0].width, 360)
+
+
+if __name__ == "__main__":
+    unittest.main()
\ No newline at end of file
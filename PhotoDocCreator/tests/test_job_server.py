@@ -0,0 +1,53 @@
+"""Сервер сборки фототаблиц"""
+import os
+import tempfile
+import time
+import unittest
+
+from PIL import Image
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.job_server import JobServer
+
+
+class JobServerTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.photos_dir = os.path.join(self.temp_dir.name, 'photos')
+        os.makedirs(self.photos_dir)
+        for i in range(3):
+            Image.new('RGB', (320, 240), (40 * i, 80, 120)).save(os.path.join(self.photos_dir, f'{i}.jpg'))
+        
+        self.output_dir = os.path.join(self.temp_dir.name, 'server')
+        self.server = JobServer(self.output_dir, workers=1)
+        self.addCleanup(self.server.shutdown)
+    
+    def wait(self, job_id, timeout=60):
+        """Ждет завершения задания и последних сообщений его журнала"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = self.server.get(job_id)
+            if state['status'] in ('done', 'failed') and any('Файл' in line for line in state['log']):
+                return state
+            time.sleep(0.05)
+        self.fail(f"Задание не завершено: {self.server.get(job_id)}")
+    
+    def test_state_hides_server_path(self):
+        state = self.server.submit({'screenshots_folder': self.photos_dir, 'word_file': 'report.docx'})
+        state = self.wait(state['id'])
+        
+        self.assertEqual(state['status'], 'done', state['error'])
+        self.assertEqual(state['photos'], 3)
+        self.assertNotIn('output', state)
+        self.assertFalse([line for line in state['log'] if self.output_dir in line])
+        self.assertIn("📁 Файл: report.docx", state['log'])
+        
+        path, filename = self.server.get_document(state['id'])
+        self.assertEqual(filename, 'report.docx')
+        self.assertTrue(path.startswith(self.output_dir) and os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
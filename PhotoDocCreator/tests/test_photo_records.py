@@ -0,0 +1,58 @@
+"""Записи о фотографиях задания"""
+import os
+import unittest
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.captions import CaptionIndex
+from core.photo_records import FolderInfo, PhotoRecord, to_photo_records
+
+
+class PhotoRecordTest(unittest.TestCase):
+    
+    def test_path_and_local_number(self):
+        folder = FolderInfo(os.path.join('photos', 'day2'), start_number=11)
+        photo = PhotoRecord(folder, '003.jpg', 13, rotation=90)
+        
+        self.assertEqual(photo.path, os.path.join('photos', 'day2', '003.jpg'))
+        self.assertEqual(photo.local_number, 3)
+        self.assertEqual(photo.rotation, 90)
+        with self.assertRaises(AttributeError):
+            photo.caption = "без __slots__ запись принимала бы любые поля"
+    
+    def test_dicts_share_folder_info(self):
+        rules = [[1, 2, "обход"]]
+        records = to_photo_records([
+            {'path': os.path.join('a', '1.jpg'), 'global_number': 1, 'folder_rules': rules},
+            {'path': os.path.join('a', '2.jpg'), 'global_number': 2, 'folder_rules': rules, 'rotation': 180},
+            {'path': os.path.join('b', '1.jpg'), 'global_number': 3, 'folder_start_number': 3}
+        ])
+        
+        self.assertEqual([record.path for record in records],
+                         [os.path.join('a', '1.jpg'), os.path.join('a', '2.jpg'), os.path.join('b', '1.jpg')])
+        self.assertIs(records[0].folder, records[1].folder)
+        self.assertIsNot(records[0].folder, records[2].folder)
+        self.assertEqual(records[0].folder.caption_rules, ((1, 2, "обход"),))
+        self.assertEqual([record.rotation for record in records], [0, 180, 0])
+        self.assertEqual(records[2].local_number, 1)
+    
+    def test_records_pass_through(self):
+        record = PhotoRecord(FolderInfo('photos'), '1.jpg', 1)
+        self.assertIs(to_photo_records([record])[0], record)
+    
+    def test_folder_rules_use_local_number(self):
+        first = FolderInfo('a', 1, ((1, 1, "папка a"),))
+        second = FolderInfo('b', 3, ((1, 1, "папка b"),))
+        photos = [PhotoRecord(first, '1.jpg', 1), PhotoRecord(first, '2.jpg', 2),
+                  PhotoRecord(second, '1.jpg', 3), PhotoRecord(second, '2.jpg', 4)]
+        captions = CaptionIndex([(4, 4, "общее")])
+        
+        self.assertEqual([captions.get_caption_multi(photo) for photo in photos], [
+            "Фото № 1. папка a",
+            "Фото № 2",
+            "Фото № 3. папка b",
+            "Фото № 4. общее"
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
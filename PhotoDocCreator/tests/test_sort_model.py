@@ -0,0 +1,59 @@
+"""Порядок фотографий в окне сортировки"""
+import unittest
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.sort_model import SortModel
+
+
+def make_model(count):
+    return SortModel([{'path': f'{i}.jpg'} for i in range(count)])
+
+
+class SortModelTest(unittest.TestCase):
+    
+    def assertPositionsConsistent(self, model):
+        self.assertEqual(len(model.positions), len(model))
+        for position, item in enumerate(model):
+            self.assertEqual(model.position_of(item['path']), position)
+    
+    def test_move_forward_returns_changed_range(self):
+        model = make_model(6)
+        
+        self.assertEqual(model.move(1, 4), (1, 5))
+        self.assertEqual([item['path'] for item in model],
+                         ['0.jpg', '2.jpg', '3.jpg', '4.jpg', '1.jpg', '5.jpg'])
+        self.assertPositionsConsistent(model)
+    
+    def test_move_backward_returns_changed_range(self):
+        model = make_model(6)
+        
+        self.assertEqual(model.move(5, 2), (2, 6))
+        self.assertEqual([item['path'] for item in model],
+                         ['0.jpg', '1.jpg', '5.jpg', '2.jpg', '3.jpg', '4.jpg'])
+        self.assertPositionsConsistent(model)
+    
+    def test_positions_outside_range_are_unchanged(self):
+        model = make_model(10)
+        before = list(model)
+        
+        start, stop = model.move(6, 3)
+        for position in list(range(start)) + list(range(stop, len(model))):
+            self.assertIs(model[position], before[position])
+        self.assertPositionsConsistent(model)
+    
+    def test_move_in_place(self):
+        model = make_model(3)
+        
+        self.assertEqual(model.move(1, 1), (1, 2))
+        self.assertPositionsConsistent(model)
+    
+    def test_sort_recomputes_positions(self):
+        model = make_model(4)
+        model.sort(key=lambda item: -int(item['path'].split('.')[0]))
+        
+        self.assertEqual(model.position_of('3.jpg'), 0)
+        self.assertPositionsConsistent(model)
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -0,0 +1,152 @@
+"""Постоянный кэш миниатюр"""
+import io
+import os
+import struct
+import tempfile
+import unittest
+
+from PIL import Image
+
+from . import package_dir  # noqa: F401 - добавляет модули приложения в sys.path
+from core.thumbnail_cache import ThumbnailAtlas, make_thumbnail
+
+
+def make_exif_with_thumbnail(thumbnail):
+    """EXIF с миниатюрой JPEG в IFD1, как ее записывают камеры"""
+    buffer = io.BytesIO()
+    thumbnail.save(buffer, 'JPEG')
+    data = buffer.getvalue()
+    
+    # Заголовок TIFF, IFD0 с ориентацией и IFD1 со смещением и длиной миниатюры
+    ifd0 = struct.pack('<H', 1) + struct.pack('<HHII', 0x0112, 3, 1, 1) + struct.pack('<I', 26)
+    ifd1 = struct.pack('<H', 2) + struct.pack('<HHII', 0x0201, 4, 1, 56) + struct.pack('<HHII', 0x0202, 4, 1, len(data))
+    tiff = b'II*\x00' + struct.pack('<I', 8) + ifd0 + ifd1 + struct.pack('<I', 0) + data
+    return b'Exif\x00\x00' + tiff
+
+
+class ThumbnailAtlasTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+    
+    def make_photo(self, name, color):
+        path = os.path.join(self.temp_dir.name, name)
+        Image.new('RGB', (40, 30), color).save(path, 'PNG')
+        return path
+    
+    def open_atlas(self, slots=None):
+        limit_mb = slots * 120 * 90 * 3 / 1048576 if slots else 1
+        atlas = ThumbnailAtlas(self.cache_dir, limit_mb=limit_mb)
+        self.addCleanup(atlas.close)
+        return atlas
+    
+    def test_put_and_get(self):
+        atlas = self.open_atlas()
+        path = self.make_photo('red.png', (255, 0, 0))
+        
+        self.assertIsNone(atlas.get(path))
+        atlas.put(path, Image.new('RGB', (40, 30), (255, 0, 0)), ((400, 300), 'RGB', 'PNG'))
+        
+        thumbnail, info = atlas.get(path)
+        self.assertEqual(thumbnail.size, (40, 30))
+        self.assertEqual(thumbnail.getpixel((5, 5)), (255, 0, 0))
+        self.assertEqual(info, ((400, 300), 'RGB', 'PNG'))
+    
+    def test_changed_file_is_not_returned(self):
+        atlas = self.open_atlas()
+        path = self.make_photo('photo.png', (255, 0, 0))
+        atlas.put(path, Image.new('RGB', (40, 30), (255, 0, 0)), ((40, 30), 'RGB', 'PNG'))
+        
+        Image.new('RGB', (50, 30), (0, 0, 255)).save(path, 'PNG')
+        self.assertIsNone(atlas.get(path))
+    
+    def test_least_recently_used_is_evicted(self):
+        atlas = self.open_atlas(slots=2)
+        paths = [self.make_photo(f'{i}.png', (i, 0, 0)) for i in range(3)]
+        for path in paths[:2]:
+            atlas.put(path, Image.new('RGB', (40, 30), (0, 255, 0)), ((40, 30), 'RGB', 'PNG'))
+        
+        # Первое фото использовано недавно, вытесняется второе
+        self.assertIsNotNone(atlas.get(paths[0]))
+        atlas.put(paths[2], Image.new('RGB', (40, 30), (0, 0, 255)), ((40, 30), 'RGB', 'PNG'))
+        
+        self.assertEqual(atlas.slot_count, 2)
+        self.assertIsNotNone(atlas.get(paths[0]))
+        self.assertIsNone(atlas.get(paths[1]))
+        self.assertEqual(atlas.get(paths[2])[0].getpixel((0, 0)), (0, 0, 255))
+    
+    def test_reopened_atlas_keeps_thumbnails(self):
+        path = self.make_photo('photo.png', (10, 20, 30))
+        atlas = ThumbnailAtlas(self.cache_dir, limit_mb=1)
+        atlas.put(path, Image.new('RGB', (40, 30), (10, 20, 30)), ((40, 30), 'RGB', 'PNG'))
+        atlas.close()
+        
+        reopened = self.open_atlas()
+        thumbnail, info = reopened.get(path)
+        self.assertEqual(thumbnail.getpixel((0, 0)), (10, 20, 30))
+        self.assertEqual(info, ((40, 30), 'RGB', 'PNG'))
+    
+    def test_damaged_index_is_discarded(self):
+        atlas = self.open_atlas()
+        atlas.close()
+        with open(os.path.join(self.cache_dir, 'thumbnails.index.json'), 'w') as f:
+            f.write('{')
+        
+        self.assertEqual(len(self.open_atlas().entries), 0)
+
+
+class MakeThumbnailTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    def save_jpeg(self, thumbnail_size):
+        """JPEG 1200×900 красного цвета со встроенной синей миниатюрой"""
+        path = os.path.join(self.temp_dir.name, f'{thumbnail_size[0]}.jpg')
+        exif = make_exif_with_thumbnail(Image.new('RGB', thumbnail_size, (0, 0, 255)))
+        Image.new('RGB', (1200, 900), (255, 0, 0)).save(path, 'JPEG', exif=exif)
+        return path
+    
+    def assertFitted(self, thumbnail):
+        # После draft пропорции могут разойтись на пиксель из-за округления масштаба
+        self.assertEqual(thumbnail.height, 90)
+        self.assertAlmostEqual(thumbnail.width, 120, delta=1)
+    
+    def assertColor(self, image, expected):
+        for actual, value in zip(image.getpixel((image.width // 2, image.height // 2)), expected):
+            self.assertAlmostEqual(actual, value, delta=20)
+    
+    def test_uses_exif_thumbnail(self):
+        thumbnail, info = make_thumbnail(self.save_jpeg((160, 120)))
+        
+        self.assertEqual(info, ((1200, 900), 'RGB', 'JPEG'))
+        self.assertEqual(thumbnail.size, (120, 90))
+        self.assertColor(thumbnail, (0, 0, 255))
+    
+    def test_small_exif_thumbnail_is_ignored(self):
+        thumbnail, info = make_thumbnail(self.save_jpeg((80, 60)))
+        
+        self.assertFitted(thumbnail)
+        self.assertColor(thumbnail, (255, 0, 0))
+    
+    def test_other_aspect_exif_thumbnail_is_ignored(self):
+        thumbnail, info = make_thumbnail(self.save_jpeg((160, 160)))
+        
+        self.assertFitted(thumbnail)
+        self.assertColor(thumbnail, (255, 0, 0))
+    
+    def test_jpeg_without_exif_is_decoded_with_draft(self):
+        path = os.path.join(self.temp_dir.name, 'plain.jpg')
+        Image.new('RGB', (1200, 900), (0, 255, 0)).save(path, 'JPEG')
+        
+        thumbnail, info = make_thumbnail(path)
+        self.assertEqual(info, ((1200, 900), 'RGB', 'JPEG'))
+        self.assertFitted(thumbnail)
+        self.assertColor(thumbnail, (0, 255, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
\ No newline at end of file
@@ -1,7 +1,6 @@
 import json
 import os
 import logging
-from tkinter import messagebox
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +28,13 @@ class ConfigManager:
             "enable_footer": True,
             "multi_folder_mode": False,
             "multi_folder_sort_method": "name_asc",
-            "folder_sequence": []
+            "folder_sequence": [],
+            "preprocess_workers": 0,
+            "target_dpi": 0,
+            "media_memory_limit_mb": 256,
+            "writer_backend": "docx",
+            "incremental_build": False,
+            "run_report": True
         }
     
     def load_config(self):
@@ -50,6 +55,7 @@ class ConfigManager:
                 
         except Exception as e:
             logger.error(f"Ошибка загрузки конфигурации: {e}")
+            from tkinter import messagebox  # окно только при работе с интерфейсом
             messagebox.showerror("Ошибка", f"Не удалось загрузить настройки: {e}")
             return self.default_config.copy()
     
@@ -62,6 +68,7 @@ class ConfigManager:
             return True
         except Exception as e:
             logger.error(f"Ошибка сохранения конфигурации: {e}")
+            from tkinter import messagebox  # окно только при работе с интерфейсом
             messagebox.showerror("Ошибка", f"Не удалось сохранить настройки: {e}")
             return False
     